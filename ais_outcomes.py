@@ -3,19 +3,34 @@ import constants
 import numpy as np
 
 
+# Perez de la Ossa et al. Stroke 2014 data for p lvo given ais, a logistic
+# regression on RACE, along with the curves bounding it for the
+# probabilistic model. See random python scripts notebook for derivation
+LVO_COEFFICIENTS = {
+    'b0': -2.9297,
+    'b1': 0.5533,
+    'lower b0': -3.6526,
+    'lower b1': 0.4141,
+    'upper b0': -2.2067,
+    'upper b1': 0.6925
+}
+
+
 def p_lvo_logistic_helper(b0, b1, race):
     return (1.0 / (1.0 + np.exp(-b0 - b1 * race)))
 
 
-def p_lvo_given_ais(race, add_uncertanity):
-    # Perez de la Ossa et al. Stroke 2014 data for p lvo given ais
-    # See random python scripts notebook for derivation
-    p_lvo = p_lvo_logistic_helper(-2.9297, 0.5533, race)
+def p_lvo_given_ais(race, add_uncertanity, size=None, random_state=np.random):
+    # Pass size to draw an array of samples at once
+    p_lvo = p_lvo_logistic_helper(LVO_COEFFICIENTS['b0'],
+                                  LVO_COEFFICIENTS['b1'], race)
 
     if add_uncertanity is True:
-        lower = p_lvo_logistic_helper(-3.6526, 0.4141, race)
-        upper = p_lvo_logistic_helper(-2.2067, 0.6925, race)
-        p_lvo = np.random.uniform(lower, upper)
+        lower = p_lvo_logistic_helper(LVO_COEFFICIENTS['lower b0'],
+                                      LVO_COEFFICIENTS['lower b1'], race)
+        upper = p_lvo_logistic_helper(LVO_COEFFICIENTS['upper b0'],
+                                      LVO_COEFFICIENTS['upper b1'], race)
+        p_lvo = random_state.uniform(lower, upper, size)
 
     return p_lvo
 
@@ -50,15 +65,23 @@ def p_good_outcome_ais_no_lvo_got_tpa(time_onset_tpa, NIHSS):
     but there is no consistent evidence that it differs for patients
     with and without LVO
     '''
-    baseline_prob = 0.001 * NIHSS**2 - 0.0615 * NIHSS + 1
+    baseline_prob = p_good_outcome_no_tpa_no_lvo(NIHSS)
     if time_onset_tpa > constants.time_limit_tpa():
         return baseline_prob
     else:
-        odds_ratio = -0.0031 * time_onset_tpa + 2.068
-        baseline_prob_to_odds = baseline_prob / (1 - baseline_prob)
-        new_odds = baseline_prob_to_odds * odds_ratio
-        adjusted_prob = new_odds / (1 + new_odds)
-        return adjusted_prob
+        return tpa_adjusted_p_good(baseline_prob, time_onset_tpa)
+
+
+def p_good_outcome_no_tpa_no_lvo(NIHSS):
+    return 0.001 * NIHSS**2 - 0.0615 * NIHSS + 1
+
+
+def tpa_adjusted_p_good(baseline_prob, time_onset_tpa):
+    odds_ratio = -0.0031 * time_onset_tpa + 2.068
+    baseline_prob_to_odds = baseline_prob / (1 - baseline_prob)
+    new_odds = baseline_prob_to_odds * odds_ratio
+    adjusted_prob = new_odds / (1 + new_odds)
+    return adjusted_prob
 
 
 def p_reperfusion_endovascular():
@@ -71,34 +94,38 @@ def p_early_reperfusion_thrombolysis(time_to_groin):
 
 
 class IschemicModel(object):
-    def __init__(self, arguments, add_lvo_uncertainty):
+
+    def __init__(self, context):
+        '''
+        context is a model_context.ModelContext
+        '''
+        arguments = context.arguments
 
         self.sex = arguments['sex']
         self.age = arguments['age']
         self.RACE = arguments['RACE']
-        self.NIHSS = constants.race_to_nihss(self.RACE)
+        self.NIHSS = context.NIHSS
+        times = context.times
 
-        self.onset_needle_primary = (
-            arguments['time_since_symptoms'] + arguments['time_to_primary'] +
-            constants.Times.door_needle_primary)
+        self.onset_needle_primary = (arguments['time_since_symptoms'] +
+                                     arguments['time_to_primary'] +
+                                     times.door_needle_primary)
 
-        self.onset_needle_comprehensive = (
-            arguments['time_since_symptoms'] +
-            arguments['time_to_comprehensive'] +
-            constants.Times.door_needle_comprehensive)
+        self.onset_needle_comprehensive = (arguments['time_since_symptoms'] +
+                                           arguments['time_to_comprehensive'] +
+                                           times.door_needle_comprehensive)
 
         self.onset_evt_noship = (arguments['time_since_symptoms'] +
                                  arguments['time_to_comprehensive'] +
-                                 constants.Times.door_to_intra_arterial)
+                                 times.door_to_intra_arterial)
 
-        self.onset_evt_ship = (
-            arguments['time_since_symptoms'] + arguments['time_to_primary'] +
-            constants.Times.door_needle_primary + arguments['transfer_time'] +
-            constants.Times.transfer_to_intra_arterial)
+        self.onset_evt_ship = (arguments['time_since_symptoms'] +
+                               arguments['time_to_primary'] +
+                               times.door_needle_primary +
+                               arguments['transfer_time'] +
+                               times.transfer_to_intra_arterial)
 
-        self.p_lvo = p_lvo_given_ais(self.RACE, add_lvo_uncertainty)
-        # if add_lvo_uncertainty:
-        #   print(self.p_lvo) # dummy debug
+        self.p_lvo = context.p_lvo
 
         self.model_is_necessary = self.is_there_an_option()
         if self.model_is_necessary is False:
@@ -246,3 +273,113 @@ class IschemicModel(object):
                       onset_to_tpa, onset_to_evt)
             '''
         return p_good
+
+
+class IschemicModelBatch(object):
+    '''
+    Array version of IschemicModel. The arguments, times and p_lvo of the
+    context can hold scalars or arrays, all broadcast against each other.
+    Every attribute and outcome is an array with one entry per
+    patient/sample, and unlike IschemicModel Drip and Ship outcomes are
+    always computed; ship_is_feasible says where they are actually an
+    option.
+    '''
+
+    def __init__(self, context):
+        arguments = context.arguments
+        times = context.times
+
+        self.sex = np.asarray(arguments['sex'])
+        self.age = np.asarray(arguments['age'])
+        self.RACE = np.asarray(arguments['RACE'], dtype=float)
+        self.NIHSS = np.asarray(context.NIHSS, dtype=float)
+        self.p_lvo = np.asarray(context.p_lvo, dtype=float)
+
+        time_since_symptoms = np.asarray(arguments['time_since_symptoms'])
+        time_to_primary = np.asarray(arguments['time_to_primary'])
+        time_to_comprehensive = np.asarray(arguments['time_to_comprehensive'])
+        transfer_time = np.asarray(arguments['transfer_time'])
+
+        self.onset_needle_primary = (time_since_symptoms + time_to_primary +
+                                     times.door_needle_primary)
+
+        self.onset_needle_comprehensive = (time_since_symptoms +
+                                           time_to_comprehensive +
+                                           times.door_needle_comprehensive)
+
+        self.onset_evt_noship = (time_since_symptoms + time_to_comprehensive +
+                                 times.door_to_intra_arterial)
+
+        self.onset_evt_ship = (time_since_symptoms + time_to_primary +
+                               times.door_needle_primary + transfer_time +
+                               times.transfer_to_intra_arterial)
+
+        # Same rules as IschemicModel.is_there_an_option and
+        # IschemicModel.run_primary_then_ship
+        self.model_is_necessary = np.logical_not(
+            (self.onset_needle_primary > constants.time_limit_tpa())
+            & (self.onset_evt_noship > constants.time_limit_evt()))
+        self.cutoff_location = constants.no_tx_where_to_go(self.RACE)
+        self.ship_is_feasible = np.logical_not(
+            self.onset_evt_ship > constants.time_limit_evt())
+
+    def get_ais_outcomes(self, key):
+        outcomes = None
+        if key == "Primary":
+            outcomes = {
+                'p_good': self.get_p_good(self.onset_needle_primary),
+                'p_tpa': 1,
+                'p_evt': 0,
+                'p_transfer': 0
+            }
+        elif key == "Comprehensive":
+            outcomes = {
+                'p_good':
+                self.get_p_good(self.onset_needle_comprehensive,
+                                self.onset_evt_noship),
+                'p_tpa':
+                np.where(
+                    self.onset_needle_comprehensive
+                    < constants.time_limit_tpa(), 1, 0),
+                'p_evt':
+                self.p_lvo,
+                'p_transfer':
+                0
+            }
+        elif key == "Drip and Ship":
+            outcomes = {
+                'p_good':
+                self.get_p_good(self.onset_needle_primary,
+                                self.onset_evt_ship),
+                'p_tpa':
+                1,
+                'p_evt':
+                self.p_lvo,
+                'p_transfer':
+                1
+            }
+        return outcomes
+
+    def get_p_good(self, onset_to_tpa, onset_to_evt=None):
+        '''
+        See IschemicModel.get_p_good
+        '''
+        no_tpa = p_good_outcome_no_tpa_no_lvo(self.NIHSS)
+        baseline_p_good = np.where(onset_to_tpa > constants.time_limit_tpa(),
+                                   no_tpa,
+                                   tpa_adjusted_p_good(no_tpa, onset_to_tpa))
+
+        p_good = ((1 - self.p_lvo) * baseline_p_good)
+        p_reperfused = 0
+        p_not_reperfued = self.p_lvo
+        if onset_to_evt is not None:
+            p_reperfused = (self.p_lvo * p_reperfusion_endovascular())
+            p_not_reperfued = p_not_reperfued - p_reperfused
+        p_good = p_good + p_not_reperfued * baseline_p_good
+
+        if onset_to_evt is not None:
+            p_good_post_evt = p_good_outcome_post_evt_success(
+                onset_to_evt, self.NIHSS)
+            higher_p_good = np.maximum(p_good_post_evt, baseline_p_good)
+            p_good = p_good + p_reperfused * higher_p_good
+        return p_good
@@ -0,0 +1,319 @@
+'''
+Benchmarks of every stage of the model, from the life tables up to full
+runs of each simulation type, saved as JSON and compared against a stored
+baseline so slowdowns show up when the model changes.
+
+    python benchmark.py                    # run, save and compare
+    python benchmark.py --save-baseline    # make this run the baseline
+    python benchmark.py --quick            # smaller sizes
+
+The committed benchmarks/baseline.json is a --quick run from one machine,
+so timings elsewhere should be compared against a baseline saved there
+(python benchmark.py --quick --save-baseline) before changing the model.
+
+Microbenchmarks are reported in microseconds per call (best of several
+repeats, which is the least noisy), end to end runs in seconds along with
+the fitted scaling exponent across sizes (1 is linear).
+'''
+
+import argparse
+import copy
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import timeit
+import numpy as np
+import ais_outcomes as ais
+import cohort
+import constants
+import create_random_sets as random_sets
+import main
+import optimal_strategy
+from life_tables import LifeTables
+
+DEFAULT_BASELINE = os.path.join('benchmarks', 'baseline.json')
+DEFAULT_OUTPUT = os.path.join('output', 'benchmarks')
+# Slower than the baseline by more than this fraction is a regression
+TOLERANCE = 0.25
+
+SIZES = {
+    'full': {
+        'sets': [10, 100, 1000],
+        'evals': [100, 1000, 10000],
+        'unbatched evals': [10, 100]
+    },
+    'quick': {
+        'sets': [10, 100],
+        'evals': [100, 1000],
+        'unbatched evals': [10]
+    }
+}
+
+
+def time_call(function, repeat=5, minimum_time=0.2):
+    '''
+    Best time per call of function in microseconds
+    '''
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    number = max(1, int(number * minimum_time / 0.2))
+    return min(timer.repeat(repeat, number)) / number * 1e6
+
+
+def deterministic_context(arguments):
+    return main.get_context(arguments, False, False)
+
+
+def micro_benchmarks():
+    base_case = main.SETTINGS['Base Case Options']
+    context = deterministic_context(base_case)
+    ischemic_model = ais.IschemicModel(context)
+    outcomes = ischemic_model.get_ais_outcomes('Primary')
+    results = main.run_model(base_case, context=context)
+    strategies = main.STRATEGIES
+    random_set_options = dict(main.SETTINGS['Random Set Options'])
+    random_set_options['Number of Random Sets'] = 100
+    state = np.random.RandomState(0)
+
+    def quiet_random_sets():
+        # create_random_sets prints when it's done
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            random_sets.create_random_sets(random_set_options, state)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    benchmarks = {
+        'LifeTables.adjusted_mortality':
+        lambda: LifeTables.adjusted_mortality(constants.Sex.FEMALE, 65, 1.5),
+        'cohort.Population':
+        lambda: cohort.Population(outcomes, 'Primary', context),
+        'IschemicModel.get_p_good':
+        lambda: ischemic_model.get_p_good(ischemic_model.onset_needle_primary,
+                                          ischemic_model.onset_evt_noship),
+        'IschemicModel':
+        lambda: ais.IschemicModel(context),
+        'optimal_strategy.get_optimal':
+        lambda: optimal_strategy.get_optimal(results, strategies, context.
+                                             icer_threshold),
+        'create_random_sets (100 sets)':
+        quiet_random_sets,
+        'main.run_model':
+        lambda: main.run_model(base_case, context=context)
+    }
+    return {name: time_call(function) for name, function in benchmarks.items()}
+
+
+def write_scenarios(path, number, random_state):
+    '''
+    An input file of number random scenarios in the format of
+    input/scenarios.csv
+    '''
+    with open(path, 'w') as f:
+        f.write('sex,age,RACE,NIHSS,time symptom,time primary,'
+                'time comprehensive,transfer time\n')
+        for _ in range(number):
+            time_to_primary = random_state.uniform(10, 60)
+            f.write(','.join(
+                map(str, [
+                    random_state.choice(['male', 'female']),
+                    random_state.randint(30, 90),
+                    random_state.randint(0, 10), 'NA',
+                    random_state.uniform(10, 200), time_to_primary,
+                    random_state.uniform(time_to_primary, 120),
+                    random_state.uniform(10, 90)
+                ])) + '\n')
+
+
+def end_to_end(mode, sets, probabilistic=False, evals=None, batched=True):
+    '''
+    Seconds to run sets argument sets of the simulation type mode through
+    main.run_sets, output file included
+    '''
+    saved = copy.deepcopy(main.SETTINGS)
+    try:
+        prob_settings = main.SETTINGS['Probabilistic Model']
+        prob_settings['on'] = probabilistic
+        prob_settings['Batched'] = batched
+        if evals is not None:
+            prob_settings['evals per set'] = evals
+        with tempfile.TemporaryDirectory() as directory:
+            output_file = open(os.path.join(directory, 'output.csv'), 'w')
+            state = np.random.RandomState(0)
+            start = time.perf_counter()
+            if mode == 'Base Case':
+                arguments = [main.SETTINGS['Base Case Options']]
+            elif mode == 'Input File':
+                path = os.path.join(directory, 'scenarios.csv')
+                write_scenarios(path, sets, state)
+                start = time.perf_counter()
+                arguments = main.read_input_file(path)
+            else:
+                options = dict(main.SETTINGS['Random Set Options'])
+                options['Number of Random Sets'] = sets
+                stdout = sys.stdout
+                sys.stdout = open(os.devnull, 'w')
+                try:
+                    arguments = random_sets.create_random_sets(options, state)
+                finally:
+                    sys.stdout.close()
+                    sys.stdout = stdout
+            main.run_sets(arguments, output_file, 0, progress=False)
+            return time.perf_counter() - start
+    finally:
+        main.SETTINGS.clear()
+        main.SETTINGS.update(saved)
+
+
+def scaling_exponent(sizes, seconds):
+    '''
+    Slope of log(seconds) against log(size)
+    '''
+    if len(sizes) < 2:
+        return None
+    return float(np.polyfit(np.log(sizes), np.log(seconds), 1)[0])
+
+
+def best_of(run, size, repeat=3, long_run=1.0):
+    '''
+    Best of repeat runs, or just the one if it takes more than long_run
+    seconds since then the noise doesn't matter
+    '''
+    seconds = run(size)
+    if seconds > long_run:
+        return seconds
+    return min([seconds] + [run(size) for _ in range(repeat - 1)])
+
+
+def curve(name, sizes, run):
+    seconds = [best_of(run, size) for size in sizes]
+    return {
+        'name': name,
+        'sizes': sizes,
+        'seconds': seconds,
+        'scaling exponent': scaling_exponent(sizes, seconds)
+    }
+
+
+def end_to_end_benchmarks(sizes):
+    curves = [
+        curve('Base Case', [1], lambda size: end_to_end('Base Case', size)),
+        curve('Input File', sizes['sets'],
+              lambda size: end_to_end('Input File', size)),
+        curve('Random Sets', sizes['sets'],
+              lambda size: end_to_end('Random Sets', size)),
+        curve('PSA batched (evals, 1 set)', sizes['evals'],
+              lambda size: end_to_end('Base Case', 1, True, size)),
+        curve('PSA unbatched (evals, 1 set)', sizes['unbatched evals'],
+              lambda size: end_to_end('Base Case', 1, True, size, False)),
+        curve('PSA batched (sets, 100 evals)', sizes['sets'][:2],
+              lambda size: end_to_end('Random Sets', size, True, 100))
+    ]
+    return {entry.pop('name'): entry for entry in curves}
+
+
+def run_benchmarks(quick=False):
+    constants.Costs.inflate(2016)
+    start = time.perf_counter()
+    report = {
+        'created':
+        time.strftime('%Y-%m-%d %H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count()
+        },
+        'sizes':
+        'quick' if quick else 'full',
+        'micro (us per call)':
+        micro_benchmarks(),
+        'end to end (s)':
+        end_to_end_benchmarks(SIZES['quick' if quick else 'full'])
+    }
+    report['total seconds'] = time.perf_counter() - start
+    return report
+
+
+def compare(report, baseline, tolerance=TOLERANCE):
+    '''
+    Ratio of every timing in report to the same one in baseline (above 1
+    is slower), and the names of the ones that regressed by more than
+    tolerance
+    '''
+    ratios = {}
+    for name, value in report['micro (us per call)'].items():
+        if name in baseline['micro (us per call)']:
+            ratios[name] = value / baseline['micro (us per call)'][name]
+    for name, entry in report['end to end (s)'].items():
+        reference = baseline['end to end (s)'].get(name)
+        if reference is None:
+            continue
+        for size, seconds in zip(entry['sizes'], entry['seconds']):
+            if size in reference['sizes']:
+                index = reference['sizes'].index(size)
+                ratios[f'{name} @ {size}'] = (seconds /
+                                              reference['seconds'][index])
+    regressions = [
+        name for name, ratio in ratios.items() if ratio > 1 + tolerance
+    ]
+    return ratios, regressions
+
+
+def print_report(report, ratios=None):
+    ratios = ratios if ratios is not None else {}
+    print(f'{"benchmark":<48}{"time":>14}{"vs baseline":>14}')
+    for name, value in report['micro (us per call)'].items():
+        ratio = f'{ratios[name]:.2f}x' if name in ratios else ''
+        print(f'{name:<48}{value:>11.1f} us{ratio:>14}')
+    for name, entry in report['end to end (s)'].items():
+        for size, seconds in zip(entry['sizes'], entry['seconds']):
+            label = f'{name} @ {size}'
+            ratio = f'{ratios[label]:.2f}x' if label in ratios else ''
+            print(f'{label:<48}{seconds:>12.3f} s{ratio:>14}')
+        if entry['scaling exponent'] is not None:
+            print(f'{"  scaling exponent":<48}'
+                  f'{entry["scaling exponent"]:>14.2f}')
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument('--quick', action='store_true')
+    PARSER.add_argument('--baseline', default=DEFAULT_BASELINE)
+    PARSER.add_argument('--save-baseline',
+                        action='store_true',
+                        help='store this run as the new baseline')
+    PARSER.add_argument('--tolerance', type=float, default=TOLERANCE)
+    ARGS = PARSER.parse_args()
+
+    REPORT = run_benchmarks(ARGS.quick)
+    if not os.path.isdir(DEFAULT_OUTPUT):
+        os.makedirs(DEFAULT_OUTPUT)
+    OUTPUT = os.path.join(DEFAULT_OUTPUT,
+                          time.strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(OUTPUT, 'w') as f:
+        json.dump(REPORT, f, indent=2)
+
+    RATIOS, REGRESSIONS = {}, []
+    if ARGS.save_baseline:
+        if not os.path.isdir(os.path.dirname(ARGS.baseline)):
+            os.makedirs(os.path.dirname(ARGS.baseline))
+        with open(ARGS.baseline, 'w') as f:
+            json.dump(REPORT, f, indent=2)
+    elif os.path.isfile(ARGS.baseline):
+        with open(ARGS.baseline, 'r') as f:
+            RATIOS, REGRESSIONS = compare(REPORT, json.load(f), ARGS.tolerance)
+    print_report(REPORT, RATIOS)
+    print('Saved to', OUTPUT)
+    if REGRESSIONS:
+        print('Regressions (more than', f'{ARGS.tolerance:.0%}',
+              'slower than the baseline):')
+        for NAME in REGRESSIONS:
+            print('  ' + NAME)
+        sys.exit(1)
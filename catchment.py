@@ -0,0 +1,355 @@
+'''
+Catchment maps: where to send a given patient from every point of a
+region. The region is a grid of cells over a latitude/longitude bounding
+box, and each cell's travel times come from straight line distances to the
+nearest primary and comprehensive centers through a simple road model.
+Every cell is then run through the batched model at once.
+
+    python catchment.py --bbox 41.6,-88.0,42.2,-87.5 \\
+        --primary 41.85,-87.75 --primary 42.0,-87.85 \\
+        --comprehensive 41.79,-87.60 --age 70 --race 7
+
+writes the optimal strategy of every cell to output/catchment/optimal.npy
+(an index into main.STRATEGIES, north-west corner first) along with a PNG
+of it. Nearest centers are found with a KD-tree when scipy is installed
+and by brute force otherwise, which is fine for the handful of centers in
+a region.
+'''
+
+import argparse
+import json
+import os
+import struct
+import time
+import zlib
+import numpy as np
+import constants
+import main
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+DEFAULT_PATH = os.path.join('output', 'catchment')
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+# Image colours of each strategy, lighter where the RACE cutoff decided
+COLOURS = {
+    'Primary': (66, 133, 244),
+    'Comprehensive': (219, 68, 55),
+    'Drip and Ship': (15, 157, 88)
+}
+PRIMARY_MARKER = (255, 255, 255)
+COMPREHENSIVE_MARKER = (0, 0, 0)
+
+
+class RoadModel(object):
+    '''
+    Minutes by road for a straight line distance: the distance is
+    stretched by detour_factor (roads aren't straight) and driven at
+    speed_kmh, plus fixed_minutes (getting going, parking, etc.)
+    '''
+
+    def __init__(self, speed_kmh=60, detour_factor=1.3, fixed_minutes=0):
+        self.speed_kmh = speed_kmh
+        self.detour_factor = detour_factor
+        self.fixed_minutes = fixed_minutes
+
+    def minutes(self, distance_km):
+        return (self.fixed_minutes +
+                self.detour_factor * distance_km / self.speed_kmh * 60)
+
+
+def unit_vectors(latitude, longitude):
+    '''
+    Points on the unit sphere, where straight line (chord) distance orders
+    points the same way great circle distance does
+    '''
+    latitude = np.radians(latitude)
+    longitude = np.radians(longitude)
+    return np.stack([
+        np.cos(latitude) * np.cos(longitude),
+        np.cos(latitude) * np.sin(longitude),
+        np.sin(latitude)
+    ],
+                    axis=-1)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+class FacilityIndex(object):
+    '''
+    Nearest facility lookups for a list of constants.Coordinates
+    '''
+
+    def __init__(self, facilities):
+        if not facilities:
+            raise ValueError('need at least one facility')
+        self.facilities = facilities
+        self.points = unit_vectors(
+            np.array([facility.latitude for facility in facilities]),
+            np.array([facility.longitude for facility in facilities]))
+        self.tree = cKDTree(self.points) if cKDTree is not None else None
+
+    def nearest(self, points, chunk_size=65536):
+        '''
+        Index of, and great circle distance in km to, the nearest facility
+        for each of the (n, 3) unit vectors
+        '''
+        if self.tree is not None:
+            chord, index = self.tree.query(points)
+            return index, chord_to_km(chord)
+        index = np.empty(len(points), dtype=int)
+        chord = np.empty(len(points))
+        for start in range(0, len(points), chunk_size):
+            chunk = points[start:start + chunk_size]
+            # |a - b|^2 = 2 - 2 a.b on the unit sphere
+            squared = 2 - 2 * (chunk @ self.points.T)
+            nearest = np.argmin(squared, axis=1)
+            index[start:start + chunk_size] = nearest
+            chord[start:start + chunk_size] = np.sqrt(
+                np.maximum(squared[np.arange(len(chunk)), nearest], 0))
+        return index, chord_to_km(chord)
+
+
+class Grid(object):
+    '''
+    Cells of about cell_km on a side covering the bounding box (south,
+    west, north, east), in rows from north to south so that they map
+    straight onto an image
+    '''
+
+    def __init__(self, bbox, cell_km=1.0):
+        self.south, self.west, self.north, self.east = bbox
+        if self.south >= self.north or self.west >= self.east:
+            raise ValueError('bounding box must be south, west, north, east')
+        middle = np.radians((self.south + self.north) / 2)
+        self.rows = max(
+            1, int(round((self.north - self.south) * KM_PER_DEGREE / cell_km)))
+        self.columns = max(
+            1,
+            int(
+                round((self.east - self.west) * KM_PER_DEGREE *
+                      np.cos(middle) / cell_km)))
+        self.shape = (self.rows, self.columns)
+        self.size = self.rows * self.columns
+
+    def centres(self, start, stop):
+        '''
+        Latitude and longitude of the centres of flat cells start to stop
+        '''
+        row, column = np.divmod(np.arange(start, stop), self.columns)
+        latitude = self.north - (row + 0.5) * (self.north -
+                                               self.south) / self.rows
+        longitude = self.west + (column + 0.5) * (self.east -
+                                                  self.west) / self.columns
+        return latitude, longitude
+
+    def cell(self, latitude, longitude):
+        '''
+        (row, column) of the cell holding a point
+        '''
+        row = int(
+            (self.north - latitude) / (self.north - self.south) * self.rows)
+        column = int(
+            (longitude - self.west) / (self.east - self.west) * self.columns)
+        return (min(max(row, 0),
+                    self.rows - 1), min(max(column, 0), self.columns - 1))
+
+
+def travel_times(latitude, longitude, primaries, comprehensives, road_model,
+                 transfers):
+    '''
+    time_to_primary, time_to_comprehensive and transfer_time from each
+    point, going to the nearest center of each kind. transfers holds the
+    transfer time from every primary to its nearest comprehensive.
+    '''
+    points = unit_vectors(latitude, longitude)
+    primary, primary_km = primaries.nearest(points)
+    _, comprehensive_km = comprehensives.nearest(points)
+    return (road_model.minutes(primary_km),
+            road_model.minutes(comprehensive_km), transfers[primary])
+
+
+def build(patient,
+          primary_centers,
+          comprehensive_centers,
+          bbox,
+          cell_km=1.0,
+          road_model=None,
+          path=DEFAULT_PATH,
+          chunk_size=262144):
+    '''
+    Catchment map for the patient (sex, age, RACE and time_since_symptoms)
+    over the bounding box, with the default (non-random) times and LVO
+    probability and the first horizon in main.SETTINGS. Saves to the path
+    directory:
+
+        optimal.npy -> index into main.STRATEGIES of every cell
+        necessary.npy -> False where the RACE cutoff decided
+        times.npy -> time_to_primary, time_to_comprehensive and
+                     transfer_time of every cell (minutes)
+        catchment.png -> the map, with the centers marked
+        catchment.json -> what the map is of
+
+    and returns the optimal and necessary arrays.
+    '''
+    road_model = road_model if road_model is not None else RoadModel()
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    grid = Grid(bbox, cell_km)
+    primaries = FacilityIndex(primary_centers)
+    comprehensives = FacilityIndex(comprehensive_centers)
+    _, transfer_km = comprehensives.nearest(primaries.points)
+    transfers = road_model.minutes(transfer_km)
+
+    optimal = np.empty(grid.size, dtype=np.uint8)
+    necessary = np.empty(grid.size, dtype=bool)
+    times = np.empty((3, grid.size), dtype=np.float32)
+    for start in range(0, grid.size, chunk_size):
+        stop = min(start + chunk_size, grid.size)
+        cell_times = travel_times(*grid.centres(start, stop), primaries,
+                                  comprehensives, road_model, transfers)
+        arguments = dict(patient)
+        (arguments['time_to_primary'], arguments['time_to_comprehensive'],
+         arguments['transfer_time']) = cell_times
+        results = main.run_model_batch(
+            main.get_context(arguments, False, False))
+        locations = results['Optimal Location']
+        for i, strategy in enumerate(main.STRATEGIES):
+            optimal[start:stop][locations == strategy] = i
+        necessary[start:stop] = results['Model Is Necessary']
+        times[:, start:stop] = cell_times
+
+    optimal = optimal.reshape(grid.shape)
+    necessary = necessary.reshape(grid.shape)
+    np.save(os.path.join(path, 'optimal.npy'), optimal)
+    np.save(os.path.join(path, 'necessary.npy'), necessary)
+    np.save(os.path.join(path, 'times.npy'), times.reshape((3, ) + grid.shape))
+    write_png(
+        os.path.join(path, 'catchment.png'),
+        render(optimal, necessary, grid, primary_centers,
+               comprehensive_centers))
+
+    label, _ = main.get_horizons()[0]
+    description = {
+        'patient': {
+            name: float(value)
+            for name, value in patient.items()
+        },
+        'bbox': [grid.south, grid.west, grid.north, grid.east],
+        'shape':
+        list(grid.shape),
+        'strategies':
+        main.STRATEGIES,
+        'primary centers':
+        [[c.latitude, c.longitude] for c in primary_centers],
+        'comprehensive centers':
+        [[c.latitude, c.longitude] for c in comprehensive_centers],
+        'road model':
+        vars(road_model),
+        'horizon':
+        label,
+        'ICER Threshold':
+        main.SETTINGS['ICER Threshold']
+    }
+    with open(os.path.join(path, 'catchment.json'), 'w') as f:
+        json.dump(description, f, indent=2)
+    return optimal, necessary
+
+
+def render(optimal, necessary, grid, primary_centers, comprehensive_centers):
+    '''
+    (rows, columns, 3) image of a catchment map with the centers marked
+    '''
+    palette = np.array([COLOURS[strategy] for strategy in main.STRATEGIES],
+                       dtype=np.uint8)
+    image = palette[optimal]
+    # Fade cells decided by the RACE cutoff halfway to white
+    image[~necessary] = image[~necessary] // 2 + 128
+    radius = max(1, min(grid.shape) // 150)
+    for centers, colour in ((primary_centers, PRIMARY_MARKER),
+                            (comprehensive_centers, COMPREHENSIVE_MARKER)):
+        for center in centers:
+            row, column = grid.cell(center.latitude, center.longitude)
+            image[max(row - radius, 0):row + radius + 1,
+                  max(column - radius, 0):column + radius + 1] = colour
+    return image
+
+
+def write_png(path, image):
+    '''
+    Save an (rows, columns, 3) uint8 array as an RGB PNG
+    '''
+    rows, columns, _ = image.shape
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I',
+                            zlib.crc32(kind + data) & 0xffffffff))
+
+    # Every scanline starts with its filter type, 0 for none
+    scanlines = np.zeros((rows, columns * 3 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = image.reshape(rows, columns * 3)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(
+            chunk(b'IHDR', struct.pack('>IIBBBBB', columns, rows, 8, 2, 0, 0,
+                                       0)))
+        f.write(chunk(b'IDAT', zlib.compress(scanlines.tobytes(), 6)))
+        f.write(chunk(b'IEND', b''))
+
+
+def coordinates(text):
+    latitude, longitude = (float(value) for value in text.split(','))
+    return constants.Coordinates(latitude, longitude)
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument('--bbox',
+                        required=True,
+                        help='south,west,north,east in degrees')
+    PARSER.add_argument('--primary',
+                        type=coordinates,
+                        action='append',
+                        required=True,
+                        help='latitude,longitude of a primary center')
+    PARSER.add_argument('--comprehensive',
+                        type=coordinates,
+                        action='append',
+                        required=True,
+                        help='latitude,longitude of a comprehensive center')
+    PARSER.add_argument('--cell-km', type=float, default=1.0)
+    PARSER.add_argument('--sex', choices=['male', 'female'], default='female')
+    PARSER.add_argument('--age', type=int, default=65)
+    PARSER.add_argument('--race', type=float, default=7)
+    PARSER.add_argument('--symptoms',
+                        type=float,
+                        default=45,
+                        help='minutes since symptom onset')
+    PARSER.add_argument('--speed', type=float, default=60, help='km/h')
+    PARSER.add_argument('--detour', type=float, default=1.3)
+    PARSER.add_argument('--path', default=DEFAULT_PATH)
+    ARGS = PARSER.parse_args()
+    constants.Costs.inflate(2016)
+
+    PATIENT = {
+        'sex':
+        (constants.Sex.MALE if ARGS.sex == 'male' else constants.Sex.FEMALE),
+        'age': ARGS.age,
+        'RACE': ARGS.race,
+        'time_since_symptoms': ARGS.symptoms
+    }
+    START = time.time()
+    OPTIMAL, _ = build(PATIENT, ARGS.primary, ARGS.comprehensive,
+                       [float(value)
+                        for value in ARGS.bbox.split(',')], ARGS.cell_km,
+                       RoadModel(ARGS.speed, ARGS.detour), ARGS.path)
+    print(f'Mapped {OPTIMAL.size} cells in {time.time() - START:.2f} seconds.')
+    for I, STRATEGY in enumerate(main.STRATEGIES):
+        print(f'{STRATEGY}: {np.mean(OPTIMAL == I):.1%} of cells')
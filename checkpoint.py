@@ -0,0 +1,108 @@
+'''
+Checkpoints for long Random Sets and Input File runs, so a run that gets
+interrupted (e.g. on a preemptible node) can carry on where it left off
+with main.py --resume instead of starting again.
+
+Every set's random state comes from the seed and its index alone (see
+main.get_random_state), so all a checkpoint needs is the seed, how many
+sets have had their rows written and where in the output file those rows
+end. Sets that were part way through, or finished but not yet written,
+are simply run again from their own random state, which gives exactly the
+same rows and PSA accumulators as the first time. The settings of the run
+are kept too, so it can't be resumed under different ones.
+'''
+
+import os
+import pickle
+import time
+
+# Settings that don't change the output, so can differ when resuming
+IGNORED_SETTINGS = ['Instrumentation', 'Checkpoint', 'Streaming']
+
+
+def comparable_settings(settings):
+    return {
+        key: value
+        for key, value in settings.items() if key not in IGNORED_SETTINGS
+    }
+
+
+def save(path, state):
+    '''
+    Write state to path atomically; a checkpoint is either the old one or
+    the new one, never half of each
+    '''
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class Checkpoint(object):
+    '''
+    Progress of a run, written to path at most every every_seconds (see
+    due) by record
+    '''
+
+    def __init__(self,
+                 path,
+                 every_seconds,
+                 settings,
+                 seed,
+                 output_path,
+                 completed=0):
+        self.path = path
+        self.every_seconds = every_seconds
+        self.settings = comparable_settings(settings)
+        self.seed = seed
+        self.output_path = output_path
+        self.completed = completed
+        self.last = time.monotonic()
+
+    @staticmethod
+    def resume(path, every_seconds, settings):
+        '''
+        The Checkpoint saved at path, after making sure it was saved with
+        the same settings, along with the output file offset its rows end
+        at
+        '''
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'no checkpoint at {path} to resume from')
+        state = load(path)
+        if state['Settings'] != comparable_settings(settings):
+            raise ValueError(f'the checkpoint at {path} was saved with '
+                             'different settings, so the run can\'t be '
+                             'resumed with these')
+        return (Checkpoint(path, every_seconds, settings, state['Seed'],
+                           state['Output Path'],
+                           state['Completed']), state['Output Offset'])
+
+    def due(self):
+        return time.monotonic() - self.last >= self.every_seconds
+
+    def record(self, completed, offset):
+        '''
+        Save that the first completed sets are done, with their rows ending
+        at offset in the output file
+        '''
+        self.completed = completed
+        save(
+            self.path, {
+                'Settings': self.settings,
+                'Seed': self.seed,
+                'Output Path': self.output_path,
+                'Completed': completed,
+                'Output Offset': offset
+            })
+        self.last = time.monotonic()
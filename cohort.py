@@ -1,149 +1,584 @@
+import collections
 import math
+import threading
+import numpy as np
 import constants
 from life_tables import LifeTables
 
+# Cohorts are followed until this age (the last row of the life tables is
+# certain death)
+MAX_AGE = 100
+CONTINUOUS_DISCOUNT = 0.03
+# Multiplier of the first and last points in the Simpson's 1/3rd correction
+SIMPSONS_FIRST_WEIGHT = 1 / 3
+
 
 class Population(object):
     '''
     Hold a cohort and run the markov model simulation.
     '''
 
-    start_age = None
-    sex = None
-    NIHSS = None
-    horizon = None
-
-    def __init__(self, ais_outcomes, simtype):
+    def __init__(self, ais_outcomes, simtype, context):
         '''
         We get a dictionary containing (for ischemic stroke patients):
         'p_good', 'p_tpa', 'p_evt', 'p_transfer'
+        and the model_context.ModelContext of the patient
         '''
-
-        # Current edit: TODO -> sketch out patients that we need to divide
-        # out between the various states to capture costs
-        # -> tpa, evt, etc.
-        # does it make sense to do this here or does it make sense to do it
-        # in a separate section of the model??
         self.ais_outcomes = ais_outcomes
-        self.costs_per_year = []
+        self.first_year_costs = None
         self.simtype = simtype
+        self.start_age = context.arguments['age']
+        self.sex = context.arguments['sex']
+        self.NIHSS = context.NIHSS
+        self.horizon = context.horizon
         self.states_in_markov = self.break_into_states()
-        self.states = self.run_markov(self.states_in_markov,
-                                      Population.start_age, Population.sex)
-        self.qalys_per_year = get_qalys(self.states)
-        get_costs_per_year(self.costs_per_year, self.states)
-        self.qalys = simpsons_1_3rd_correction(self.qalys_per_year,
-                                               Population.horizon)
-        self.costs = simpsons_1_3rd_correction(self.costs_per_year,
-                                               Population.horizon)
+        qalys, costs = self.horizon_values([self.horizon])
+        self.qalys = qalys[0]
+        self.costs = costs[0]
+
+    def horizon_values(self, horizons):
+        '''
+        QALYs and costs of the cohort over each of the horizons (None for
+        lifetime), as two lists. The markov model reduces to the cached
+        value vectors for this cohort's age, sex and horizon, and every
+        horizon comes from the same trace.
+        '''
+        qaly_vectors, cost_vectors = VALUE_VECTORS.lookup(
+            [self.sex] * len(horizons), [self.start_age] * len(horizons),
+            horizon_years(horizons, len(horizons)))
+        qalys = [
+            float(np.dot(self.states_in_markov, vector))
+            for vector in qaly_vectors
+        ]
+        costs = [
+            float(self.first_year_costs * SIMPSONS_FIRST_WEIGHT +
+                  np.dot(self.states_in_markov, vector))
+            for vector in cost_vectors
+        ]
+        return qalys, costs
 
     def break_into_states(self):
+        states, self.first_year_costs = initial_states(self.ais_outcomes,
+                                                       self.NIHSS)
+        return states
 
-        call_population = 1
-        pop_mimic = call_population * constants.p_call_is_mimic()
-        pop_hemorrhagic = call_population * constants.p_call_is_hemorrhagic()
-        pop_ischemic = call_population - pop_mimic - pop_hemorrhagic
 
-        states = [0 for enum in range(constants.States.NUMBER_OF_STATES)]
-        # We assume that mimics are at gen pop (headache, migraine, etc.)
-        states[constants.States.GEN_POP] += pop_mimic
+def initial_states(ais_outcomes, NIHSS):
+    '''
+    Break the cohort up into the states at the start of the markov model
+    and return them along with the first year costs. The outcomes and NIHSS
+    can also be arrays, in which case every state and the costs are arrays
+    too.
+    '''
+    pop_mimic, pop_ischemic, states_ischemic, states_hemorrhagic = (
+        break_up_cohort(ais_outcomes, NIHSS))
 
-        # Get the mRS breakdown of patients with acute ischemic strokes and
-        # remember to adjust for population of ischemic patients when
-        # adding into state matrix
+    states = [0 for enum in range(constants.States.NUMBER_OF_STATES)]
+    # We assume that mimics are at gen pop (headache, migraine, etc.)
+    states[constants.States.GEN_POP] += pop_mimic
 
-        mrs_of_ais = constants.break_up_ais_patients(
-            self.ais_outcomes['p_good'], Population.NIHSS)
-        states_ischemic = [
-            pop_ischemic * mrs_of_ais[i]
-            for i in range(constants.States.NUMBER_OF_STATES)
-        ]
+    # Add on first year costs
+    baseline_year_one_costs = constants.first_year_costs(
+        states_hemorrhagic, states_ischemic)
+    baseline_year_one_costs += (constants.cost_ivt() * ais_outcomes['p_tpa'] *
+                                pop_ischemic)
+    baseline_year_one_costs += (constants.cost_evt() * ais_outcomes['p_evt'] *
+                                pop_ischemic)
+    baseline_year_one_costs += (constants.cost_transfer() *
+                                ais_outcomes['p_transfer'] * pop_ischemic)
 
-        # Now we need the mRS breakdown for patients with hemorrhagic strokes
-        # Currently making the conservative estimate that there is no
-        # difference in outcomes for ICH versus AIS patients, even though
-        # there is evidence to suggest to suggest ICH patients do almost
-        # about twice as well.
-        # This estimate also adjusts hemorrhagic stroke outcomes based on
-        # time to center.
-
-        states_hemorrhagic = [
-            pop_hemorrhagic * mrs_of_ais[i]
-            for i in range(constants.States.NUMBER_OF_STATES)
-        ]
+    states = [
+        states[i] + states_ischemic[i] + states_hemorrhagic[i]
+        for i in range(constants.States.NUMBER_OF_STATES)
+    ]
+
+    return states, baseline_year_one_costs
+
+
+def break_up_cohort(ais_outcomes, NIHSS):
+    '''
+    The mimic and ischemic populations of the cohort, along with the
+    ischemic and hemorrhagic populations in each state
+    '''
+    call_population = 1
+    pop_mimic = call_population * constants.p_call_is_mimic()
+    pop_hemorrhagic = call_population * constants.p_call_is_hemorrhagic()
+    pop_ischemic = call_population - pop_mimic - pop_hemorrhagic
+
+    # Get the mRS breakdown of patients with acute ischemic strokes and
+    # remember to adjust for population of ischemic patients when
+    # adding into state matrix
+
+    mrs_of_ais = constants.break_up_ais_patients(ais_outcomes['p_good'], NIHSS)
+    states_ischemic = [
+        pop_ischemic * mrs_of_ais[i]
+        for i in range(constants.States.NUMBER_OF_STATES)
+    ]
+
+    # Now we need the mRS breakdown for patients with hemorrhagic strokes
+    # Currently making the conservative estimate that there is no
+    # difference in outcomes for ICH versus AIS patients, even though
+    # there is evidence to suggest to suggest ICH patients do almost
+    # about twice as well.
+    # This estimate also adjusts hemorrhagic stroke outcomes based on
+    # time to center.
+
+    states_hemorrhagic = [
+        pop_hemorrhagic * mrs_of_ais[i]
+        for i in range(constants.States.NUMBER_OF_STATES)
+    ]
+    return pop_mimic, pop_ischemic, states_ischemic, states_hemorrhagic
+
+
+def cost_components(ais_outcomes, NIHSS, start_ages, sexes, horizons):
+    '''
+    The discounted cost of each of constants.COST_COMPONENTS for the cohort,
+    for each of the horizons, as a list of (N x components) arrays (N is 1
+    unless the outcomes etc. are arrays). They add up to the costs of
+    run_population_horizons, and since every component is its price times
+    an amount that doesn't depend on any price, re-pricing is just scaling
+    them (see reprice).
+    '''
+    _, pop_ischemic, states_ischemic, states_hemorrhagic = break_up_cohort(
+        ais_outcomes, NIHSS)
+    states, _ = initial_states(ais_outcomes, NIHSS)
+    death = constants.States.DEATH
+    states = np.stack(np.broadcast_arrays(*states),
+                      axis=-1).reshape(-1, constants.States.NUMBER_OF_STATES)
+    ischemic = np.stack(np.broadcast_arrays(*states_ischemic),
+                        axis=-1).reshape(states.shape)
+    hemorrhagic = np.stack(np.broadcast_arrays(*states_hemorrhagic),
+                           axis=-1).reshape(states.shape)
+    number_of_cohorts = len(states)
+    shape = (len(horizons), number_of_cohorts)
+    keys = np.stack([
+        np.broadcast_to(np.asarray(sexes, dtype=int), shape).ravel(),
+        np.broadcast_to(np.asarray(start_ages, dtype=int), shape).ravel(),
+        np.repeat(horizon_years(horizons, len(horizons)), number_of_cohorts)
+    ],
+                    axis=1)
+    unique_keys, inverse = unique_rows(keys)
+    alive, total = VALUE_VECTORS.survival(unique_keys[:, 0], unique_keys[:, 1],
+                                          unique_keys[:, 2])
+    alive = alive[inverse].reshape(shape + (death, ))
+    total = total[inverse].reshape(shape)
 
-        # Add on first year costs
-        baseline_year_one_costs = constants.first_year_costs(
-            states_hemorrhagic, states_ischemic)
-        baseline_year_one_costs += (
-            constants.cost_ivt() * self.ais_outcomes['p_tpa'] * pop_ischemic)
-        baseline_year_one_costs += (
-            constants.cost_evt() * self.ais_outcomes['p_evt'] * pop_ischemic)
-        baseline_year_one_costs += (
-            constants.cost_transfer() * self.ais_outcomes['p_transfer'] *
-            pop_ischemic)
-        self.costs_per_year.append(baseline_year_one_costs)
-
-        states = [
-            states[i] + states_ischemic[i] + states_hemorrhagic[i]
-            for i in range(constants.States.NUMBER_OF_STATES)
+    # Year one is the first point of the trace
+    first = SIMPSONS_FIRST_WEIGHT
+    treated = np.stack([
+        np.broadcast_to(
+            np.asarray(ais_outcomes[key], dtype=float) * pop_ischemic,
+            (number_of_cohorts, )) for key in ('p_tpa', 'p_evt', 'p_transfer')
+    ],
+                       axis=1)
+    prices = constants.cost_component_prices()
+    mrs = slice(constants.States.MRS_0, death)
+    components = []
+    for h in range(len(horizons)):
+        # Every year after the first is costed for the state the cohort
+        # started in, and deaths are costed every year as the original
+        # trace did
+        annual = (first * (360 - 90) / 360 *
+                  (ischemic[:, mrs] + hemorrhagic[:, mrs]) +
+                  states[:, mrs] * alive[h][:, mrs])
+        deaths = (first * (ischemic[:, death] + hemorrhagic[:, death]) +
+                  np.sum(states[:, :death] * (total[h][:, None] - alive[h]),
+                         axis=1) + states[:, death] * total[h])
+        amounts = [
+            first * 90 / 360 * ischemic[:, mrs],
+            first * 90 / 360 * hemorrhagic[:, mrs], annual, deaths[:, None],
+            first * treated
         ]
+        components.append(np.concatenate(amounts, axis=1) * prices)
+    return components
 
-        return states
 
-    def run_markov(self, states, start_age, sex):
+def reprice(components, old_prices, new_prices):
+    '''
+    Cost components (see cost_components) priced with old_prices, re-priced
+    with new_prices (both as from constants.Costs.get_prices or
+    constants.cost_component_prices)
+    '''
+    if isinstance(old_prices, dict):
+        old_prices = constants.cost_component_prices(old_prices)
+    if isinstance(new_prices, dict):
+        new_prices = constants.cost_component_prices(new_prices)
+    old_prices = np.asarray(old_prices, dtype=float)
+    new_prices = np.asarray(new_prices, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = np.where(old_prices == 0, 0, new_prices / old_prices)
+    return np.asarray(components) * ratios
+
+
+def run_markov_batch(states,
+                     first_year_costs,
+                     start_ages,
+                     sexes,
+                     horizons,
+                     discount=CONTINUOUS_DISCOUNT):
+    '''
+    Run the markov model for N cohorts at once and return two arrays of
+    length N with the discounted QALYs and costs of each cohort.
+
+    states is an (N x NUMBER_OF_STATES) array of the initial states,
+    first_year_costs holds the (undiscounted) year one costs of each cohort
+    and start_ages, sexes and horizons are either scalars or sequences of
+    length N. A horizon of None is a lifetime horizon.
+
+    There are no transitions between mRS states other than death, so the
+    QALYs and costs are linear in the initial states. We take advantage of
+    that by looking up one vector of per-state values for every distinct
+    (sex, age, horizon) in the batch instead of tracing every cohort.
+    '''
+    states = np.asarray(states, dtype=float)
+    number_of_cohorts = states.shape[0]
+    first_year_costs = np.broadcast_to(
+        np.asarray(first_year_costs, dtype=float), (number_of_cohorts, ))
+    keys = np.stack([
+        np.broadcast_to(np.asarray(sexes, dtype=int), (number_of_cohorts, )),
+        np.broadcast_to(np.asarray(start_ages, dtype=int),
+                        (number_of_cohorts, )),
+        horizon_years(horizons, number_of_cohorts)
+    ],
+                    axis=1)
+    unique_keys, inverse = unique_rows(keys)
+    qaly_vectors, cost_vectors = VALUE_VECTORS.lookup(unique_keys[:, 0],
+                                                      unique_keys[:, 1],
+                                                      unique_keys[:,
+                                                                  2], discount)
+    qalys = np.einsum('ij,ij->i', states, qaly_vectors[inverse])
+    # The first year costs are the first point of the trace, so they get the
+    # (undiscounted) first weight of the correction
+    costs = (first_year_costs * SIMPSONS_FIRST_WEIGHT +
+             np.einsum('ij,ij->i', states, cost_vectors[inverse]))
+    return qalys, costs
+
+
+def run_population_batch(ais_outcomes, NIHSS, start_ages, sexes, horizons):
+    '''
+    Array version of Population. The outcomes, NIHSS, ages, sexes and
+    horizons are broadcast against each other and the discounted QALYs and
+    costs are returned as two arrays.
+    '''
+    states, first_year_costs = initial_states(ais_outcomes, NIHSS)
+    states = np.stack(np.broadcast_arrays(*states), axis=-1)
+    states = states.reshape(-1, constants.States.NUMBER_OF_STATES)
+    return run_markov_batch(states, first_year_costs, start_ages, sexes,
+                            horizons)
+
+
+def run_population_horizons(ais_outcomes, NIHSS, start_ages, sexes, horizons):
+    '''
+    run_population_batch over each of the horizons (one per horizon, not
+    per cohort). Every horizon is looked up together so each cohort's
+    trace is only built once. Returns two (len(horizons) x N) arrays.
+    '''
+    states, first_year_costs = initial_states(ais_outcomes, NIHSS)
+    states = np.stack(np.broadcast_arrays(*states), axis=-1)
+    states = states.reshape(-1, constants.States.NUMBER_OF_STATES)
+    number_of_cohorts = states.shape[0]
+    start_ages = np.broadcast_to(start_ages, (number_of_cohorts, ))
+    sexes = np.broadcast_to(sexes, (number_of_cohorts, ))
+    first_year_costs = np.broadcast_to(first_year_costs, (number_of_cohorts, ))
+    qalys, costs = run_markov_batch(
+        np.tile(states, (len(horizons), 1)),
+        np.tile(first_year_costs, len(horizons)),
+        np.tile(start_ages, len(horizons)), np.tile(sexes, len(horizons)),
+        np.repeat(horizon_years(horizons, len(horizons)), number_of_cohorts))
+    return (qalys.reshape(len(horizons), number_of_cohorts),
+            costs.reshape(len(horizons), number_of_cohorts))
+
+
+def unique_rows(keys):
+    '''
+    np.unique(keys, axis=0, return_inverse=True) for an integer array of
+    keys, which is slow since it sorts whole rows. Each row is packed into
+    a single integer first, and a batch with only one key (the usual case
+    for a PSA batch or a map of one patient) isn't sorted at all.
+    '''
+    low = keys.min(axis=0)
+    span = keys.max(axis=0) - low + 1
+    if np.all(span == 1):
+        return keys[:1], np.zeros(len(keys), dtype=int)
+    if np.prod(span.astype(float)) >= 2**62:
+        unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+        return unique_keys, inverse.reshape(-1)
+    packed = np.ravel_multi_index(tuple((keys - low).T), tuple(span))
+    unique_packed, inverse = np.unique(packed, return_inverse=True)
+    unique_keys = np.stack(np.unravel_index(unique_packed, tuple(span)),
+                           axis=1) + low
+    return unique_keys, inverse.reshape(-1)
+
+
+def horizon_years(horizons, number_of_cohorts):
+    '''
+    Convert a horizon (or a sequence of them) into an integer array,
+    replacing lifetime horizons (None) with MAX_AGE since that always
+    covers the full trace.
+    '''
+    if isinstance(horizons, np.ndarray) and horizons.dtype.kind in 'iu':
+        return np.broadcast_to(horizons.astype(int), (number_of_cohorts, ))
+    if horizons is None or np.isscalar(horizons):
+        return np.full(number_of_cohorts,
+                       MAX_AGE if horizons is None else int(horizons),
+                       dtype=int)
+    return np.array([MAX_AGE if h is None else int(h) for h in horizons],
+                    dtype=int)
+
+
+class ValueVectorCache(object):
+    '''
+    LRU cache of the per-state value vectors keyed by
+    (sex, start age, horizon, discount rate).
+
+    Each entry keeps the survival weighted person-years behind its vectors,
+    which only depend on the mortality hazards. If the hazards change the
+    cache is emptied; if only the utilities or costs change the vectors are
+    rebuilt from the stored person-years without touching the life tables.
+    Lookups are safe to make from several threads.
+    '''
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hazards = None
+        self.prices = None
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def lookup(self,
+               sexes,
+               start_ages,
+               horizons,
+               discount=CONTINUOUS_DISCOUNT):
+        '''
+        Returns the QALY and cost value vectors for each of the keys, as two
+        (len(sexes) x NUMBER_OF_STATES) arrays.
+        '''
+        with self.lock:
+            keys, found = self._entries(sexes, start_ages, horizons, discount)
+            qaly_vectors = np.array([found[key][2] for key in keys])
+            cost_vectors = np.array([found[key][3] for key in keys])
+            return qaly_vectors, cost_vectors
+
+    def survival(self,
+                 sexes,
+                 start_ages,
+                 horizons,
+                 discount=CONTINUOUS_DISCOUNT):
+        '''
+        Returns the survival_sums behind the vectors of each of the keys,
+        from the cache
         '''
-        import a list of states at each year from start to age 100
+        with self.lock:
+            keys, found = self._entries(sexes, start_ages, horizons, discount)
+            alive = np.array([found[key][0] for key in keys])
+            total = np.array([found[key][1] for key in keys])
+            return alive, total
+
+    def _entries(self, sexes, start_ages, horizons, discount):
         '''
-        current_state = states
-        start_of_cycles = []
-        current_age = start_age
-        while current_age < 100:
-            start_of_cycles.append([i for i in current_state])
-            # We run a range up to death because we don't want to include death
-            # since it only markovs to itself
-            for mrs in range(constants.States.DEATH):
-                p_dead = LifeTables.adjusted_mortality(
-                    sex, current_age, constants.hazard_mort(mrs))
-                current_state[constants.States.DEATH] += current_state[
-                    mrs] * p_dead
-                current_state[mrs] -= current_state[mrs] * p_dead
-            current_age += 1
-        # Add on final age
-        start_of_cycles.append([i for i in current_state])
-        return start_of_cycles
+        The key of every (sex, start age, horizon) and the entry for each
+        distinct one, building the ones that are missing
+        '''
+        self.check_parameters()
+        start_ages = np.asarray(start_ages, dtype=int)
+        # Every horizon past the end of the trace is the lifetime horizon
+        horizons = np.minimum(horizons, MAX_AGE - start_ages)
+        keys = [(sex, age, horizon, discount) for sex, age, horizon in zip(
+            np.asarray(sexes, dtype=int).tolist(), start_ages.tolist(),
+            horizons.tolist())]
+
+        found = {}
+        missing = []
+        for key in keys:
+            if key in found:
+                continue
+            entry = self.entries.get(key)
+            if entry is None:
+                missing.append(key)
+                found[key] = None
+            else:
+                self.entries.move_to_end(key)
+                found[key] = entry
+        self.hits += len(found) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            sums = survival_sums(*np.array([key[:3] for key in missing]).T,
+                                 discount)
+            vectors = vectors_from_sums(*sums)
+            for i, key in enumerate(missing):
+                entry = [sums[0][i], sums[1][i], vectors[0][i], vectors[1][i]]
+                found[key] = entry
+                self.entries[key] = entry
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return keys, found
+
+    def check_parameters(self):
+        '''
+        Invalidate the cache if any of the model parameters behind the value
+        vectors have changed since they were built.
+        '''
+        hazards = LifeTables.hazards()
+        if hazards != self.hazards:
+            self.entries.clear()
+            self.hazards = hazards
+        prices = value_prices()
+        if prices != self.prices:
+            self.prices = prices
+            if self.entries:
+                entries = list(self.entries.values())
+                vectors = vectors_from_sums(
+                    np.array([entry[0] for entry in entries]),
+                    np.array([entry[1] for entry in entries]))
+                for i, entry in enumerate(entries):
+                    entry[2] = vectors[0][i]
+                    entry[3] = vectors[1][i]
+
+
+def value_prices():
+    '''
+    The utilities and costs that go into the value vectors
+    '''
+    living = range(constants.States.DEATH)
+    return (tuple(constants.utilities_mrs(mrs) for mrs in living),
+            tuple(constants.Costs.ANNUAL[mrs]
+                  for mrs in living), constants.Costs.DEATH)
+
+
+def survival_sums(sexes, start_ages, horizons, discount=CONTINUOUS_DISCOUNT):
+    '''
+    For each (sex, start age, horizon) returns the discounted and Simpson's
+    corrected person-years spent alive after the first cycle by somebody
+    starting in each living state (len(sexes) x DEATH), along with the total
+    weight of those cycles whether alive or dead (len(sexes)).
+
+    Only the last cycle's weight depends on the horizon, so each distinct
+    (sex, start age) is traced once and every horizon is read off the
+    cumulative sums of that trace.
+    '''
+    sexes = np.asarray(sexes, dtype=int)
+    start_ages = np.asarray(start_ages, dtype=int)
+    horizons = np.asarray(horizons, dtype=int)
+    cohorts, inverse = np.unique(np.stack([sexes, start_ages], axis=1),
+                                 axis=0,
+                                 return_inverse=True)
+    inverse = inverse.reshape(-1)
+    cohort_sexes = cohorts[:, 0]
+    cohort_ages = cohorts[:, 1]
+
+    cycles = np.arange(MAX_AGE - cohort_ages.min() + 1)
+    discounting = discount_factors(cycles, discount)
+
+    # Probability of surviving to the start of each cycle from every
+    # living state. Ages past the end of the trace are never used so we
+    # just clip them.
+    cycle_ages = np.minimum(cohort_ages[:, None] + cycles[None, :],
+                            MAX_AGE + 1)
+    cumulative = LifeTables.cumulative_survival_table()
+    survival = (cumulative[cohort_sexes[:, None], cycle_ages] /
+                cumulative[cohort_sexes, cohort_ages][:, None, :])
+
+    # Weighted sums of cycles 1 to t - 1 with the weights of the middle of
+    # a trace, i.e. everything before the last cycle of a trace ending at t
+    middle = np.where(cycles % 2 == 0, 2 / 3, 4 / 3) / discounting
+    middle[0] = 0
+    alive_before = np.zeros_like(survival)
+    alive_before[:, 1:] = np.cumsum(middle[None, :-1, None] * survival[:, :-1],
+                                    axis=1)
+    total_before = np.zeros(len(cycles))
+    total_before[1:] = np.cumsum(middle[:-1])
+
+    last_cycle = np.minimum(MAX_AGE - start_ages, horizons)
+    last_weight = np.where(last_cycle > 0,
+                           SIMPSONS_FIRST_WEIGHT / discounting[last_cycle], 0)
+    alive = (alive_before[inverse, last_cycle] +
+             last_weight[:, None] * survival[inverse, last_cycle])
+    total = total_before[last_cycle] + last_weight
+    return alive, total
+
+
+def vectors_from_sums(alive, total):
+    '''
+    Turn the output of survival_sums into the discounted QALYs and the
+    discounted costs after the first year accrued by a cohort that starts
+    entirely in each state. Both are (len(total) x NUMBER_OF_STATES).
+    '''
+    living = range(constants.States.DEATH)
+    utilities = np.array([constants.utilities_mrs(mrs) for mrs in living])
+    annual = np.array([constants.Costs.ANNUAL[mrs] for mrs in living])
+    total = np.asarray(total)[:, None]
+
+    qaly_vectors = np.zeros((len(total), constants.States.NUMBER_OF_STATES))
+    # Everybody is alive for the first cycle, which is never discounted
+    qaly_vectors[:, :constants.States.DEATH] = (
+        (SIMPSONS_FIRST_WEIGHT + alive) * utilities)
+    # We keep costing the deaths every year, as the original trace did
+    cost_vectors = np.empty_like(qaly_vectors)
+    cost_vectors[:, :constants.States.DEATH] = (
+        alive * annual + (total - alive) * constants.Costs.DEATH)
+    cost_vectors[:, constants.States.DEATH] = (total[:, 0] *
+                                               constants.Costs.DEATH)
+    return qaly_vectors, cost_vectors
+
+
+VALUE_VECTORS = ValueVectorCache()
+
+
+def discount_factors(cycles, discount=CONTINUOUS_DISCOUNT):
+    '''
+    What values at each of the cycles are divided by to discount them
+    '''
+    discreet_discount = math.exp(discount) - 1
+    return (1 + discreet_discount)**np.asarray(cycles)
 
 
 def get_costs_per_year(costs_per_year, states):
-    continuous_discount = 0.03
-    discreet_discount = math.exp(continuous_discount) - 1
-    for cycle, state in enumerate(states):
-        # We added on cycle 0, first year, costs during the markov model since
-        # it's dependent on hemorrhagic vs. ischemic
-        if cycle == 0:
-            continue
-        else:
-            costs = constants.annual_cost(state)
-            costs /= ((1 + discreet_discount)**(cycle))
-            costs_per_year.append(costs)
+    '''
+    Appends the discounted costs of every cycle of a trace of states (one
+    row of NUMBER_OF_STATES per cycle) to costs_per_year, except the first,
+    whose costs depend on hemorrhagic vs. ischemic and are added separately
+    '''
+    states = np.asarray(states, dtype=float)
+    annual = np.array(
+        [constants.Costs.ANNUAL[mrs]
+         for mrs in range(constants.States.DEATH)] + [constants.Costs.DEATH])
+    costs = states.dot(annual) / discount_factors(np.arange(len(states)))
+    costs_per_year.extend(costs[1:].tolist())
 
 
 def get_qalys(states):
     '''
     Returns an array of discounted quality-adjusted life-years at each year
+    of a trace of states (one row of NUMBER_OF_STATES per cycle)
     '''
-    continuous_discount = 0.03
-    discreet_discount = math.exp(continuous_discount) - 1
-    qalys = []
-    for cycle, state in enumerate(states):
-        qaly = 0
-        for mrs in range(constants.States.DEATH):
-            qaly += state[mrs] * constants.utilities_mrs(mrs)
-        # Discount
-        qaly /= ((1 + discreet_discount)**(cycle))
-        qalys.append(qaly)
+    states = np.asarray(states, dtype=float)
+    utilities = np.array([
+        constants.utilities_mrs(mrs) for mrs in range(constants.States.DEATH)
+    ])
+    return (states[:, :constants.States.DEATH].dot(utilities) /
+            discount_factors(np.arange(len(states))))
+
 
-    return qalys
+def simpsons_weights(cycles, last_cycle):
+    '''
+    Multipliers of the Simpson's 1/3rd correction at each of the cycles
+    for traces ending at each of last_cycle. Returns an array of shape
+    (len(last_cycle), len(cycles)), with zeros past the end of a trace.
+    '''
+    cycles = np.asarray(cycles)[None, :]
+    last_cycle = np.asarray(last_cycle)[:, None]
+    weights = np.where(cycles % 2 == 0, 2 / 3, 4 / 3)
+    weights = np.where((cycles == 0) | (cycles == last_cycle),
+                       SIMPSONS_FIRST_WEIGHT, weights)
+    return np.where(cycles > last_cycle, 0, weights)
 
 
 def simpsons_1_3rd_correction(yearly_value, years_horizon=None):
@@ -153,20 +588,8 @@ def simpsons_1_3rd_correction(yearly_value, years_horizon=None):
     can run for the correction for any number of years as long as it is
     specified.
     '''
-    multiplier = 1 / 3
-    sum_ = yearly_value[0] * multiplier
-    start_index = 1
     end_index = len(yearly_value) - 1
     if years_horizon is not None and years_horizon <= end_index:
         end_index = years_horizon
-    # Since for in range in [a, b)
-    for i in range(start_index, end_index + 1):
-        if i == end_index:
-            multiplier = 1 / 3
-        else:
-            if i % 2 == 0:
-                multiplier = 2 / 3
-            else:
-                multiplier = 4 / 3
-        sum_ += (yearly_value[i] * multiplier)
-    return sum_
+    weights = simpsons_weights(np.arange(len(yearly_value)), [end_index])[0]
+    return float(np.dot(weights, yearly_value))
@@ -4,6 +4,7 @@ analyses later.
 '''
 
 import enum
+import numpy as np
 import numpy.random as rng
 import inflation
 
@@ -38,15 +39,19 @@ class States(enum.IntEnum):
     NUMBER_OF_STATES = 8
 
 
+# Minutes from onset after which each treatment is no longer given
+TIME_LIMITS = {'tPA': 270, 'EVT': 360}
+
+
 def time_limit_tpa():
-    return 270
+    return TIME_LIMITS['tPA']
 
 
 def time_limit_evt():
-    return 360
+    return TIME_LIMITS['EVT']
 
 
-def door_to_needle_primary(base_case=False):
+def door_to_needle_primary(base_case=False, size=None, random_state=rng):
     '''
     Primary data from Gregg Fonarow, not yet published.
     Mean -> 69.17
@@ -59,11 +64,11 @@ def door_to_needle_primary(base_case=False):
     if base_case:
         time = 61.00
     else:
-        time = rng.uniform(47.00, 83.00)
+        time = random_state.uniform(47.00, 83.00, size)
     return time
 
 
-def door_to_needle_comprehensive(base_case=False):
+def door_to_needle_comprehensive(base_case=False, size=None, random_state=rng):
     '''
     Primary data from Gregg Fonarow, not yet published.
     Mean -> 58.92
@@ -76,11 +81,13 @@ def door_to_needle_comprehensive(base_case=False):
     if base_case:
         time = 52.00
     else:
-        time = rng.uniform(39.00, 70.00)
+        time = random_state.uniform(39.00, 70.00, size)
     return time
 
 
-def door_to_intra_arterial_comprehensive(base_case=False):
+def door_to_intra_arterial_comprehensive(base_case=False,
+                                         size=None,
+                                         random_state=rng):
     '''
     Primary data from Gregg Fonarow, not yet published.
     Mean -> 174.21
@@ -93,42 +100,51 @@ def door_to_intra_arterial_comprehensive(base_case=False):
     if base_case:
         time = 145.00
     else:
-        time = rng.uniform(83.00, 192.00)
+        time = random_state.uniform(83.00, 192.00, size)
     return time
 
 
-class Times(object):
+class TimeSamples(object):
     '''
-    Initial setup is with base-case times, but we include a function
-    to allow for 
+    Door times, held as scalars or as arrays with one entry per sample (for
+    the batched model).
     '''
-    door_needle_primary = door_to_needle_primary(True)
-    door_needle_comprehensive = door_to_needle_comprehensive(True)
-    door_to_intra_arterial = door_to_intra_arterial_comprehensive(True)
-    # Assumed right now to be the difference between door to IA
-    # and door to needle. This is likely an overestimate of the time
-    # to EVT.
-    transfer_to_intra_arterial = (door_to_intra_arterial - door_needle_primary)
 
-    @staticmethod
-    def get_random_set():
-        Times.door_needle_primary = door_to_needle_primary()
-        Times.door_needle_comprehensive = door_to_needle_comprehensive()
-        Times.door_to_intra_arterial = door_to_intra_arterial_comprehensive()
+    def __init__(self, door_needle_primary, door_needle_comprehensive,
+                 door_to_intra_arterial):
+        self.door_needle_primary = door_needle_primary
+        self.door_needle_comprehensive = door_needle_comprehensive
+        self.door_to_intra_arterial = door_to_intra_arterial
         # Assumed right now to be the difference between door to IA
         # and door to needle. This is likely an overestimate of the time
         # to EVT.
-        Times.transfer_to_intra_arterial = (
-            Times.door_to_intra_arterial - Times.door_needle_primary)
+        self.transfer_to_intra_arterial = (door_to_intra_arterial -
+                                           door_needle_primary)
+
+
+class Times(object):
+    '''
+    Base-case times, or random samples of them, as TimeSamples. These are
+    only ever handed to the model (see model_context), never stored here.
+    '''
+
+    @staticmethod
+    def get_random_samples(size=None, random_state=rng):
+        '''
+        Draw size samples of every time at once, or a single random set of
+        times when size is None
+        '''
+        return TimeSamples(
+            door_to_needle_primary(size=size, random_state=random_state),
+            door_to_needle_comprehensive(size=size, random_state=random_state),
+            door_to_intra_arterial_comprehensive(size=size,
+                                                 random_state=random_state))
 
     @staticmethod
-    def set_to_default():
-        Times.door_needle_primary = door_to_needle_primary(True)
-        Times.door_needle_comprehensive = door_to_needle_comprehensive(True)
-        Times.door_to_intra_arterial = door_to_intra_arterial_comprehensive(
-            True)
-        Times.transfer_to_intra_arterial = (
-            Times.door_to_intra_arterial - Times.door_needle_primary)
+    def get_default_samples():
+        return TimeSamples(door_to_needle_primary(True),
+                           door_to_needle_comprehensive(True),
+                           door_to_intra_arterial_comprehensive(True))
 
 
 def race_to_nihss(race):
@@ -136,7 +152,10 @@ def race_to_nihss(race):
     For now assuming that this is a constant; it was originally with the
     ischemic transitions, but at this point it makes more sense for it to
     just be a constant since it's used for hemorrhagic strokes as well
+    Also works elementwise on arrays.
     '''
+    if np.ndim(race) > 0:
+        return np.where(race == 0, 1, -0.39 + 2.39 * race)
     nihss = None
     # Perez de la Ossa et al. Stroke 2014, Schlemm analysis
     if race == 0:
@@ -153,8 +172,11 @@ def no_tx_where_to_go(race):
     that patients with a RACE >= 5 should be considered as with an LVO,
     and patients with a RACE < 5 are likely not canditates for invasive
     therapies.
+    Also works elementwise on arrays.
     '''
 
+    if np.ndim(race) > 0:
+        return np.where(race >= 5, "Comprehensive", "Primary")
     if race >= 5:
         return "Comprehensive"
     else:
@@ -196,13 +218,17 @@ def break_up_ais_patients(p_good_outcome, NIHSS):
     Probabilities of mRS 0 - 2: 0.205627706, 0.341991342, 0.452380952
     Probabilities of mRS 3 - 5: 0.35678392, 0.432160804, 0.211055276
 
+    Also works elementwise on arrays of outcomes and NIHSS.
     '''
     # Assume that probability of death is always constant
     # Stratified by NIHSS, ask Dr. Schwamm to get raw data for a continuous
     # approach
     genpop = 0
     mrs6 = None
-    if NIHSS < 7:
+    if np.ndim(NIHSS) > 0:
+        mrs6 = np.select([NIHSS < 7, NIHSS < 13, NIHSS < 21],
+                         [0.042, 0.139, 0.316], 0.535)
+    elif NIHSS < 7:
         mrs6 = 0.042
     elif NIHSS < 13:
         mrs6 = 0.139
@@ -312,22 +338,117 @@ class Costs(object):
     # 2010, Mohr
     TRANSFER = 763
 
+    # The year each of the prices above is in
+    BASE_YEARS = {
+        'DAYS_90_ISCHEMIC': 2014,
+        'DAYS_90_ICH': 2008,
+        'ANNUAL': 2014,
+        'DEATH': 2008,
+        'IVT': 2014,
+        'EVT': 2014,
+        'TRANSFER': 2010
+    }
+
     @staticmethod
     def inflate(TARGET_YEAR):
-        for state in Costs.DAYS_90_ISCHEMIC:
-            Costs.DAYS_90_ISCHEMIC[state] = (inflation.Conversion.run(
-                2014, TARGET_YEAR, Costs.DAYS_90_ISCHEMIC[state]))
-        for state in Costs.DAYS_90_ICH:
-            Costs.DAYS_90_ICH[state] = (inflation.Conversion.run(
-                2008, TARGET_YEAR, Costs.DAYS_90_ICH[state]))
-        for state in Costs.ANNUAL:
-            Costs.ANNUAL[state] = (inflation.Conversion.run(
-                2014, TARGET_YEAR, Costs.ANNUAL[state]))
-        Costs.DEATH = inflation.Conversion.run(2008, TARGET_YEAR, Costs.DEATH)
-        Costs.IVT = inflation.Conversion.run(2014, TARGET_YEAR, Costs.IVT)
-        Costs.EVT = inflation.Conversion.run(2014, TARGET_YEAR, Costs.EVT)
-        Costs.TRANSFER = inflation.Conversion.run(2010, TARGET_YEAR,
-                                                  Costs.TRANSFER)
+        Costs.set_prices(Costs.inflated(Costs.get_prices(), TARGET_YEAR))
+
+    @staticmethod
+    def inflated(prices, target_year):
+        '''
+        Copy of prices (see get_prices) converted from BASE_YEARS to
+        target_year, which has to be in the CPI table of
+        inflation.Conversion
+        '''
+        first, last = (inflation.Conversion.FIRST_YEAR,
+                       inflation.Conversion.LAST_YEAR)
+        if not first <= target_year <= last:
+            raise ValueError(f'can\'t inflate costs to {target_year}, the '
+                             f'CPI table only covers {first} to {last}')
+        converted = {}
+        for name, price in prices.items():
+            year = Costs.BASE_YEARS[name]
+            if isinstance(price, dict):
+                converted[name] = {
+                    state: inflation.Conversion.run(year, target_year, value)
+                    for state, value in price.items()
+                }
+            else:
+                converted[name] = inflation.Conversion.run(
+                    year, target_year, price)
+        return converted
+
+    @staticmethod
+    def get_prices():
+        '''
+        Copy of every current price, to hand to another process or to
+        restore later with set_prices
+        '''
+        return {
+            'DAYS_90_ISCHEMIC': dict(Costs.DAYS_90_ISCHEMIC),
+            'DAYS_90_ICH': dict(Costs.DAYS_90_ICH),
+            'ANNUAL': dict(Costs.ANNUAL),
+            'DEATH': Costs.DEATH,
+            'IVT': Costs.IVT,
+            'EVT': Costs.EVT,
+            'TRANSFER': Costs.TRANSFER
+        }
+
+    @staticmethod
+    def set_prices(prices):
+        Costs.DAYS_90_ISCHEMIC.update(prices['DAYS_90_ISCHEMIC'])
+        Costs.DAYS_90_ICH.update(prices['DAYS_90_ICH'])
+        Costs.ANNUAL.update(prices['ANNUAL'])
+        Costs.DEATH = prices['DEATH']
+        Costs.IVT = prices['IVT']
+        Costs.EVT = prices['EVT']
+        Costs.TRANSFER = prices['TRANSFER']
+
+
+# Prices as published, before any inflation
+BASE_PRICES = Costs.get_prices()
+
+# Every separately priced part of the costs, as (price, mRS state) or
+# (price, None) for the single prices; see cohort.cost_components. Gen pop
+# (mimics) aren't costed so aren't here.
+COST_COMPONENTS = []
+for _price in ['DAYS_90_ISCHEMIC', 'DAYS_90_ICH', 'ANNUAL']:
+    COST_COMPONENTS.extend(
+        (_price, state) for state in range(States.MRS_0, States.DEATH))
+COST_COMPONENTS.extend(
+    (_price, None) for _price in ['DEATH', 'IVT', 'EVT', 'TRANSFER'])
+
+COST_COMPONENT_LABELS = {
+    'DAYS_90_ISCHEMIC': '90 Day Ischemic',
+    'DAYS_90_ICH': '90 Day ICH',
+    'ANNUAL': 'Annual',
+    'DEATH': 'Death',
+    'IVT': 'IVT',
+    'EVT': 'EVT',
+    'TRANSFER': 'Transfer'
+}
+
+
+def cost_component_names():
+    return [
+        COST_COMPONENT_LABELS[price] if state is None else
+        f'{COST_COMPONENT_LABELS[price]} mRS {state - States.MRS_0}'
+        for price, state in COST_COMPONENTS
+    ]
+
+
+def cost_component_prices(prices=None):
+    '''
+    Price of each of COST_COMPONENTS, from prices (see Costs.get_prices)
+    or the current ones
+    '''
+    if prices is None:
+        prices = Costs.get_prices()
+    return np.array([
+        prices[price] if state is None else prices[price][state]
+        for price, state in COST_COMPONENTS
+    ],
+                    dtype=float)
 
 
 def cost_ivt():
@@ -362,4 +483,4 @@ def first_year_costs(states_hemorrhagic, states_ischemic):
 def annual_cost(states):
     cost = sum([states[i] * Costs.ANNUAL[i] for i in range(States.DEATH)])
     cost += states[States.DEATH] * Costs.DEATH
-    return cost
\ No newline at end of file
+    return cost
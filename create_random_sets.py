@@ -1,52 +1,93 @@
+import numpy as np
 import numpy.random as rng
+import sampling
 
+# Parameters that can be random, each one dimension when sampling them
+RANDOM_PARAMETERS = [
+    'sex', 'age', 'RACE', 'time_since_symptoms', 'time_to_primary',
+    'time_to_comprehensive', 'transfer_time'
+]
 
-def create_random_sets(random_set_options):
+# Most random sets drawn at once, which bounds memory however many sets
+# are asked for
+CHUNK_SIZE = 1 << 16
+
+
+def create_random_sets(random_set_options, random_state=rng):
     '''
     Retuns a list of parameter sets, in the form of tuples that you can unpack
-    and pass into the run_model function
-    '''
-    parameter_sets = []
-    while len(parameter_sets) < random_set_options['Number of Random Sets']:
-        # Note that randint is a <= x <= b
-        current_set = {}
-        if random_set_options['sex'] is None:
-            current_set['sex'] = rng.randint(0, 1)
-        else:
-            current_set['sex'] = random_set_options['sex']
-        if random_set_options['age'] is None:
-            current_set['age'] = rng.randint(30, 80)
-        else:
-            current_set['age'] = random_set_options['age']
-        if random_set_options['RACE'] is None:
-            current_set['RACE'] = rng.randint(0, 9)
-        else:
-            current_set['RACE'] = random_set_options['RACE']
-        if random_set_options['time_since_symptoms'] is None:
-            current_set['time_since_symptoms'] = rng.uniform(10, 100)
-        else:
-            current_set['time_since_symptoms'] = random_set_options[
-                'time_since_symptoms']
-        # have to set time to primary before time to comprehensive
-        if random_set_options['time_to_primary'] is None:
-            current_set['time_to_primary'] = rng.uniform(10, 60)
-        else:
-            current_set['time_to_primary'] = random_set_options[
-                'time_to_primary']
-        if random_set_options['time_to_comprehensive'] is None:
-            current_set['time_to_comprehensive'] = rng.uniform(
-                current_set['time_to_primary'], 120)
-        else:
-            current_set['time_to_comprehensive'] = random_set_options[
-                'time_to_comprehensive']
-        if random_set_options['transfer_time'] is None:
-            current_set['transfer_time'] = rng.uniform(
-                current_set['time_to_comprehensive'] -
-                current_set['time_to_primary'],
-                current_set['time_to_comprehensive'] +
-                current_set['time_to_primary'])
-        else:
-            current_set['transfer_time'] = random_set_options['transfer_time']
-        parameter_sets.append(current_set)
+    and pass into the run_model function. The random parameters are drawn
+    with random_set_options['Sampling'] (see sampling.METHODS), with one
+    quasi-random point per set for Sobol or Latin Hypercube.
+    '''
+    parameter_sets = list(random_sets(random_set_options, random_state))
     print('Random sets have been generated')
-    return parameter_sets
\ No newline at end of file
+    return parameter_sets
+
+
+def random_sets(random_set_options, random_state=rng, chunk_size=None):
+    '''
+    Generator over the same parameter sets as create_random_sets, drawn a
+    chunk at a time by random_set_chunks, so only one chunk is ever in
+    memory
+    '''
+    for chunk in random_set_chunks(random_set_options, random_state,
+                                   chunk_size):
+        columns = [chunk[name].tolist() for name in RANDOM_PARAMETERS]
+        for values in zip(*columns):
+            yield dict(zip(RANDOM_PARAMETERS, values))
+
+
+def random_set_chunks(random_set_options, random_state=rng, chunk_size=None):
+    '''
+    Yields the random parameter sets as dicts of arrays, one array per
+    parameter with up to chunk_size (CHUNK_SIZE by default) sets in each,
+    until there are 'Number of Random Sets' of them. Every parameter of a
+    chunk is drawn with a single call. Sobol and Latin Hypercube points
+    carry on from one chunk to the next, so they give the same sets
+    whatever the chunk size.
+    '''
+    number = random_set_options['Number of Random Sets']
+    chunk_size = chunk_size or CHUNK_SIZE
+    sampler = None
+    if random_set_options['Sampling'] != 'Monte Carlo':
+        sampler = sampling.create(random_set_options['Sampling'],
+                                  len(RANDOM_PARAMETERS), random_state, number)
+    for start in range(0, number, chunk_size):
+        size = min(chunk_size, number - start)
+        if sampler is not None:
+            random_state = sampler.points(size)
+        yield draw_random_sets(random_set_options, random_state, size)
+
+
+def draw_random_sets(random_set_options, random_state, size):
+    '''
+    size random parameter sets as a dict of arrays. Parameters given a value
+    in random_set_options are that value in every set.
+    '''
+    current_sets = {}
+
+    def draw(name, random_draw):
+        if random_set_options[name] is None:
+            current_sets[name] = random_draw()
+        else:
+            current_sets[name] = np.full(size, random_set_options[name])
+
+    # Note that randint is a <= x < b, so these are both sexes, ages 30 to
+    # 80 and every RACE score
+    draw('sex', lambda: random_state.randint(0, 2, size=size))
+    draw('age', lambda: random_state.randint(30, 81, size=size))
+    draw('RACE', lambda: random_state.randint(0, 10, size=size))
+    draw('time_since_symptoms',
+         lambda: random_state.uniform(10, 100, size=size))
+    # have to set time to primary before time to comprehensive
+    draw('time_to_primary', lambda: random_state.uniform(10, 60, size=size))
+    draw(
+        'time_to_comprehensive', lambda: random_state.uniform(
+            current_sets['time_to_primary'], 120, size=size))
+    primary = current_sets['time_to_primary']
+    comprehensive = current_sets['time_to_comprehensive']
+    draw(
+        'transfer_time', lambda: random_state.uniform(
+            comprehensive - primary, comprehensive + primary, size=size))
+    return current_sets
@@ -0,0 +1,172 @@
+'''
+Optional per-stage timings and counters for finding out where a run spends
+its time. Stages are timed with
+
+    with instrumentation.timed('stage name'):
+        ...
+
+and events counted with instrumentation.count('event'). Both are off
+unless enable() is called (see SETTINGS['Instrumentation'] in main.py), in
+which case timed() hands back a shared do-nothing context manager and
+count() returns straight away, so the calls can stay in the model.
+'''
+
+import json
+import threading
+import time
+
+ENABLED = False
+
+_lock = threading.Lock()
+# name -> [calls, seconds]
+_stages = {}
+# name -> count
+_counters = {}
+_started = time.perf_counter()
+
+
+class _Timer(object):
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            stage = _stages.get(self.name)
+            if stage is None:
+                stage = _stages[self.name] = [0, 0.0]
+            stage[0] += 1
+            stage[1] += elapsed
+
+
+class _NoTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_TIMER = _NoTimer()
+
+
+def timed(name):
+    '''
+    Context manager that adds the time spent inside it to the stage name
+    '''
+    if ENABLED:
+        return _Timer(name)
+    return _NO_TIMER
+
+
+def count(name, amount=1):
+    if ENABLED:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + amount
+
+
+def enable():
+    global ENABLED
+    reset()
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    global _started
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _started = time.perf_counter()
+
+
+def collect():
+    '''
+    Raw stage and counter totals since the last reset, and reset them.
+    Worker processes send these back to be merged into the parent's.
+    '''
+    with _lock:
+        collected = {
+            'stages': {
+                name: list(stage)
+                for name, stage in _stages.items()
+            },
+            'counters': dict(_counters)
+        }
+        _stages.clear()
+        _counters.clear()
+    return collected
+
+
+def merge(collected):
+    with _lock:
+        for name, (calls, seconds) in collected['stages'].items():
+            stage = _stages.setdefault(name, [0, 0.0])
+            stage[0] += calls
+            stage[1] += seconds
+        for name, amount in collected['counters'].items():
+            _counters[name] = _counters.get(name, 0) + amount
+
+
+def profile():
+    '''
+    Everything recorded since the last reset as a JSON friendly dict. Stages
+    can be nested (and run in several processes at once), so their shares
+    of the wall time don't have to add up to 100%.
+    '''
+    wall = time.perf_counter() - _started
+    with _lock:
+        stages = {
+            name: {
+                'calls': calls,
+                'seconds': seconds,
+                'mean microseconds': seconds / calls * 1e6 if calls else 0,
+                'percent of wall time': seconds / wall * 100
+            }
+            for name, (calls, seconds) in sorted(_stages.items(),
+                                                 key=lambda item: -item[1][1])
+        }
+        counters = dict(sorted(_counters.items()))
+    return {'wall seconds': wall, 'stages': stages, 'counters': counters}
+
+
+def summary_table(recorded=None):
+    '''
+    profile() as a table for printing
+    '''
+    recorded = recorded if recorded is not None else profile()
+    lines = [
+        f'{"stage":<36}{"calls":>10}{"seconds":>12}{"mean us":>12}'
+        f'{"% wall":>9}'
+    ]
+    for name, stage in recorded['stages'].items():
+        lines.append(f'{name:<36}{stage["calls"]:>10}'
+                     f'{stage["seconds"]:>12.3f}'
+                     f'{stage["mean microseconds"]:>12.1f}'
+                     f'{stage["percent of wall time"]:>9.1f}')
+    if recorded['counters']:
+        lines.append('')
+        lines.append(f'{"counter":<36}{"count":>10}')
+        for name, amount in recorded['counters'].items():
+            lines.append(f'{name:<36}{amount:>10}')
+    lines.append('')
+    lines.append(f'Wall time {recorded["wall seconds"]:.3f} seconds')
+    return '\n'.join(lines)
+
+
+def write_profile(path, recorded=None):
+    recorded = recorded if recorded is not None else profile()
+    with open(path, 'w') as f:
+        json.dump(recorded, f, indent=2)
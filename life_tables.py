@@ -2,6 +2,7 @@
 CDC 2013 life tables
 '''
 import math
+import numpy as np
 import constants
 
 class LifeTables(object):
@@ -50,13 +51,92 @@ class LifeTables(object):
         ]
     }
 
+    # Precomputed tables, along with the hazards they were built from
+    _hazards = None
+    _adjusted_table = None
+    _survival_table = None
+    # The adjusted table as nested lists, and the mRS of each hazard, for
+    # looking up single values in adjusted_mortality
+    _adjusted_lists = None
+    _hazard_states = None
+
     @staticmethod
     def adjusted_mortality(sex, age, adjustment):
         '''
-        Adjust by increased risk of mortality
+        Adjust by increased risk of mortality. When the adjustment is one of
+        the mortality hazards (it always is in the model) this is a lookup
+        in adjusted_mortality_table.
         '''
+        if LifeTables._hazards != constants.HAZARDS_MORTALITY:
+            LifeTables._update_table()
+        mrs = LifeTables._hazard_states.get(adjustment)
+        if mrs is not None:
+            return LifeTables._adjusted_lists[sex][age][mrs]
         prob_unadjusted = LifeTables.p_death[sex][age]
         rate_unadjusted = -1 * math.log(1 - prob_unadjusted)
         rate_adjusted = rate_unadjusted * adjustment
         prob_adjusted = 1 - math.exp(-rate_adjusted)
-        return prob_adjusted
\ No newline at end of file
+        return prob_adjusted
+
+    @staticmethod
+    def adjusted_mortality_table():
+        '''
+        Adjusted probability of dying between ages [x] and [x+1], indexed by
+        [sex, age, mRS] for every living state. Built once from
+        constants.HAZARDS_MORTALITY and rebuilt if the hazards change (in
+        sensitivity analyses, for example).
+        '''
+        LifeTables._update_table()
+        return LifeTables._adjusted_table
+
+    @staticmethod
+    def cumulative_survival_table():
+        '''
+        Probability of surviving from birth to age [x], indexed by
+        [sex, age, mRS] for ages 0 to 101, assuming the mRS adjusted
+        mortality applies at every age. Survival from age a to age b is then
+        table[sex, b, mrs] / table[sex, a, mrs]; see survival. Rebuilt along
+        with adjusted_mortality_table.
+        '''
+        LifeTables._update_table()
+        return LifeTables._survival_table
+
+    @staticmethod
+    def survival(sex, from_age, to_age, mrs):
+        '''
+        Probability that somebody in state mrs at from_age is still alive
+        at to_age. Arguments can be arrays.
+        '''
+        table = LifeTables.cumulative_survival_table()
+        return table[sex, to_age, mrs] / table[sex, from_age, mrs]
+
+    @staticmethod
+    def hazards():
+        '''
+        The mortality hazards of the living states, in order
+        '''
+        return tuple(
+            constants.hazard_mort(mrs)
+            for mrs in range(constants.States.DEATH))
+
+    @staticmethod
+    def _update_table():
+        if LifeTables._hazards == constants.HAZARDS_MORTALITY:
+            return
+        hazards = LifeTables.hazards()
+        p_death = np.array([LifeTables.p_death[sex] for sex in constants.Sex])
+        # Certain death at the end of the table gives an infinite rate
+        with np.errstate(divide='ignore'):
+            rate_unadjusted = -1 * np.log(1 - p_death)
+        adjusted = 1 - np.exp(-rate_unadjusted[:, :, None] * np.array(hazards))
+        survival = np.ones((adjusted.shape[0], adjusted.shape[1] + 1,
+                            adjusted.shape[2]))
+        survival[:, 1:] = np.cumprod(1 - adjusted, axis=1)
+        LifeTables._adjusted_table = adjusted
+        LifeTables._adjusted_lists = adjusted.tolist()
+        # The first state with each hazard, all of which have the same row
+        LifeTables._hazard_states = {}
+        for mrs, hazard in reversed(list(enumerate(hazards))):
+            LifeTables._hazard_states[hazard] = mrs
+        LifeTables._survival_table = survival
+        LifeTables._hazards = dict(constants.HAZARDS_MORTALITY)
@@ -1,12 +1,29 @@
-import sys
+import argparse
+import collections
+import concurrent.futures
+import functools
+import itertools
+import multiprocessing.util
 import os
+import statistics
+import sys
 import time
+import numpy as np
 import ais_outcomes as ais
+import checkpoint
 import cohort
 import constants
 import create_random_sets as random_sets
+import instrumentation
+import model_context
+import network as network_model
 import optimal_strategy
+import pipeline
+import psa
+import sample_store
+import sampling
 import tqdm
+import voi
 '''
 
 For default probabilistic model, turn on random times and
@@ -26,8 +43,44 @@ SETTINGS = {
         'Random LVO': True,
         'Compare Times vs. LVO': False,
         'evals per set': 1000,
-        'Results': [],
-        'current_set_counter': 0
+        # Draw every sample for a set up front and evaluate them all at
+        # once with the vectorized model. Much faster, but the samples come
+        # off the random state in a different order, so a seed gives
+        # different (equally valid) draws than the one at a time model.
+        'Batched': False,
+        # Most samples the batched model evaluates at once, which bounds
+        # memory when evals per set is large
+        'Batch Size': 10000,
+        # Add the mean and SD of each strategy's costs and QALYs to the
+        # output
+        'Report Moments': False,
+        # Instead of always running evals per set, keep sampling until the
+        # confidence interval on every strategy's percent optimal is
+        # narrower than CI Width (in percentage points), running at least
+        # Minimum Evals and at most evals per set. Adds an Evals Used
+        # column to the output.
+        'Adaptive': False,
+        'Minimum Evals': 50,
+        'CI Width': 5,
+        'Confidence Level': 0.95,
+        # How the random times and LVO probabilities are drawn, one of
+        # sampling.METHODS. Sobol and Latin Hypercube spread the samples
+        # more evenly so percent optimal converges in fewer evals.
+        'Sampling': 'Monte Carlo',
+        # Keep every sample to add the EVPI, and the EVPPI of each door
+        # time and the LVO probability (see voi.PARAMETERS), to the output,
+        # in net monetary benefit per patient
+        'Value of Information': False,
+        # Directory to keep every draw (sampled times and LVO probability,
+        # costs and QALYs of every strategy) in, to re-analyse later with
+        # sample_store.py instead of rerunning. None keeps nothing.
+        'Sample Store': None,
+        # A list of ICER thresholds, e.g. list(range(0, 200001, 10000)),
+        # to report the percent of evaluations each strategy is optimal at
+        # every one of them (acceptability curves) instead of only at the
+        # ICER Threshold. Each set and horizon gets a block of rows, one
+        # per threshold, with the threshold after the inputs.
+        'CEAC Thresholds': None
     },
     'Base Case Options': {
         'sex': constants.Sex.FEMALE,
@@ -48,14 +101,54 @@ SETTINGS = {
         'time_since_symptoms': None,
         'time_to_primary': None,
         'time_to_comprehensive': None,
-        'transfer_time': None
+        'transfer_time': None,
+        # How the random parameters are drawn, one of sampling.METHODS
+        'Sampling': 'Monte Carlo'
     },
     # Misc. options, especially for sensitivity analyses etc.
     'ICER Threshold': 100000,
+    # Carry the discounted cost of each separately priced part of every
+    # strategy's costs (see constants.COST_COMPONENTS) in the results, as
+    # extra output columns or in the sample store, so other prices (another
+    # CPI year, another EVT price) are a re-weighting of them with
+    # cohort.reprice instead of a rerun
+    'Cost Components': False,
+    # Path of a network of stroke centers (see network.py and
+    # input/network.json) to evaluate every argument set over instead of the
+    # one primary and comprehensive, with a Cost and QALYs column for each
+    # of its routes ('N/A' for the ones that were infeasible or pruned).
+    # The times to the centers come from the network, so the time_to_*
+    # and transfer_time inputs are ignored. Deterministic model only.
+    'Network': None,
     # Input either 'lifetime' or a string for the number of years
     # post-stroke to base the decision on.
     # Note, MUST BE STRING, i.e. '1' not 1
-    'Horizon': 'lifetime'
+    # A list of them, e.g. ['1', '5', '10', 'lifetime'], writes a row for
+    # each horizon from a single run of the model
+    'Horizon': 'lifetime',
+    # Every set gets its own random state derived from this seed, so results
+    # don't depend on how many worker processes are used. None picks (and
+    # prints) a new seed each run.
+    'Seed': None,
+    # Time each stage of the model and count early exits etc., printing a
+    # summary and writing output/profile.json at the end of the run
+    'Instrumentation': False,
+    'Streaming': {
+        # Input file scenarios are parsed this many at a time
+        'Input Chunk Size': 1024,
+        # Output rows are written to the file this many at a time
+        'Buffered Rows': 256,
+        # Write output on a separate thread so it overlaps the model
+        'Background Writer': True
+    },
+    # Save progress every so often so an interrupted run can be carried on
+    # with --resume and give the same output as if it never stopped, see
+    # checkpoint.py
+    'Checkpoint': {
+        'on': False,
+        'Every Seconds': 300,
+        'Path': os.path.join('output', 'checkpoint.pkl')
+    }
 }
 
 if not os.path.isdir('output'):
@@ -88,7 +181,6 @@ def random_out_name():
     return os.path.join(base, '-'.join(args) + '.csv')
 
 
-OUTPUT_FILE = None
 INPUT_VARIABLES = [
     'sex', 'age', 'RACE', 'time_since_symptoms', 'time_to_primary',
     'time_to_comprehensive', 'transfer_time'
@@ -115,243 +207,981 @@ PROBABILITY_MODEL_OUTPUT_COMPARISON = [
 STRATEGIES = ['Primary', 'Comprehensive', 'Drip and Ship']
 
 
-def read_input_file():
-    f = open('input/scenarios.csv', 'r')
-    # Parse header
-    f.readline()
-    strategies = []
-    for line in f:
-        strategy = {}
-        values = line.split(sep=',')
-        if values[0] == 'male':
-            strategy['sex'] = constants.Sex.MALE
-        else:
-            strategy['sex'] = constants.Sex.FEMALE
-        strategy['age'] = int(values[1])
-        if values[2] == 'NA':
-            strategy['RACE'] = constants.nihss_to_race(float(values[3]))
-        else:
-            strategy['RACE'] = float(values[2])
-        strategy['time_since_symptoms'] = float(values[4])
-        strategy['time_to_primary'] = float(values[5])
-        strategy['time_to_comprehensive'] = float(values[6])
-        strategy['transfer_time'] = float(values[7])
-        strategies.append(strategy)
+def read_input_file(path='input/scenarios.csv'):
+    '''
+    Generator over the argument sets in the input file, parsed a chunk at
+    a time so the whole file never has to be in memory
+    '''
+    return pipeline.read_scenarios(path,
+                                   SETTINGS['Streaming']['Input Chunk Size'])
 
-    return strategies
+
+def format_model_output(results, arguments, horizon):
+    '''
+    Returns the output file row for a single run of the model over the
+    horizon labelled horizon
+    '''
+    row = [arguments[item] for item in INPUT_VARIABLES]
+    row.append(results['Optimal Location'])
+    for strategy in STRATEGIES:
+        row.append(results['Costs'][strategy])
+        row.append(results['QALYs'][strategy])
+    row.append(results['Location with Maximum Benefit'])
+    if SETTINGS['Cost Components'] is True:
+        components = results['Cost Components']
+        number = len(constants.COST_COMPONENTS)
+        for strategy in STRATEGIES:
+            # Strategies that weren't run get their cost (0 or N/A) for
+            # every component
+            row.extend(
+                components.get(strategy,
+                               [results['Costs'][strategy]] * number))
+    row.append(horizon)
+    return ','.join(map(str, row)) + '\n'
 
 
-def print_model_output(results, arguments):
-    for item in INPUT_VARIABLES:
-        OUTPUT_FILE.write(str(arguments[item]) + ',')
-    OUTPUT_FILE.write(results['Optimal Location'] + ',')
+def format_model_batch_output(results, arguments, horizon):
+    '''
+    The output file rows, as format_model_output would write them, for
+    every row of a run_model_batch result whose context had arguments
+    (one entry per set) over the horizon labelled horizon
+    '''
+    necessary = np.asarray(results['Model Is Necessary'])
+    size = len(necessary)
+    columns = [
+        np.broadcast_to(arguments[item], (size, )).tolist()
+        for item in INPUT_VARIABLES
+    ]
+    columns.append(results['Optimal Location'].tolist())
     for strategy in STRATEGIES:
-        OUTPUT_FILE.write(str(results['Costs'][strategy]) + ',')
-        OUTPUT_FILE.write(str(results['QALYs'][strategy]) + ',')
-    OUTPUT_FILE.write(results['Location with Maximum Benefit'] + ',')
-    OUTPUT_FILE.write(SETTINGS['Horizon'] + '\n')
+        columns.append(
+            batch_output_cells(results['Costs'][strategy], necessary,
+                               strategy))
+        columns.append(
+            batch_output_cells(results['QALYs'][strategy], necessary,
+                               strategy))
+    columns.append(results['Location with Maximum Benefit'].tolist())
+    if SETTINGS['Cost Components'] is True:
+        for strategy in STRATEGIES:
+            components = results['Cost Components'][strategy]
+            columns.extend(
+                batch_output_cells(components[:, k], necessary, strategy)
+                for k in range(components.shape[1]))
+    columns.append([horizon] * size)
+    return [','.join(map(str, row)) + '\n' for row in zip(*columns)]
 
 
-def print_probabilistic_model_output(arguments):
+def format_network_output(results, arguments, horizon, network):
+    '''
+    Returns the output file row for a single run of the model over the
+    routes of network (see network.run_model_horizons)
+    '''
+    row = [arguments[item] for item in INPUT_VARIABLES]
+    row.append(results['Optimal Location'])
+    for strategy in network.strategies:
+        row.append(results['Costs'][strategy])
+        row.append(results['QALYs'][strategy])
+    row.append(results['Location with Maximum Benefit'])
+    row.append(horizon)
+    return ','.join(map(str, row)) + '\n'
 
-    comparison = SETTINGS['Probabilistic Model']['Compare Times vs. LVO']
 
-    # Standard printing of input variables
+def batch_output_cells(values, necessary, strategy):
+    '''
+    An output column of run_model_batch values for strategy, with what
+    run_model gives where it doesn't run the strategy: 0 (N/A for Drip and
+    Ship) where the RACE cutoff decided, and N/A where Drip and Ship wasn't
+    an option (NaN in the batch)
+    '''
+    skipped = 'N/A' if strategy == 'Drip and Ship' else 0
+    return [(value if value == value else 'N/A') if needed else skipped
+            for value, needed in zip(
+                np.asarray(values).tolist(), necessary.tolist())]
 
-    for item in INPUT_VARIABLES:
-        OUTPUT_FILE.write(str(arguments[item]) + ',')
 
-    # However, what's different is that now we care about something
-    # slightly different ...
+def format_probabilistic_model_output(arguments, accumulators, horizon):
+    '''
+    Returns the output file row for the psa.PSAAccumulators of an argument
+    set (three of them, for random times, LVO and both, when comparing)
+    over the horizon labelled horizon. With 'CEAC Thresholds' it's a block
+    of rows instead, one per threshold.
+    '''
+    extra = []
+    if SETTINGS['Probabilistic Model']['Report Moments'] is True:
+        for accumulator in accumulators:
+            extra.extend(accumulator.moments())
+    if SETTINGS['Probabilistic Model']['Value of Information'] is True:
+        for accumulator in accumulators:
+            extra.extend(accumulator.samples.values())
+    if SETTINGS['Probabilistic Model']['Adaptive'] is True:
+        extra.append(accumulators[0].evals)
+    extra.append(horizon)
 
-    percents = {}
+    thresholds = SETTINGS['Probabilistic Model']['CEAC Thresholds']
+    if thresholds is None:
+        row = [arguments[item] for item in INPUT_VARIABLES]
+        for accumulator in accumulators:
+            percents = accumulator.percents()
+            row.extend(percents[strategy] for strategy in STRATEGIES)
+        return ','.join(map(str, row + extra)) + '\n'
 
-    for strategy in STRATEGIES:
-        if comparison:
-            percents[strategy] = [0, 0, 0]
-        else:
-            percents[strategy] = 0
+    curves = [accumulator.threshold_percents() for accumulator in accumulators]
+    rows = []
+    for i, threshold in enumerate(thresholds):
+        row = [arguments[item] for item in INPUT_VARIABLES] + [threshold]
+        for curve in curves:
+            row.extend(curve[i])
+        rows.append(','.join(map(str, row + extra)) + '\n')
+    return ''.join(rows)
 
-    multiplier = 1 / SETTINGS['Probabilistic Model']['evals per set'] * 100
 
-    for result in SETTINGS['Probabilistic Model']['Results']:
-        if comparison:
-            percents[result[0]['Optimal Location']][0] += multiplier
-            percents[result[1]['Optimal Location']][1] += multiplier
-            percents[result[2]['Optimal Location']][2] += multiplier
-        else:
-            percents[result['Optimal Location']] += multiplier
+def get_horizons():
+    '''
+    SETTINGS['Horizon'] as a list of (label, years) pairs, with None years
+    for the lifetime horizon
+    '''
+    labels = SETTINGS['Horizon']
+    if isinstance(labels, str):
+        labels = [labels]
+    return [(label, None if label == 'lifetime' else int(label))
+            for label in labels]
 
-    if comparison:
-        for strategy in STRATEGIES:
-            OUTPUT_FILE.write(str(percents[strategy][0]) + ',')
-        for strategy in STRATEGIES:
-            OUTPUT_FILE.write(str(percents[strategy][1]) + ',')
-        for strategy in STRATEGIES:
-            OUTPUT_FILE.write(str(percents[strategy][2]) + ',')
-    else:
-        for strategy in STRATEGIES:
-            OUTPUT_FILE.write(str(percents[strategy]) + ',')
-    OUTPUT_FILE.write(SETTINGS['Horizon'] + '\n')
 
-    # Prepare the probabilstic model results for the next set
-    SETTINGS['Probabilistic Model']['Results'].clear()
-    SETTINGS['Probabilistic Model']['current_set_counter'] = 0
+def get_analyses():
+    '''
+    The (random times, random LVO) flags of each probabilistic analysis;
+    the ones in SETTINGS (None) or, when comparing, random times only,
+    random LVO only and then both
+    '''
+    if SETTINGS['Probabilistic Model']['Compare Times vs. LVO'] is True:
+        return [(True, False), (False, True), (True, True)]
+    return [(None, None)]
+
+
+def get_samplers(random_state=np.random):
+    '''
+    A sampler (see sampling.create) for each analysis (see get_analyses)
+    to draw the random times and LVO probabilities of an argument set from,
+    with 'Sampling' in SETTINGS
+    '''
+    prob_settings = SETTINGS['Probabilistic Model']
+    samplers = []
+    for random_times, random_lvo in get_analyses():
+        if random_times is None:
+            random_times = prob_settings['Random Times']
+        if random_lvo is None:
+            random_lvo = prob_settings['Random LVO']
+        # Three door times and the LVO probability
+        dimensions = 3 * (random_times is True) + (random_lvo is True)
+        samplers.append(
+            sampling.create(prob_settings['Sampling'], dimensions,
+                            random_state, prob_settings['evals per set']))
+    return samplers
 
 
-def run_model(arguments):
+def get_context(arguments,
+                random_times=None,
+                random_lvo=None,
+                size=None,
+                random_state=np.random,
+                network=None):
+    '''
+    Immutable context for evaluating arguments under the current SETTINGS.
+    Whether the times and LVO are random defaults to the probabilistic
+    model settings; pass size to draw that many samples of each for
+    run_model_batch. The horizon is the first one in SETTINGS. Pass a
+    network.Network to draw the door times of its centers instead.
+    '''
+    prob_settings = SETTINGS['Probabilistic Model']
+    if random_times is None:
+        random_times = prob_settings['Random Times']
+    if random_lvo is None:
+        random_lvo = prob_settings['Random LVO']
+    horizon = get_horizons()[0][1]
+    return model_context.ModelContext.create(arguments, horizon,
+                                             SETTINGS['ICER Threshold'],
+                                             random_times, random_lvo, size,
+                                             random_state, network)
+
+
+def run_model(arguments,
+              random_state=np.random,
+              context=None,
+              network=None,
+              prune=True):
     '''
     Probabilities of good outcomes are set to a dictionary containing:
     "Primary", "Comprehensive" and "Drip and Ship".
     Calculated for a patient with AIS, cohort stratification into mimics
     and hemorrhagic strokes take place later.
+    Everything the evaluation depends on is in its context, which by
+    default is drawn from SETTINGS with get_context.
+    With a network.Network every one of its routes is a strategy instead
+    (see network.run_model_horizons), with the dominated ones pruned unless
+    prune is False.
     '''
-    global SETTINGS
+    if context is None:
+        context = get_context(arguments,
+                              random_state=random_state,
+                              network=network)
+    if network is not None:
+        return network_model.run_model_horizons(context, network,
+                                                [context.horizon], prune)[0]
+    return run_model_horizons(context, [context.horizon])[0]
 
-    if SETTINGS['Probabilistic Model']['Random Times'] is True:
-        constants.Times.get_random_set()
-    else:
-        constants.Times.set_to_default()
-
-    ais_model = setup_model(arguments)
-
-    results = {
-        'Optimal Location': None,
-        'Location with Maximum Benefit': 'Based on cutoff',
-        'Costs': {
-            'Primary': 0,
-            'Comprehensive': 0,
-            'Drip and Ship': 'N/A'
-        },
-        'QALYs': {
-            'Primary': 0,
-            'Comprehensive': 0,
-            'Drip and Ship': 'N/A'
-        },
-    }
+
+def run_model_horizons(context, horizons):
+    '''
+    run_model over each of the horizons (years, None for lifetime) at once.
+    The outcomes and the markov trace are shared, so this costs about the
+    same as a single horizon. Returns a list of results, one per horizon.
+    '''
+    with instrumentation.timed('setup_model'):
+        ais_model = setup_model(context)
+
+    horizon_results = []
+    for _ in horizons:
+        horizon_results.append({
+            'Optimal Location': None,
+            'Location with Maximum Benefit': 'Based on cutoff',
+            'Costs': {
+                'Primary': 0,
+                'Comprehensive': 0,
+                'Drip and Ship': 'N/A'
+            },
+            'QALYs': {
+                'Primary': 0,
+                'Comprehensive': 0,
+                'Drip and Ship': 'N/A'
+            },
+            'Cost Components': {},
+        })
 
     # Early exit if the location is based only on RACE cutoff (because
     # no treatment options)
     if ais_model.model_is_necessary is not True:
-        results['Optimal Location'] = ais_model.cutoff_location
-        return results
+        instrumentation.count('model not necessary (RACE cutoff)')
+        for results in horizon_results:
+            results['Optimal Location'] = ais_model.cutoff_location
+        return horizon_results
 
     strategies = None
-    max_qaly = {'strategy': 'N/A', 'QALYs': 0}
     if ais_model.run_primary_then_ship() is False:
+        instrumentation.count('Drip and Ship infeasible')
         strategies = STRATEGIES[:-1]
     else:
         strategies = STRATEGIES
     for strategy in strategies:
-        ischemic_outcomes = ais_model.get_ais_outcomes(strategy)
-        markoved_population = cohort.Population(ischemic_outcomes, strategy)
-        results['Costs'][strategy] = markoved_population.costs
-        results['QALYs'][strategy] = markoved_population.qalys
-        if results['QALYs'][strategy] > max_qaly['QALYs']:
-            max_qaly['QALYs'] = results['QALYs'][strategy]
-            max_qaly['strategy'] = strategy
-
-    results['Location with Maximum Benefit'] = max_qaly['strategy']
-    optimal_strategy.get_optimal(results, strategies,
-                                 SETTINGS['ICER Threshold'])
-    return results
-
-
-def setup_model(arguments):
-    cohort.Population.start_age = arguments['age']
-    cohort.Population.sex = arguments['sex']
-    cohort.Population.NIHSS = constants.race_to_nihss(arguments['RACE'])
-    if SETTINGS['Horizon'] == 'lifetime':
-        cohort.Population.horizon = None
-    else:
-        cohort.Population.horizon = int(SETTINGS['Horizon'])
-    return ais.IschemicModel(arguments,
-                             SETTINGS['Probabilistic Model']['Random LVO'])
+        with instrumentation.timed('get_ais_outcomes'):
+            ischemic_outcomes = ais_model.get_ais_outcomes(strategy)
+        with instrumentation.timed('Population (markov model)'):
+            markoved_population = cohort.Population(ischemic_outcomes,
+                                                    strategy, context)
+            qalys, costs = markoved_population.horizon_values(horizons)
+        for i, results in enumerate(horizon_results):
+            results['Costs'][strategy] = costs[i]
+            results['QALYs'][strategy] = qalys[i]
+        if SETTINGS['Cost Components'] is True:
+            with instrumentation.timed('cost_components'):
+                components = cohort.cost_components(ischemic_outcomes,
+                                                    context.NIHSS,
+                                                    context.arguments['age'],
+                                                    context.arguments['sex'],
+                                                    horizons)
+            for i, results in enumerate(horizon_results):
+                results['Cost Components'][strategy] = components[i][0]
+
+    for results in horizon_results:
+        max_qaly = {'strategy': 'N/A', 'QALYs': 0}
+        for strategy in strategies:
+            if results['QALYs'][strategy] > max_qaly['QALYs']:
+                max_qaly['QALYs'] = results['QALYs'][strategy]
+                max_qaly['strategy'] = strategy
+        results['Location with Maximum Benefit'] = max_qaly['strategy']
+        with instrumentation.timed('get_optimal'):
+            optimal_strategy.get_optimal(results, strategies,
+                                         context.icer_threshold)
+    return horizon_results
+
+
+def run_model_batch(context):
+    '''
+    Vectorized run_model for a context whose arguments (one entry per
+    patient), times and p_lvo (one entry per sample) can hold arrays; see
+    get_context. Returns the same results as run_model, with an array for
+    every entry. Costs and QALYs are computed for every row and every
+    strategy, with NaN for Drip and Ship where it is not an option;
+    'Model Is Necessary' and 'Drip and Ship Feasible' hold the masks.
+    'ICERs' holds the ICER of each strategy on the frontier against the
+    one before it, NaN off the frontier.
+    '''
+    return run_model_batch_horizons(context, [context.horizon])[0]
+
+
+def run_model_batch_horizons(context, horizons):
+    '''
+    run_model_batch over each of the horizons at once, see
+    run_model_horizons. Returns a list of results, one per horizon.
+    '''
+    with instrumentation.timed('setup_model (batched)'):
+        ais_model = ais.IschemicModelBatch(context)
+    size = np.broadcast(ais_model.onset_evt_ship,
+                        ais_model.onset_needle_comprehensive, ais_model.p_lvo,
+                        ais_model.NIHSS, ais_model.age, ais_model.sex).size
+    NIHSS = np.broadcast_to(ais_model.NIHSS, (size, ))
+
+    model_is_necessary = np.broadcast_to(ais_model.model_is_necessary,
+                                         (size, ))
+    available = {
+        'Primary': np.ones(size, dtype=bool),
+        'Comprehensive': np.ones(size, dtype=bool),
+        'Drip and Ship': np.broadcast_to(ais_model.ship_is_feasible, (size, ))
+    }
+    if instrumentation.ENABLED:
+        instrumentation.count('batched samples', size)
+        instrumentation.count('model not necessary (RACE cutoff)',
+                              int(np.count_nonzero(~model_is_necessary)))
+        instrumentation.count(
+            'Drip and Ship infeasible',
+            int(
+                np.count_nonzero(model_is_necessary
+                                 & ~available['Drip and Ship'])))
+    horizon_results = []
+    for _ in horizons:
+        horizon_results.append({
+            'Optimal Location':
+            None,
+            'Location with Maximum Benefit':
+            None,
+            'Costs': {},
+            'QALYs': {},
+            'Cost Components': {},
+            'Model Is Necessary':
+            model_is_necessary,
+            'Drip and Ship Feasible':
+            available['Drip and Ship']
+        })
+    for strategy in STRATEGIES:
+        with instrumentation.timed('get_ais_outcomes (batched)'):
+            ischemic_outcomes = ais_model.get_ais_outcomes(strategy)
+        with instrumentation.timed('Population (markov model, batched)'):
+            qalys, costs = cohort.run_population_horizons(
+                ischemic_outcomes, NIHSS, ais_model.age, ais_model.sex,
+                horizons)
+        for i, results in enumerate(horizon_results):
+            results['Costs'][strategy] = np.where(available[strategy],
+                                                  costs[i], np.nan)
+            results['QALYs'][strategy] = np.where(available[strategy],
+                                                  qalys[i], np.nan)
+        if SETTINGS['Cost Components'] is True:
+            with instrumentation.timed('cost_components (batched)'):
+                components = cohort.cost_components(ischemic_outcomes, NIHSS,
+                                                    ais_model.age,
+                                                    ais_model.sex, horizons)
+            for i, results in enumerate(horizon_results):
+                results['Cost Components'][strategy] = np.where(
+                    available[strategy][:, None], components[i], np.nan)
+
+    labels = np.array(STRATEGIES, dtype=object)
+    mask = np.stack([available[s] for s in STRATEGIES], axis=1)
+    cutoff_location = np.broadcast_to(ais_model.cutoff_location, (size, ))
+    for results in horizon_results:
+        costs = np.stack([results['Costs'][s] for s in STRATEGIES], axis=1)
+        qalys = np.stack([results['QALYs'][s] for s in STRATEGIES], axis=1)
+        with instrumentation.timed('get_optimal (batched)'):
+            optimal_index, icers = optimal_strategy.get_optimal_batch(
+                costs, qalys, context.icer_threshold, mask)
+        optimal = labels[optimal_index]
+        max_benefit = labels[np.argmax(np.where(mask, qalys, -np.inf), axis=1)]
+
+        optimal[~model_is_necessary] = cutoff_location[~model_is_necessary]
+        max_benefit[~model_is_necessary] = 'Based on cutoff'
+        icers[~model_is_necessary] = np.nan
+
+        results['Optimal Location'] = optimal
+        results['Location with Maximum Benefit'] = max_benefit
+        results['ICERs'] = {s: icers[:, i] for i, s in enumerate(STRATEGIES)}
+    return horizon_results
+
+
+def setup_model(context):
+    return ais.IschemicModel(context)
+
+
+@functools.lru_cache(maxsize=None)
+def load_network(path):
+    '''
+    The network.Network at path, only read once per process
+    '''
+    return network_model.Network.load(path)
 
 
 def setup_output_file(output_file):
-    for item in INPUT_VARIABLES:
-        output_file.write(item + ',')
     if SETTINGS['Probabilistic Model']['on'] is True:
         if SETTINGS['Probabilistic Model']['Compare Times vs. LVO']:
             output_variables = PROBABILITY_MODEL_OUTPUT_COMPARISON
         else:
             output_variables = PROBABILITY_MODEL_OUTPUT
+    elif SETTINGS['Network'] is not None:
+        output_variables = ['Optimal Location']
+        for strategy in load_network(SETTINGS['Network']).strategies:
+            output_variables.extend([f'{strategy} Cost', f'{strategy} QALYs'])
+        output_variables.extend(OUTPUT_VARIABLES[-2:])
     else:
         output_variables = OUTPUT_VARIABLES
-    for item in output_variables[:-1]:
-        output_file.write(item + ',')
-    output_file.write(output_variables[-1] + '\n')
+        if SETTINGS['Cost Components'] is True:
+            output_variables = output_variables[:-1] + [
+                f'{strategy} {name} Cost' for strategy in STRATEGIES
+                for name in constants.cost_component_names()
+            ] + output_variables[-1:]
+    if (SETTINGS['Probabilistic Model']['on'] is True
+            and SETTINGS['Probabilistic Model']['Report Moments'] is True):
+        if SETTINGS['Probabilistic Model']['Compare Times vs. LVO']:
+            prefixes = ['Random Times ', 'Random LVO ', 'Random Both ']
+        else:
+            prefixes = ['']
+        moments = []
+        for prefix in prefixes:
+            moments.extend(psa.PSAAccumulator.moment_names(STRATEGIES, prefix))
+        output_variables = (output_variables[:-1] + moments +
+                            output_variables[-1:])
+    if (SETTINGS['Probabilistic Model']['on'] is True and
+            SETTINGS['Probabilistic Model']['Value of Information'] is True):
+        if SETTINGS['Probabilistic Model']['Compare Times vs. LVO']:
+            prefixes = ['Random Times ', 'Random LVO ', 'Random Both ']
+        else:
+            prefixes = ['']
+        values = []
+        for prefix in prefixes:
+            values.extend(voi.PSASamples.value_names(prefix))
+        output_variables = (output_variables[:-1] + values +
+                            output_variables[-1:])
+    if (SETTINGS['Probabilistic Model']['on'] is True
+            and SETTINGS['Probabilistic Model']['Adaptive'] is True):
+        output_variables = (output_variables[:-1] + ['Evals Used'] +
+                            output_variables[-1:])
+    if (SETTINGS['Probabilistic Model']['on'] is True and
+            SETTINGS['Probabilistic Model']['CEAC Thresholds'] is not None):
+        output_variables = ['ICER Threshold'] + output_variables
+    output_file.write(','.join(INPUT_VARIABLES + output_variables) + '\n')
 
 
-def run_probabilistic_set(argument_set):
+def run_probabilistic_set(argument_set,
+                          horizons,
+                          random_state=np.random,
+                          samplers=None):
+    '''
+    One probabilistic evaluation of the argument set for every analysis
+    (see get_analyses), drawing from samplers (see get_samplers) if given.
+    Returns, for each analysis, the list of results over the horizons.
+    '''
+    if samplers is None:
+        samplers = get_samplers(random_state)
+    return [
+        run_model_horizons(context, horizons)
+        for context in get_probabilistic_contexts(argument_set, samplers)
+    ]
+
+
+def get_probabilistic_contexts(argument_set, samplers, size=None):
+    '''
+    A context for every analysis (see get_analyses), with the random times
+    and LVO probabilities drawn from its sampler (size samples of each
+    when size is given)
+    '''
+    return [
+        get_context(argument_set, random_times, random_lvo, size,
+                    sampler.points(size))
+        for sampler, (random_times,
+                      random_lvo) in zip(samplers, get_analyses())
+    ]
+
+
+def run_probabilistic_evals(argument_set,
+                            horizons,
+                            accumulators,
+                            evals=None,
+                            random_state=np.random,
+                            samplers=None):
+    '''
+    Call run_probabilistic_set evals ('evals per set' by default) times,
+    folding the results into the accumulators, indexed by analysis and
+    then horizon
+    '''
+    if evals is None:
+        evals = SETTINGS['Probabilistic Model']['evals per set']
+    if samplers is None:
+        samplers = get_samplers(random_state)
+    for _ in range(evals):
+        contexts = get_probabilistic_contexts(argument_set, samplers)
+        for analysis, (analysis_accumulators,
+                       context) in enumerate(zip(accumulators, contexts)):
+            horizon_results = run_model_horizons(context, horizons)
+            sample_store.record(analysis, context, horizon_results)
+            for accumulator, results in zip(analysis_accumulators,
+                                            horizon_results):
+                accumulator.add(results, context)
+
+
+def run_probabilistic_batch(argument_set,
+                            horizons,
+                            accumulators,
+                            random_state=np.random,
+                            evals=None,
+                            samplers=None):
+    '''
+    Same as run_probabilistic_evals, except that the random times and LVO
+    probabilities are drawn up front and evaluated 'Batch Size' at a time
+    by run_model_batch_horizons
+    '''
     prob_settings = SETTINGS['Probabilistic Model']
-    if prob_settings['Compare Times vs. LVO'] is True:
-        # Start with random times only
-        prob_settings['Random Times'] = True
-        prob_settings['Random LVO'] = False
-        r1 = run_model(argument_set)
-        # Set time back to default and rerun with random LVO distribution
-        prob_settings['Random Times'] = False
-        prob_settings['Random LVO'] = True
-        r2 = run_model(argument_set)
-        prob_settings['Random Times'] = True
-        prob_settings['Random LVO'] = True
-        r3 = run_model(argument_set)
-        results = (r1, r2, r3)
-    else:
-        # The random lvo'ness is taken care of by passing as an argument
-        # in the run_model function (for get ischemic outcomes)
-        if prob_settings['Random Times'] is True:
-            constants.Times.get_random_set()
-        results = run_model(argument_set)
-    return results
+    if evals is None:
+        evals = prob_settings['evals per set']
+    if samplers is None:
+        samplers = get_samplers(random_state)
+    for start in range(0, evals, prob_settings['Batch Size']):
+        size = min(prob_settings['Batch Size'], evals - start)
+        contexts = get_probabilistic_contexts(argument_set, samplers, size)
+        for analysis, (analysis_accumulators,
+                       context) in enumerate(zip(accumulators, contexts)):
+            batches = run_model_batch_horizons(context, horizons)
+            sample_store.record_batch(analysis, context, batches)
+            for accumulator, batch in zip(analysis_accumulators, batches):
+                accumulator.add_batch(batch, context)
+
+
+def run_probabilistic_adaptive(argument_set,
+                               horizons,
+                               accumulators,
+                               random_state=np.random):
+    '''
+    Evaluate the argument set in rounds until the Wilson interval on the
+    percent optimal of every strategy, in every analysis and horizon, is
+    narrower than 'CI Width', running between 'Minimum Evals' and 'evals
+    per set' evaluations. After the first 'Minimum Evals', each round runs
+    as many evaluations as the proportions so far say are still needed
+    (but at least 'Minimum Evals'), which usually takes two or three rounds
+    and so few batched model calls.
+    '''
+    prob_settings = SETTINGS['Probabilistic Model']
+    maximum = prob_settings['evals per set']
+    z = statistics.NormalDist().inv_cdf(0.5 +
+                                        prob_settings['Confidence Level'] / 2)
+    # One sampler for all the rounds so that a Sobol sequence continues
+    samplers = get_samplers(random_state)
+    every_accumulator = [
+        accumulator for analysis_accumulators in accumulators
+        for accumulator in analysis_accumulators
+    ]
+    evals = 0
+    needed = 0
+    while evals < maximum:
+        size = min(max(needed - evals, prob_settings['Minimum Evals']),
+                   maximum - evals)
+        if prob_settings['Batched'] is True:
+            run_probabilistic_batch(argument_set, horizons, accumulators,
+                                    random_state, size, samplers)
+        else:
+            run_probabilistic_evals(argument_set, horizons, accumulators, size,
+                                    random_state, samplers)
+        evals += size
+        if all(
+                accumulator.interval_width(z) <= prob_settings['CI Width']
+                for accumulator in every_accumulator):
+            break
+        needed = max(
+            accumulator.evals_needed(prob_settings['CI Width'], z)
+            for accumulator in every_accumulator)
+    instrumentation.count('adaptive evals', evals)
+    if evals == maximum:
+        instrumentation.count('adaptive sets that hit evals per set')
 
 
-def run_argument_set(argument_set):
+def run_argument_set(argument_set, random_state=np.random, index=None):
+    '''
+    Run the model for one argument set and return its output file rows,
+    one for each horizon. index identifies the set in the sample store.
+    '''
     # Alias because annoying to keep typing
     prob_settings = SETTINGS['Probabilistic Model']
-    if prob_settings['on'] is True:
-        while (prob_settings['current_set_counter'] <
-               prob_settings['evals per set']):
-            results = run_probabilistic_set(argument_set)
-            prob_settings['current_set_counter'] += 1
-            prob_settings['Results'].append(results)
-        print_probabilistic_model_output(argument_set)
+    labels, horizons = zip(*get_horizons())
+    if prob_settings['on'] is not True and SETTINGS['Network'] is not None:
+        network = load_network(SETTINGS['Network'])
+        horizon_results = network_model.run_model_horizons(
+            get_context(argument_set,
+                        random_state=random_state,
+                        network=network), network, horizons)
+        with instrumentation.timed('format output'):
+            return ''.join(
+                format_network_output(results, argument_set, label, network)
+                for results, label in zip(horizon_results, labels))
+    if prob_settings['on'] is not True:
+        horizon_results = run_model_horizons(
+            get_context(argument_set, random_state=random_state), horizons)
+        with instrumentation.timed('format output'):
+            return ''.join(
+                format_model_output(results, argument_set, label)
+                for results, label in zip(horizon_results, labels))
+
+    sample_store.start_set(index, argument_set)
+    keep_samples = prob_settings['Value of Information'] is True
+    accumulators = [[
+        psa.PSAAccumulator(
+            STRATEGIES,
+            voi.PSASamples(STRATEGIES) if keep_samples else None,
+            prob_settings['CEAC Thresholds']) for _ in horizons
+    ] for _ in get_analyses()]
+    if prob_settings['Adaptive'] is True:
+        run_probabilistic_adaptive(argument_set, horizons, accumulators,
+                                   random_state)
+    elif prob_settings['Batched'] is True:
+        run_probabilistic_batch(argument_set, horizons, accumulators,
+                                random_state)
+    else:
+        run_probabilistic_evals(argument_set,
+                                horizons,
+                                accumulators,
+                                random_state=random_state)
+    with instrumentation.timed('format output'):
+        return ''.join(
+            format_probabilistic_model_output(
+                argument_set, [analysis[i]
+                               for analysis in accumulators], label)
+            for i, label in enumerate(labels))
+
+
+def run_set_chunks(chunks, seed, start=0):
+    '''
+    Output rows, one string per set like run_argument_set, of the
+    deterministic model over chunks of argument sets as dicts of arrays
+    (see create_random_sets.random_set_chunks). Each chunk is a single
+    run_model_batch_horizons call, with any random times and LVO
+    probabilities drawn from a random state for the chunk's first index,
+    so the sets never exist one at a time. The first start sets are
+    skipped, for resuming.
+    '''
+    labels, horizons = zip(*get_horizons())
+    index = 0
+    for chunk in chunks:
+        size = len(chunk['age'])
+        index += size
+        if index <= start:
+            continue
+        context = get_context(chunk,
+                              size=size,
+                              random_state=get_random_state(
+                                  seed, index - size))
+        horizon_results = run_model_batch_horizons(context, horizons)
+        skip = max(start - (index - size), 0)
+        with instrumentation.timed('format output'):
+            horizon_rows = [
+                format_model_batch_output(results, chunk, label)[skip:]
+                for results, label in zip(horizon_results, labels)
+            ]
+        yield from map(''.join, zip(*horizon_rows))
+
+
+def get_random_state(seed, index=None):
+    '''
+    Independent random state for the argument set at index, or for
+    generating the argument sets when index is None. Since it only depends
+    on the seed and the index, a set gets the same draws whatever order or
+    process it is run in.
+    '''
+    if index is None:
+        sequence = np.random.SeedSequence(seed)
+    else:
+        sequence = np.random.SeedSequence(seed, spawn_key=(index, ))
+    return np.random.RandomState(sequence.generate_state(4))
+
+
+def run_indexed_sets(seed, indexed_sets):
+    '''
+    Worker process entry point, returns the output rows of a chunk of
+    (index, argument set) pairs along with what the instrumentation
+    recorded while running them (None when it's off)
+    '''
+    rows = [
+        run_argument_set(argument_set, get_random_state(seed, index), index)
+        for index, argument_set in indexed_sets
+    ]
+    # A checkpoint counts these sets as done once their rows are written, so
+    # their samples have to be on disk by then
+    if SETTINGS['Checkpoint']['on'] is True:
+        sample_store.flush()
+    if instrumentation.ENABLED:
+        return rows, instrumentation.collect()
+    return rows, None
+
+
+def initialize_worker(settings, prices):
+    # Worker processes don't necessarily share our module state
+    SETTINGS.update(settings)
+    constants.Costs.set_prices(prices)
+    if SETTINGS['Instrumentation'] is True:
+        instrumentation.enable()
+    open_sample_store()
+    # Write out the last of the samples when the pool shuts the worker down
+    multiprocessing.util.Finalize(None,
+                                  sample_store.close_writer,
+                                  exitpriority=10)
+
+
+def open_sample_store():
+    '''
+    Start recording draws to SETTINGS['Probabilistic Model']['Sample
+    Store'] in this process, if it's set
+    '''
+    prob_settings = SETTINGS['Probabilistic Model']
+    if prob_settings['on'] is True and prob_settings['Sample Store']:
+        components = 0
+        if SETTINGS['Cost Components'] is True:
+            components = len(constants.COST_COMPONENTS)
+        sample_store.open_writer(prob_settings['Sample Store'],
+                                 len(get_horizons()),
+                                 STRATEGIES,
+                                 components=components)
+
+
+def sample_store_metadata(seed):
+    prob_settings = SETTINGS['Probabilistic Model']
+    if prob_settings['Compare Times vs. LVO'] is True:
+        analyses = ['Random Times', 'Random LVO', 'Random Both']
     else:
-        results = run_model(argument_set)
-        print_model_output(results, argument_set)
+        analyses = ['Probabilistic']
+    return {
+        'Strategies': STRATEGIES,
+        'Horizons': [label for label, _ in get_horizons()],
+        'Analyses': analyses,
+        'ICER Threshold': SETTINGS['ICER Threshold'],
+        'Simulation Type': SETTINGS['Simulation Type'],
+        'Seed': seed,
+        'Sampling': prob_settings['Sampling'],
+        'Cost Components': constants.cost_component_names(),
+        'Component Prices': constants.cost_component_prices().tolist()
+    }
+
+
+def chunk_rows(future):
+    '''
+    The rows of a finished run_indexed_sets call, merging its
+    instrumentation into ours
+    '''
+    rows, recorded = future.result()
+    if recorded is not None:
+        instrumentation.merge(recorded)
+    return rows
+
+
+def run_in_pool(arguments, seed, workers, chunk_size=8, start=0):
+    '''
+    Spread the argument sets across a pool of worker processes and yield
+    their output rows, in input order, as they come back. Only a few chunks
+    per worker are in flight at a time so arguments can be a generator.
+    start is the index of the first argument set.
+    '''
+    with concurrent.futures.ProcessPoolExecutor(
+            workers,
+            initializer=initialize_worker,
+            initargs=(SETTINGS, constants.Costs.get_prices())) as executor:
+        pending = collections.deque()
+        chunk = []
+        for index, argument_set in enumerate(arguments, start):
+            chunk.append((index, argument_set))
+            if len(chunk) == chunk_size:
+                pending.append(executor.submit(run_indexed_sets, seed, chunk))
+                chunk = []
+            if len(pending) > 4 * workers:
+                yield from chunk_rows(pending.popleft())
+        if chunk:
+            pending.append(executor.submit(run_indexed_sets, seed, chunk))
+        while pending:
+            yield from chunk_rows(pending.popleft())
+
+
+def run(workers=1, resume=False):
+    '''
+    Run the simulation in SETTINGS. With resume, carry on from the
+    checkpoint in SETTINGS['Checkpoint'] instead of starting over.
+    '''
 
+    if SETTINGS['Network'] is not None and (
+            SETTINGS['Probabilistic Model']['on'] is True
+            or SETTINGS['Cost Components'] is True):
+        raise ValueError('networks only run with the deterministic model '
+                         'and without Cost Components')
 
-def run():
+    if SETTINGS['Instrumentation'] is True:
+        instrumentation.enable()
 
-    global OUTPUT_FILE
+    checkpoint_settings = SETTINGS['Checkpoint']
+    checkpointer = None
+    start = 0
+    if resume:
+        checkpointer, offset = checkpoint.Checkpoint.resume(
+            checkpoint_settings['Path'], checkpoint_settings['Every Seconds'],
+            SETTINGS)
+        seed = checkpointer.seed
+        start = checkpointer.completed
+        print('Resuming after', start, 'argument sets with seed', seed)
+    else:
+        seed = SETTINGS['Seed']
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+            print('Using seed', seed)
 
     # Setup the inputs and the argument files.
 
     arguments = None
+    chunked = False
 
     if SETTINGS['Simulation Type'] == 'Base Case':
-        OUTPUT_FILE = open('output/base_case.csv', 'w')
+        output_path = 'output/base_case.csv'
         arguments = []
         arguments.append(SETTINGS['Base Case Options'])
+        total = 1
     elif SETTINGS['Simulation Type'] == 'Random Sets':
-        OUTPUT_FILE = open(random_out_name(), 'w')
-        arguments = tqdm.tqdm(
-            random_sets.create_random_sets(SETTINGS['Random Set Options'])
-        )
+        output_path = random_out_name()
+        # Drawn a chunk at a time as they're run, never all held at once.
+        # The deterministic model runs a whole chunk at once, the
+        # probabilistic one and networks take them a set at a time.
+        if (SETTINGS['Probabilistic Model']['on'] is True
+                or SETTINGS['Network'] is not None):
+            arguments = random_sets.random_sets(SETTINGS['Random Set Options'],
+                                                get_random_state(seed))
+        else:
+            arguments = random_sets.random_set_chunks(
+                SETTINGS['Random Set Options'], get_random_state(seed))
+            chunked = True
+        total = SETTINGS['Random Set Options']['Number of Random Sets']
     elif SETTINGS['Simulation Type'] == 'Input File':
-        OUTPUT_FILE = open('output/input_file_scenarios.csv', 'w')
-        arguments = tqdm.tqdm(read_input_file())
+        output_path = 'output/input_file_scenarios.csv'
+        arguments = read_input_file()
+        total = pipeline.count_scenarios('input/scenarios.csv')
 
-    setup_output_file(OUTPUT_FILE)
-    for argument_set in arguments:
-        run_argument_set(argument_set)
+    if resume:
+        # Drop any rows written after the checkpoint
+        output_file = open(checkpointer.output_path, 'r+')
+        output_file.seek(offset)
+        output_file.truncate()
+        if not chunked:
+            arguments = itertools.islice(arguments, start, None)
+    else:
+        output_file = open(output_path, 'w')
+        if checkpoint_settings['on'] is True:
+            checkpointer = checkpoint.Checkpoint(
+                checkpoint_settings['Path'],
+                checkpoint_settings['Every Seconds'], SETTINGS, seed,
+                output_path)
+
+    store = SETTINGS['Probabilistic Model']['Sample Store']
+    if SETTINGS['Probabilistic Model']['on'] is True and store:
+        if resume:
+            sample_store.truncate(store, start)
+        else:
+            sample_store.prepare(store)
+        if workers == 1:
+            open_sample_store()
+
+    run_sets(arguments,
+             output_file,
+             seed,
+             workers,
+             total,
+             start=start,
+             checkpointer=checkpointer,
+             chunked=chunked)
+
+    # Finished, so nothing to resume
+    if checkpointer is not None:
+        checkpoint.remove(checkpointer.path)
+
+    if SETTINGS['Probabilistic Model']['on'] is True and store:
+        sample_store.close_writer()
+        sample_store.write_index(store, sample_store_metadata(seed))
+        print('Samples written to', store)
+
+    if SETTINGS['Instrumentation'] is True:
+        recorded = instrumentation.profile()
+        print(instrumentation.summary_table(recorded))
+        instrumentation.write_profile(os.path.join('output', 'profile.json'),
+                                      recorded)
+
+
+def run_sets(arguments,
+             output_file,
+             seed,
+             workers=1,
+             total=None,
+             progress=True,
+             start=0,
+             checkpointer=None,
+             chunked=False):
+    '''
+    Run every argument set and write the output file (which is closed at
+    the end). total is only for the progress bar. When resuming, start is
+    the index of the first argument set and the output file already has its
+    header and the rows before it. Progress is saved to the checkpointer (a
+    checkpoint.Checkpoint) whenever one is due. With chunked, arguments are
+    chunks of sets for run_set_chunks instead, which runs them here
+    whatever the number of workers.
+    '''
+    stream_settings = SETTINGS['Streaming']
+    if start == 0:
+        setup_output_file(output_file)
+    if chunked:
+        rows = run_set_chunks(arguments, seed, start)
+    elif workers > 1:
+        rows = run_in_pool(arguments, seed, workers, start=start)
+    else:
+        rows = (run_argument_set(argument_set, get_random_state(seed, index),
+                                 index)
+                for index, argument_set in enumerate(arguments, start))
+    with pipeline.BufferedWriter(
+            output_file, stream_settings['Buffered Rows'],
+            stream_settings['Background Writer']) as writer:
+        for completed, row in enumerate(
+                tqdm.tqdm(rows,
+                          total=total,
+                          initial=start,
+                          disable=not progress), start + 1):
+            instrumentation.count('argument sets')
+            with instrumentation.timed('write output'):
+                writer.write(row)
+            if checkpointer is not None and checkpointer.due():
+                sample_store.flush()
+                checkpointer.record(completed, writer.sync())
 
 
 if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument('--workers',
+                        type=int,
+                        default=1,
+                        help='number of processes to run argument sets on')
+    PARSER.add_argument('--seed',
+                        type=int,
+                        default=None,
+                        help='overrides SETTINGS[\'Seed\']')
+    PARSER.add_argument('--profile',
+                        action='store_true',
+                        help='turns on SETTINGS[\'Instrumentation\']')
+    PARSER.add_argument('--resume',
+                        action='store_true',
+                        help='carry on an interrupted run from the checkpoint '
+                        'in SETTINGS[\'Checkpoint\'] (see checkpoint.py)')
+    PARSER.add_argument('--network',
+                        default=None,
+                        help='overrides SETTINGS[\'Network\']')
+    ARGS = PARSER.parse_args()
+    if ARGS.network is not None:
+        SETTINGS['Network'] = ARGS.network
+    if ARGS.seed is not None:
+        SETTINGS['Seed'] = ARGS.seed
+    if ARGS.profile:
+        SETTINGS['Instrumentation'] = True
     START = time.time()
     constants.Costs.inflate(2016)
-    run()
+    run(ARGS.workers, ARGS.resume)
     END = time.time()
     print('Simulation time of', END - START, 'seconds.')
@@ -0,0 +1,72 @@
+'''
+Everything a single evaluation of the model depends on, bundled into one
+immutable object. Nothing in the model reads or writes run state anywhere
+else, so evaluations with different contexts can run side by side (in a
+thread pool, or inside a long-lived service).
+'''
+
+import collections
+import types
+import numpy as np
+import ais_outcomes as ais
+import constants
+
+
+class ModelContext(
+        collections.namedtuple('ModelContext', [
+            'arguments', 'NIHSS', 'horizon', 'times', 'p_lvo', 'icer_threshold'
+        ])):
+    '''
+    arguments -> the patient and travel times (see main.INPUT_VARIABLES)
+    NIHSS -> converted from the RACE in the arguments
+    horizon -> years post-stroke to base the decision on, None for lifetime
+    times -> a constants.TimeSamples of the door times (network.DoorTimes
+             for a network)
+    p_lvo -> probability of an LVO given an AIS
+    icer_threshold -> willingness to pay per QALY
+
+    For the batched model the arguments, times and p_lvo can hold arrays.
+    The arguments are kept as a read-only copy of the mapping given.
+    '''
+
+    __slots__ = ()
+
+    def __new__(cls, arguments, *fields, **named_fields):
+        return super().__new__(cls, types.MappingProxyType(dict(arguments)),
+                               *fields, **named_fields)
+
+    def __getnewargs__(self):
+        # Mapping proxies can't be pickled, so send a plain dict
+        return (dict(self.arguments), ) + tuple(self[1:])
+
+    def _replace(self, **fields):
+        # namedtuple's version skips __new__
+        return ModelContext(*super()._replace(**fields))
+
+    @staticmethod
+    def create(arguments,
+               horizon,
+               icer_threshold,
+               random_times,
+               random_lvo,
+               size=None,
+               random_state=np.random,
+               network=None):
+        '''
+        Draw the random times and LVO probability (size samples of each when
+        size is given) and bundle them with everything else. For a
+        network.Network the times are the door times of its centers.
+        '''
+        if network is not None:
+            times = network.sample_times(random_times, size, random_state)
+        elif random_times is True:
+            times = constants.Times.get_random_samples(size, random_state)
+        else:
+            times = constants.Times.get_default_samples()
+        p_lvo = ais.p_lvo_given_ais(arguments['RACE'], random_lvo, size,
+                                    random_state)
+        if size is not None:
+            p_lvo = np.broadcast_to(p_lvo, (size, ))
+        return ModelContext(arguments,
+                            constants.race_to_nihss(arguments['RACE']),
+                            horizon, times, p_lvo, icer_threshold)
@@ -0,0 +1,405 @@
+'''
+Networks of several primary and comprehensive centers. Instead of the fixed
+Primary, Comprehensive and Drip and Ship strategies for one pair of
+centers, every center can be gone to directly and every primary can ship
+to every comprehensive, each center with its own door times.
+
+Routes that can't work (shipping that misses the EVT time limit) or that
+are dominated (another route of the same kind gives the same treatments
+no later) are pruned before any markov model is run, so a big network
+costs little more than the handful of routes that could actually be
+optimal.
+
+    python network.py input/network.json --age 70 --race 7 --symptoms 45
+
+or, for every set of the simulation in main.SETTINGS,
+
+    python main.py --network input/network.json
+
+See input/network.json for the format.
+'''
+
+import argparse
+import collections
+import json
+import numpy as np
+import ais_outcomes as ais
+import cohort
+import constants
+import optimal_strategy
+
+# (base case, low, high) door times in minutes, the same as the ones in
+# constants; random samples are uniform between low and high
+PRIMARY_DOOR_TO_NEEDLE = (61.00, 47.00, 83.00)
+COMPREHENSIVE_DOOR_TO_NEEDLE = (52.00, 39.00, 70.00)
+COMPREHENSIVE_DOOR_TO_GROIN = (145.00, 83.00, 192.00)
+
+# kind is one of the three main.STRATEGIES, primary and comprehensive are
+# the centers it uses (None if it doesn't)
+Route = collections.namedtuple('Route',
+                               ['name', 'kind', 'primary', 'comprehensive'])
+
+
+class Center(object):
+    '''
+    A stroke center, time_to minutes away from the patient. Door times are
+    (base case, low, high) triples, and only comprehensive centers have a
+    door to groin time.
+    '''
+
+    def __init__(self, name, time_to, door_to_needle, door_to_groin=None):
+        self.name = name
+        self.time_to = time_to
+        self.door_to_needle = door_to_needle
+        self.door_to_groin = door_to_groin
+
+
+class DoorTimes(object):
+    '''
+    Door to needle and door to groin times of every center in a network,
+    keyed by name, held the same way as constants.TimeSamples
+    '''
+
+    def __init__(self, door_to_needle, door_to_groin):
+        self.door_to_needle = door_to_needle
+        self.door_to_groin = door_to_groin
+
+
+def draw(distribution, random, random_state):
+    base_case, low, high = distribution
+    if random is not True:
+        return base_case
+    return random_state.uniform(low, high)
+
+
+class Network(object):
+    '''
+    primaries and comprehensives are lists of Centers, transfer_times[i][j]
+    the minutes to ship from primary i to comprehensive j
+    '''
+
+    def __init__(self, primaries, comprehensives, transfer_times):
+        self.primaries = primaries
+        self.comprehensives = comprehensives
+        self.transfer_times = transfer_times
+        names = [center.name for center in primaries + comprehensives]
+        if len(set(names)) != len(names):
+            raise ValueError('center names must be unique')
+        self.routes = ([
+            Route(p.name, 'Primary', i, None) for i, p in enumerate(primaries)
+        ] + [
+            Route(c.name, 'Comprehensive', None, j)
+            for j, c in enumerate(comprehensives)
+        ] + [
+            Route(f'{p.name} then {c.name}', 'Drip and Ship', i, j)
+            for i, p in enumerate(primaries)
+            for j, c in enumerate(comprehensives)
+        ])
+
+    @property
+    def strategies(self):
+        return [route.name for route in self.routes]
+
+    def sample_times(self, random_times, size=None, random_state=np.random):
+        '''
+        Door times of every center, random ones when random_times is True.
+        Only single samples are supported (size must be None).
+        '''
+        if size is not None:
+            raise ValueError('networks are evaluated one sample at a time')
+        door_to_needle = {}
+        door_to_groin = {}
+        for center in self.primaries + self.comprehensives:
+            door_to_needle[center.name] = draw(center.door_to_needle,
+                                               random_times, random_state)
+            if center.door_to_groin is not None:
+                door_to_groin[center.name] = draw(center.door_to_groin,
+                                                  random_times, random_state)
+        return DoorTimes(door_to_needle, door_to_groin)
+
+    @staticmethod
+    def from_arguments(arguments):
+        '''
+        The one primary and one comprehensive of a main.INPUT_VARIABLES
+        argument set, with the default door times
+        '''
+        return Network([
+            Center('Primary', arguments['time_to_primary'],
+                   PRIMARY_DOOR_TO_NEEDLE)
+        ], [
+            Center('Comprehensive', arguments['time_to_comprehensive'],
+                   COMPREHENSIVE_DOOR_TO_NEEDLE, COMPREHENSIVE_DOOR_TO_GROIN)
+        ], [[arguments['transfer_time']]])
+
+    @staticmethod
+    def load(path):
+        '''
+        Network from a JSON file with 'primaries' and 'comprehensives'
+        lists of centers ('name', 'time_to' and optionally 'door_to_needle'
+        and, for comprehensives, 'door_to_groin' triples) and
+        'transfer_times', one row per primary
+        '''
+        with open(path, 'r') as f:
+            description = json.load(f)
+        primaries = [
+            Center(center['name'], center['time_to'],
+                   tuple(center.get('door_to_needle', PRIMARY_DOOR_TO_NEEDLE)))
+            for center in description['primaries']
+        ]
+        comprehensives = [
+            Center(
+                center['name'], center['time_to'],
+                tuple(
+                    center.get('door_to_needle',
+                               COMPREHENSIVE_DOOR_TO_NEEDLE)),
+                tuple(center.get('door_to_groin',
+                                 COMPREHENSIVE_DOOR_TO_GROIN)))
+            for center in description['comprehensives']
+        ]
+        return Network(primaries, comprehensives,
+                       description['transfer_times'])
+
+
+class NetworkModel(ais.IschemicModel):
+    '''
+    IschemicModel for a network. Every route gets an onset to needle and
+    (if it offers EVT) an onset to EVT time, worked out the same way as the
+    three fixed strategies, and get_ais_outcomes takes a route name.
+    '''
+
+    def __init__(self, context, network):
+        arguments = context.arguments
+        times = context.times
+
+        self.sex = arguments['sex']
+        self.age = arguments['age']
+        self.RACE = arguments['RACE']
+        self.NIHSS = context.NIHSS
+        self.p_lvo = context.p_lvo
+        self.network = network
+        self.kinds = {route.name: route.kind for route in network.routes}
+
+        symptoms = arguments['time_since_symptoms']
+        self.onset_needle = {}
+        self.onset_evt = {}
+        for route in network.routes:
+            if route.kind == 'Comprehensive':
+                center = network.comprehensives[route.comprehensive]
+                self.onset_needle[route.name] = (
+                    symptoms + center.time_to +
+                    times.door_to_needle[center.name])
+                self.onset_evt[route.name] = (symptoms + center.time_to +
+                                              times.door_to_groin[center.name])
+                continue
+            primary = network.primaries[route.primary]
+            self.onset_needle[route.name] = (
+                symptoms + primary.time_to +
+                times.door_to_needle[primary.name])
+            if route.kind == 'Drip and Ship':
+                comprehensive = network.comprehensives[route.comprehensive]
+                # Same assumption as constants.TimeSamples: the time from
+                # arriving at the comprehensive to EVT is its door to groin
+                # less the primary's door to needle
+                self.onset_evt[route.name] = (
+                    self.onset_needle[route.name] +
+                    network.transfer_times[route.primary][route.comprehensive]
+                    + times.door_to_groin[comprehensive.name] -
+                    times.door_to_needle[primary.name])
+
+        self.model_is_necessary = self.is_there_an_option()
+        if self.model_is_necessary is False:
+            self.cutoff_location = self.nearest_center(
+                constants.no_tx_where_to_go(self.RACE))
+
+    def is_there_an_option(self):
+        '''
+        Same as IschemicModel: the model is only needed if some primary can
+        give tPA in time or some comprehensive can give EVT in time
+        '''
+        for route in self.network.routes:
+            if (route.kind == 'Primary' and self.onset_needle[route.name]
+                    <= constants.time_limit_tpa()):
+                return True
+            if (route.kind == 'Comprehensive' and self.onset_evt[route.name]
+                    <= constants.time_limit_evt()):
+                return True
+        return False
+
+    def nearest_center(self, kind):
+        '''
+        Name of (and so of the direct route to) the closest center of kind
+        '''
+        if kind == 'Primary':
+            centers = self.network.primaries
+        else:
+            centers = self.network.comprehensives
+        return min(centers, key=lambda center: center.time_to).name
+
+    def is_feasible(self, route):
+        '''
+        Drip and Ship only works if EVT can still be given after shipping
+        '''
+        return not (route.kind == 'Drip and Ship' and
+                    self.onset_evt[route.name] > constants.time_limit_evt())
+
+    def treatment_times(self, route):
+        '''
+        What a route's outcomes depend on: the onset to needle time (None
+        past the tPA limit, where it no longer matters for anyone) and the
+        onset to EVT time
+        '''
+        needle = self.onset_needle[route.name]
+        if needle > constants.time_limit_tpa():
+            needle = None
+        return needle, self.onset_evt.get(route.name)
+
+    def candidate_routes(self, prune=True):
+        '''
+        The feasible routes and, when prune is True, only those that no
+        other route of the same kind beats: gives tPA (if it gives it at
+        all) and EVT no later. Routes of one kind cost the same apart from
+        the outcomes, so a route that treats later is assumed never to be
+        worth choosing. Of routes with identical times the first is kept.
+        '''
+        feasible = [
+            route for route in self.network.routes if self.is_feasible(route)
+        ]
+        if not prune:
+            return feasible
+
+        def no_later(a, b):
+            if (a[0] is None) != (b[0] is None):
+                return False
+            return ((a[0] is None or a[0] <= b[0])
+                    and (a[1] is None or a[1] <= b[1]))
+
+        candidates = []
+        for route in feasible:
+            times = self.treatment_times(route)
+            dominated = False
+            for other in feasible:
+                if other is route or other.kind != route.kind:
+                    continue
+                other_times = self.treatment_times(other)
+                if no_later(other_times, times) and (other_times != times
+                                                     or feasible.index(other)
+                                                     < feasible.index(route)):
+                    dominated = True
+                    break
+            if not dominated:
+                candidates.append(route)
+        return candidates
+
+    def get_ais_outcomes(self, key):
+        '''
+        Outcomes of the route named key, the same as IschemicModel's for
+        its kind
+        '''
+        needle = self.onset_needle[key]
+        evt = self.onset_evt.get(key)
+        kind = self.kinds[key]
+        if kind == 'Primary':
+            return {
+                'p_good': self.get_p_good(needle),
+                'p_tpa': 1,
+                'p_evt': 0,
+                'p_transfer': 0
+            }
+        return {
+            'p_good':
+            self.get_p_good(needle, evt),
+            'p_tpa':
+            1 if kind == 'Drip and Ship'
+            or needle < constants.time_limit_tpa() else 0,
+            'p_evt':
+            self.p_lvo,
+            'p_transfer':
+            1 if kind == 'Drip and Ship' else 0
+        }
+
+
+def run_model_horizons(context, network, horizons, prune=True):
+    '''
+    main.run_model_horizons for a network (context.times from
+    network.sample_times). Costs and QALYs are keyed by route name, 'N/A'
+    for routes that were infeasible or pruned, and 'Routes Evaluated' lists
+    the routes the markov model was run for.
+    '''
+    model = NetworkModel(context, network)
+    strategies = network.strategies
+    horizon_results = []
+    for _ in horizons:
+        horizon_results.append({
+            'Optimal Location': None,
+            'Location with Maximum Benefit': 'Based on cutoff',
+            'Costs': {
+                strategy: 'N/A'
+                for strategy in strategies
+            },
+            'QALYs': {
+                strategy: 'N/A'
+                for strategy in strategies
+            },
+            'Routes Evaluated': []
+        })
+
+    if model.model_is_necessary is not True:
+        for results in horizon_results:
+            results['Optimal Location'] = model.cutoff_location
+        return horizon_results
+
+    evaluated = [route.name for route in model.candidate_routes(prune)]
+    for name in evaluated:
+        population = cohort.Population(model.get_ais_outcomes(name), name,
+                                       context)
+        qalys, costs = population.horizon_values(horizons)
+        for i, results in enumerate(horizon_results):
+            results['Costs'][name] = costs[i]
+            results['QALYs'][name] = qalys[i]
+
+    for results in horizon_results:
+        results['Routes Evaluated'] = evaluated
+        results['Location with Maximum Benefit'] = max(
+            evaluated, key=lambda name: results['QALYs'][name])
+        optimal_strategy.get_optimal(results, evaluated,
+                                     context.icer_threshold)
+    return horizon_results
+
+
+if __name__ == '__main__':
+    import main
+
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument('network', help='JSON description of the network')
+    PARSER.add_argument('--sex', choices=['male', 'female'], default='female')
+    PARSER.add_argument('--age', type=int, default=65)
+    PARSER.add_argument('--race', type=float, default=7)
+    PARSER.add_argument('--symptoms',
+                        type=float,
+                        default=45,
+                        help='minutes since symptom onset')
+    PARSER.add_argument('--no-prune', action='store_true')
+    ARGS = PARSER.parse_args()
+    constants.Costs.inflate(2016)
+
+    NETWORK = Network.load(ARGS.network)
+    ARGUMENTS = {
+        'sex':
+        (constants.Sex.MALE if ARGS.sex == 'male' else constants.Sex.FEMALE),
+        'age': ARGS.age,
+        'RACE': ARGS.race,
+        'time_since_symptoms': ARGS.symptoms
+    }
+    RESULTS = main.run_model(ARGUMENTS,
+                             context=main.get_context(ARGUMENTS,
+                                                      False,
+                                                      False,
+                                                      network=NETWORK),
+                             network=NETWORK,
+                             prune=not ARGS.no_prune)
+    print('Optimal Location:', RESULTS['Optimal Location'])
+    print('Routes evaluated:', len(RESULTS['Routes Evaluated']), 'of',
+          len(NETWORK.routes))
+    for NAME in RESULTS['Routes Evaluated']:
+        print(f'  {NAME:<40}{RESULTS["Costs"][NAME]:>12.2f}'
+              f'{RESULTS["QALYs"][NAME]:>10.4f}')
@@ -96,3 +96,130 @@ def get_optimal(results, strategies, threshold):
         if ICER[-1] < threshold:
             results['Optimal Location'] = ICER[0]
             return
+
+
+def next_on_frontier(alive):
+    '''
+    For each position of a (N x strategies) mask, the position of the next
+    strategy still on the frontier, or the number of strategies if there
+    isn't one
+    '''
+    n, k = alive.shape
+    following = np.full((n, k), k)
+    for index in range(k - 2, -1, -1):
+        following[:, index] = np.where(alive[:, index + 1], index + 1,
+                                       following[:, index + 1])
+    return following
+
+
+def efficiency_frontier(costs, qalys, available=None):
+    '''
+    The efficiency frontier of get_optimal for N rows at once, which
+    doesn't depend on the threshold. costs and qalys are (N x strategies)
+    arrays and available masks out the strategies that aren't options in a
+    row (every strategy is by default).
+
+    Returns the order the strategies of each row are sorted in, and in that
+    order, a mask of the ones left on the frontier and their ICERs against
+    the one before them (NaN for everything else, and the first strategy on
+    the frontier). Ties and the order strategies are dropped in follow
+    get_optimal exactly, one deletion per row at a time.
+    '''
+    costs = np.asarray(costs, dtype=float)
+    qalys = np.asarray(qalys, dtype=float)
+    n, k = costs.shape
+    if available is None:
+        available = np.ones((n, k), dtype=bool)
+    rows = np.arange(n)
+
+    # Same order as sorting by (x, y); lexsort is stable like list.sort and
+    # sends strategies that aren't available to the end
+    x = np.where(available, qalys, np.inf)
+    y = np.where(available, costs, np.inf)
+    order = np.lexsort((y, x))
+    x = np.take_along_axis(x, order, axis=1)
+    y = np.take_along_axis(y, order, axis=1)
+    alive = np.take_along_axis(available, order, axis=1)
+
+    # Drop the first strategy after a dominated pair, and repeat until there
+    # are none left
+    while True:
+        following = next_on_frontier(alive)
+        pair = alive & (following < k)
+        following = np.minimum(following, k - 1)
+        dominated = pair & (x >= x[rows[:, None], following]) & (
+            y < y[rows[:, None], following])
+        dropping = dominated.any(axis=1)
+        if not dropping.any():
+            break
+        first = np.argmax(dominated, axis=1)[dropping]
+        alive[rows[dropping], following[dropping, first]] = False
+
+    # Then extended dominance; of each pair of adjacent pairs where the
+    # first ICER is greater, drop the shared strategy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        while True:
+            following = next_on_frontier(alive)
+            pair = alive & (following < k)
+            following = np.minimum(following, k - 1)
+            icers = np.where(pair, (y[rows[:, None], following] - y) /
+                             (x[rows[:, None], following] - x), np.nan)
+            next_icers = icers[rows[:, None], following]
+            extended = pair & pair[rows[:, None], following] & (icers
+                                                                > next_icers)
+            dropping = extended.any(axis=1)
+            if not dropping.any():
+                break
+            first = np.argmax(extended, axis=1)[dropping]
+            alive[rows[dropping], following[dropping, first]] = False
+
+    # Each ICER belongs to the second strategy of its pair
+    frontier_icers = np.full((n, k), np.nan)
+    pair_rows, pair_columns = np.nonzero(pair)
+    frontier_icers[pair_rows, following[pair_rows,
+                                        pair_columns]] = icers[pair_rows,
+                                                               pair_columns]
+    return order, alive, frontier_icers
+
+
+def get_optimal_batch(costs, qalys, threshold, available=None):
+    '''
+    Vectorized get_optimal for N rows at once, see efficiency_frontier.
+
+    Returns the column of the optimal strategy for every row, along with
+    the (N x strategies) ICERs of the strategies left on the frontier
+    against the one before them. Everything else, and the first strategy
+    on the frontier, gets NaN.
+    '''
+    order, alive, frontier_icers = efficiency_frontier(costs, qalys, available)
+    n, k = order.shape
+    rows = np.arange(n)
+
+    # The most effective strategy under the threshold, or the first one
+    first_alive = alive & (np.cumsum(alive, axis=1) == 1)
+    candidates = first_alive | (alive & (frontier_icers < threshold))
+    position = k - 1 - np.argmax(candidates[:, ::-1], axis=1)
+    optimal = order[rows, position]
+
+    icers = np.full((n, k), np.nan)
+    np.put_along_axis(icers, order, frontier_icers, axis=1)
+    return optimal, icers
+
+
+def get_optimal_thresholds(costs, qalys, thresholds, available=None):
+    '''
+    get_optimal_batch at every one of a vector of thresholds at once, for
+    acceptability curves. The frontier is only found once per row, then
+    the choice at every threshold is made over an (N x thresholds x
+    strategies) array. Returns the (N x thresholds) columns of the optimal
+    strategies.
+    '''
+    order, alive, frontier_icers = efficiency_frontier(costs, qalys, available)
+    k = order.shape[1]
+    thresholds = np.asarray(thresholds, dtype=float)
+    first_alive = alive & (np.cumsum(alive, axis=1) == 1)
+    candidates = first_alive[:, None, :] | (
+        alive[:, None, :] &
+        (frontier_icers[:, None, :] < thresholds[None, :, None]))
+    position = k - 1 - np.argmax(candidates[:, :, ::-1], axis=2)
+    return np.take_along_axis(order, position, axis=1)
@@ -0,0 +1,167 @@
+'''
+Streaming input and output for long runs. Scenarios are parsed a chunk at
+a time instead of all up front, and output rows are collected into batches
+that are written with a single call each, optionally on a background
+thread so file I/O overlaps the model runs. Memory stays constant however
+many rows the input file has.
+'''
+
+import itertools
+import os
+import queue
+import threading
+import constants
+
+
+def parse_scenario(line):
+    '''
+    One line of input/scenarios.csv to an argument set. A RACE of NA means
+    the NIHSS column is used instead.
+    '''
+    values = line.split(sep=',')
+    scenario = {}
+    if values[0] == 'male':
+        scenario['sex'] = constants.Sex.MALE
+    else:
+        scenario['sex'] = constants.Sex.FEMALE
+    scenario['age'] = int(values[1])
+    if values[2] == 'NA':
+        scenario['RACE'] = constants.nihss_to_race(float(values[3]))
+    else:
+        scenario['RACE'] = float(values[2])
+    scenario['time_since_symptoms'] = float(values[4])
+    scenario['time_to_primary'] = float(values[5])
+    scenario['time_to_comprehensive'] = float(values[6])
+    scenario['transfer_time'] = float(values[7])
+    return scenario
+
+
+def read_scenario_chunks(path, chunk_size=1024):
+    '''
+    Yields lists of up to chunk_size argument sets from a scenario file,
+    skipping the header and blank lines.
+    '''
+    with open(path, 'r') as f:
+        f.readline()
+        lines = (line for line in f if line.strip())
+        while True:
+            chunk = [
+                parse_scenario(line)
+                for line in itertools.islice(lines, chunk_size)
+            ]
+            if not chunk:
+                return
+            yield chunk
+
+
+def read_scenarios(path, chunk_size=1024):
+    '''
+    Yields the argument sets of a scenario file one at a time
+    '''
+    for chunk in read_scenario_chunks(path, chunk_size):
+        yield from chunk
+
+
+def count_scenarios(path):
+    '''
+    Number of scenarios in a file without parsing any of them, for progress
+    bars. Reads in blocks so it's cheap even for huge files.
+    '''
+    count = 0
+    with open(path, 'rb') as f:
+        f.readline()
+        for block in iter(lambda: f.read(1 << 20), b''):
+            count += block.count(b'\n')
+        # The last line may not end in a newline
+        if f.tell() > 0:
+            f.seek(-1, 2)
+            if f.read(1) != b'\n':
+                count += 1
+    return count
+
+
+class BufferedWriter(object):
+    '''
+    Collects rows (strings, newline included) and writes them to the file
+    buffer_rows at a time. With background on, batches go through a
+    bounded queue to a writer thread, so at most queue_size batches are
+    ever waiting; if the disk is slower than the model, write blocks.
+    Closing flushes everything and closes the file. Errors on the writer
+    thread are raised from the next write or from close.
+    '''
+
+    def __init__(self, file, buffer_rows=256, background=False, queue_size=8):
+        self.file = file
+        self.buffer_rows = buffer_rows
+        self.rows = []
+        self.error = None
+        self.queue = None
+        self.thread = None
+        if background:
+            self.queue = queue.Queue(queue_size)
+            self.thread = threading.Thread(target=self._write_batches,
+                                           daemon=True)
+            self.thread.start()
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        if self.error is not None:
+            raise self.error
+        if self.rows:
+            batch = ''.join(self.rows)
+            self.rows = []
+            if self.queue is None:
+                self.file.write(batch)
+            else:
+                self.queue.put(batch)
+
+    def sync(self):
+        '''
+        Write out everything so far, waiting for the writer thread to catch
+        up, and force it to disk. Returns the position in the file after
+        the last row, e.g. for a checkpoint.
+        '''
+        self.flush()
+        if self.queue is not None:
+            self.queue.join()
+            if self.error is not None:
+                raise self.error
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self.thread is not None:
+                self.queue.put(None)
+                self.thread.join()
+                self.thread = None
+            self.file.close()
+        if self.error is not None:
+            raise self.error
+
+    def _write_batches(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                self.queue.task_done()
+                return
+            # Keep draining after a failure so the producer never blocks
+            if self.error is None:
+                try:
+                    self.file.write(batch)
+                except Exception as error:
+                    self.error = error
+            self.queue.task_done()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,252 @@
+'''
+Streaming summaries of probabilistic sensitivity analysis results. Each
+evaluation is folded into running counts, means and variances as soon as
+it is made, so memory per argument set doesn't depend on the number of
+evaluations.
+'''
+
+import numpy as np
+import optimal_strategy
+
+
+class RunningMoments(object):
+    '''
+    Running mean and variance (Welford), with batches merged in using
+    Chan et al.'s pairwise update. NaN values are skipped.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        if np.isnan(value):
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def add_batch(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        batch_count = values.size
+        batch_mean = values.mean()
+        batch_m2 = np.sum((values - batch_mean)**2)
+        count = self.count + batch_count
+        delta = batch_mean - self.mean
+        self.mean += delta * batch_count / count
+        self.m2 += batch_m2 + delta**2 * self.count * batch_count / count
+        self.count = count
+
+    @property
+    def variance(self):
+        '''
+        Sample variance, NaN with fewer than two values
+        '''
+        if self.count < 2:
+            return np.nan
+        return self.m2 / (self.count - 1)
+
+    @property
+    def sd(self):
+        return np.sqrt(self.variance)
+
+
+class PSAAccumulator(object):
+    '''
+    How often each strategy is optimal, along with the running moments of
+    the costs and QALYs of each strategy over the evaluations in which it
+    was actually modelled (i.e. not decided by the RACE cutoff, and for
+    Drip and Ship only when it's feasible). Given a voi.PSASamples, every
+    evaluation is also stored there, along with its context, for the value
+    of information. Given a vector of ICER thresholds, how often each
+    strategy is optimal at every one of them is counted too, for
+    acceptability curves.
+    '''
+
+    def __init__(self, strategies, samples=None, thresholds=None):
+        self.strategies = strategies
+        self.samples = samples
+        self.thresholds = thresholds
+        if thresholds is not None:
+            self.thresholds = np.asarray(thresholds, dtype=float)
+            self.threshold_counts = np.zeros(
+                (len(thresholds), len(strategies)), dtype=np.int64)
+        self.evals = 0
+        self.counts = {strategy: 0 for strategy in strategies}
+        self.costs = {strategy: RunningMoments() for strategy in strategies}
+        self.qalys = {strategy: RunningMoments() for strategy in strategies}
+
+    def add(self, results, context=None):
+        '''
+        Fold in the results of a single run_model call
+        '''
+        self.evals += 1
+        self.counts[results['Optimal Location']] += 1
+        if self.samples is not None:
+            self.samples.add(results, context)
+        if results['Location with Maximum Benefit'] == 'Based on cutoff':
+            if self.thresholds is not None:
+                column = self.strategies.index(results['Optimal Location'])
+                self.threshold_counts[:, column] += 1
+            return
+        if self.thresholds is not None:
+            # 'N/A' where Drip and Ship isn't an option
+            costs, qalys = {}, {}
+            for strategy in self.strategies:
+                cost = results['Costs'][strategy]
+                available = not isinstance(cost, str)
+                costs[strategy] = cost if available else np.nan
+                qalys[strategy] = (results['QALYs'][strategy]
+                                   if available else np.nan)
+            self.count_thresholds(costs, qalys, np.array([True]),
+                                  np.array([results['Optimal Location']]))
+        for strategy in self.strategies:
+            cost = results['Costs'][strategy]
+            if isinstance(cost, str):
+                continue
+            self.costs[strategy].add(cost)
+            self.qalys[strategy].add(results['QALYs'][strategy])
+
+    def add_batch(self, results, context=None):
+        '''
+        Fold in the results of a run_model_batch call
+        '''
+        locations = np.asarray(results['Optimal Location'])
+        self.evals += locations.size
+        if self.samples is not None:
+            self.samples.add_batch(results, context)
+        for strategy in self.strategies:
+            self.counts[strategy] += int(
+                np.count_nonzero(locations == strategy))
+        modelled = np.broadcast_to(results['Model Is Necessary'],
+                                   locations.shape)
+        if self.thresholds is not None:
+            self.count_thresholds(results['Costs'], results['QALYs'], modelled,
+                                  locations)
+        for strategy in self.strategies:
+            self.costs[strategy].add_batch(
+                np.asarray(results['Costs'][strategy])[modelled])
+            self.qalys[strategy].add_batch(
+                np.asarray(results['QALYs'][strategy])[modelled])
+
+    def count_thresholds(self, costs, qalys, modelled, locations):
+        '''
+        Count the optimal strategy at every threshold for each evaluation,
+        from the costs and QALYs of each strategy (NaN where it wasn't an
+        option). Evaluations that weren't modelled go to their location
+        whatever the threshold.
+        '''
+        size = len(locations)
+        costs = np.stack([
+            np.broadcast_to(np.asarray(costs[s], dtype=float), (size, ))
+            for s in self.strategies
+        ],
+                         axis=1)
+        qalys = np.stack([
+            np.broadcast_to(np.asarray(qalys[s], dtype=float), (size, ))
+            for s in self.strategies
+        ],
+                         axis=1)
+        columns = np.zeros((size, len(self.thresholds)), dtype=np.int64)
+        if modelled.any():
+            columns[modelled] = optimal_strategy.get_optimal_thresholds(
+                costs[modelled], qalys[modelled], self.thresholds,
+                ~np.isnan(costs[modelled]))
+        for s, strategy in enumerate(self.strategies):
+            columns[~modelled & (locations == strategy)] = s
+        cells = (np.arange(len(self.thresholds)) * len(self.strategies) +
+                 columns)
+        self.threshold_counts += np.bincount(
+            cells.ravel(), minlength=self.threshold_counts.size).reshape(
+                self.threshold_counts.shape)
+
+    def percents(self):
+        '''
+        Percent of evaluations in which each strategy was optimal
+        '''
+        return {
+            strategy: 100 * self.counts[strategy] / self.evals
+            for strategy in self.strategies
+        }
+
+    def threshold_percents(self):
+        '''
+        (thresholds x strategies) percent of evaluations in which each
+        strategy was optimal at each of the thresholds
+        '''
+        return 100 * self.threshold_counts / max(self.evals, 1)
+
+    def percent_intervals(self, z=1.96):
+        '''
+        Wilson score interval (z standard errors either side) on the percent
+        of evaluations in which each strategy was optimal, as (low, high)
+        pairs. Unlike the normal approximation it doesn't collapse to zero
+        width when a strategy is always or never optimal.
+        '''
+        intervals = {}
+        for strategy in self.strategies:
+            if self.evals == 0:
+                intervals[strategy] = (0.0, 100.0)
+                continue
+            p = self.counts[strategy] / self.evals
+            scale = 1 + z**2 / self.evals
+            centre = (p + z**2 / (2 * self.evals)) / scale
+            half_width = z / scale * np.sqrt(p * (1 - p) / self.evals + z**2 /
+                                             (4 * self.evals**2))
+            intervals[strategy] = (100 * max(centre - half_width, 0),
+                                   100 * min(centre + half_width, 1))
+        return intervals
+
+    def interval_width(self, z=1.96):
+        '''
+        Width, in percentage points, of the widest percent_intervals
+        '''
+        return max(high - low
+                   for low, high in self.percent_intervals(z).values())
+
+    def evals_needed(self, width, z=1.96):
+        '''
+        Evaluations after which every strategy's percent_intervals would be
+        at most width percentage points wide, if the proportions stayed
+        where they are now. Solves the Wilson width for the number of
+        evaluations, a quadratic.
+        '''
+        if self.evals == 0:
+            return 0
+        width = width / 100
+        needed = 0
+        for strategy in self.strategies:
+            p = self.counts[strategy] / self.evals
+            b = 4 * z**2 * p * (1 - p) - 2 * width**2 * z**2
+            discriminant = b**2 + 4 * width**2 * z**4 * (1 - width**2)
+            needed = max(needed, (b + np.sqrt(discriminant)) / (2 * width**2))
+        return int(np.ceil(needed))
+
+    def moments(self):
+        '''
+        Mean and SD of the cost and QALYs of each strategy, in the order of
+        moment_names, with 'N/A' where there were no (or too few) values
+        '''
+        values = []
+        for strategy in self.strategies:
+            for moments in (self.costs[strategy], self.qalys[strategy]):
+                for value in (moments.mean, moments.sd):
+                    if moments.count == 0 or np.isnan(value):
+                        values.append('N/A')
+                    else:
+                        values.append(value)
+        return values
+
+    @staticmethod
+    def moment_names(strategies, prefix=''):
+        names = []
+        for strategy in strategies:
+            for measure in ('Cost', 'QALYs'):
+                names.append(f'{prefix}Mean {strategy} {measure}')
+                names.append(f'{prefix}SD {strategy} {measure}')
+        return names
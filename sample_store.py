@@ -0,0 +1,515 @@
+'''
+Keeps every draw of a probabilistic run on disk, so it can be re-analysed
+(another ICER threshold, another question) without running the model
+again. Each draw is one record holding the argument set and analysis it
+belongs to, the sampled door times and LVO probability, and the cost and
+QALYs of every strategy over every horizon. With SETTINGS['Cost
+Components'] on it also holds the cost components behind every cost, so a
+store can be re-analysed under other prices too (--year and --price).
+
+Records are buffered in each process and written out as .npy segments of
+about SEGMENT_ROWS records, alongside a small file with the argument sets
+they came from, and index.json lists the segments once the run is done.
+SampleStore opens them again as memory maps, so nothing is read until it
+is used and a store can be much bigger than memory:
+
+    store = sample_store.SampleStore('output/samples')
+    for segment in store.segments():
+        segment['costs'][:, horizon, strategy] ...
+
+Like instrumentation, recording is off (every call returns straight away)
+until open_writer() is called, see SETTINGS['Probabilistic Model']['Sample
+Store'] in main.py.
+'''
+
+import argparse
+import glob
+import json
+import os
+import uuid
+import numpy as np
+import cohort
+import constants
+import optimal_strategy
+
+SEGMENT_ROWS = 1 << 18
+
+# The sampled inputs, in a model context's times (and p_lvo)
+INPUTS = [
+    'door_needle_primary', 'door_needle_comprehensive',
+    'door_to_intra_arterial', 'p_lvo'
+]
+
+SET_VARIABLES = [
+    'sex', 'age', 'RACE', 'time_since_symptoms', 'time_to_primary',
+    'time_to_comprehensive', 'transfer_time'
+]
+
+SET_DTYPE = np.dtype([('set', np.int64)] + [(name, np.float64)
+                                            for name in SET_VARIABLES])
+
+WRITER = None
+
+
+def sample_dtype(horizons, strategies, components=0):
+    '''
+    Record of a single draw, with costs and QALYs indexed by horizon and
+    then strategy, and the cost components (if any) by horizon, strategy
+    and then component
+    '''
+    fields = ([('set', np.int64), ('analysis', np.int8),
+               ('model_is_necessary', np.bool_),
+               ('ship_is_feasible', np.bool_)] + [(name, np.float64)
+                                                  for name in INPUTS] +
+              [('costs', np.float64, (horizons, strategies)),
+               ('qalys', np.float64, (horizons, strategies))])
+    if components:
+        fields.append(('cost_components', np.float64, (horizons, strategies,
+                                                       components)))
+    return np.dtype(fields)
+
+
+def segment_paths(directory):
+    return sorted(
+        path for path in glob.glob(os.path.join(directory, 'segment-*.npy'))
+        if not path.endswith('-sets.npy'))
+
+
+def sets_path(path):
+    return path[:-len('.npy')] + '-sets.npy'
+
+
+def prepare(directory):
+    '''
+    Make directory ready for a new run, removing the segments and index of
+    any earlier one (nothing else in it is touched)
+    '''
+    os.makedirs(directory, exist_ok=True)
+    for path in segment_paths(directory):
+        os.remove(path)
+        if os.path.exists(sets_path(path)):
+            os.remove(sets_path(path))
+    if os.path.exists(os.path.join(directory, 'index.json')):
+        os.remove(os.path.join(directory, 'index.json'))
+
+
+def truncate(directory, sets):
+    '''
+    Drop the draws of every set from index sets on from the segments in
+    directory (and the index, which is written again at the end of a run),
+    for resuming a run from a checkpoint with the first sets done
+    '''
+    os.makedirs(directory, exist_ok=True)
+    for path in segment_paths(directory):
+        segment = np.load(path)
+        keep = segment['set'] < sets
+        if keep.all():
+            continue
+        set_records = np.load(sets_path(path))
+        if not keep.any():
+            os.remove(path)
+            os.remove(sets_path(path))
+            continue
+        for name, array in ((sets_path(path),
+                             set_records[set_records['set'] < sets]),
+                            (path, segment[keep])):
+            with open(name + '.tmp', 'wb') as f:
+                np.save(f, array)
+            os.replace(name + '.tmp', name)
+    if os.path.exists(os.path.join(directory, 'index.json')):
+        os.remove(os.path.join(directory, 'index.json'))
+
+
+class SampleWriter(object):
+    '''
+    Buffers draws and writes them to directory a segment at a time. Every
+    writer names its segments with a random token, so writers in different
+    processes can share a directory.
+    '''
+
+    def __init__(self,
+                 directory,
+                 horizons,
+                 strategies,
+                 segment_rows=None,
+                 components=0):
+        self.directory = directory
+        self.strategies = strategies
+        self.components = components
+        self.dtype = sample_dtype(horizons, len(strategies), components)
+        self.segment_rows = segment_rows or SEGMENT_ROWS
+        self.token = uuid.uuid4().hex[:12]
+        self.written = 0
+        self.buffer = []
+        self.buffered = 0
+        self.sets = []
+        self.set_index = None
+
+    def start_set(self, index, arguments):
+        self.set_index = index
+        record = np.zeros(1, dtype=SET_DTYPE)
+        record['set'] = index
+        for name in SET_VARIABLES:
+            record[name] = arguments[name]
+        self.sets.append(record)
+
+    def add(self, analysis, context, horizon_results):
+        '''
+        Record a single draw, the run_model results over each horizon
+        '''
+        record = np.zeros(1, dtype=self.dtype)
+        record['analysis'] = analysis
+        record['model_is_necessary'] = (
+            horizon_results[0]['Location with Maximum Benefit']
+            != 'Based on cutoff')
+        record['ship_is_feasible'] = not isinstance(
+            horizon_results[0]['Costs']['Drip and Ship'], str)
+        for h, results in enumerate(horizon_results):
+            for s, strategy in enumerate(self.strategies):
+                cost = results['Costs'][strategy]
+                if isinstance(cost, str) or not record['model_is_necessary']:
+                    record['costs'][0, h, s] = np.nan
+                    record['qalys'][0, h, s] = np.nan
+                    if self.components:
+                        record['cost_components'][0, h, s] = np.nan
+                else:
+                    record['costs'][0, h, s] = cost
+                    record['qalys'][0, h, s] = results['QALYs'][strategy]
+                    if self.components:
+                        record['cost_components'][0, h, s] = (
+                            results['Cost Components'][strategy])
+        self.append(record, context)
+
+    def add_batch(self, analysis, context, horizon_results):
+        '''
+        Record a batch of draws, the run_model_batch results over each
+        horizon
+        '''
+        first = horizon_results[0]
+        size = np.asarray(first['Optimal Location']).size
+        records = np.zeros(size, dtype=self.dtype)
+        records['analysis'] = analysis
+        records['model_is_necessary'] = first['Model Is Necessary']
+        records['ship_is_feasible'] = first['Drip and Ship Feasible']
+        for h, results in enumerate(horizon_results):
+            for s, strategy in enumerate(self.strategies):
+                records['costs'][:, h, s] = results['Costs'][strategy]
+                records['qalys'][:, h, s] = results['QALYs'][strategy]
+                if self.components:
+                    records['cost_components'][:, h, s] = (
+                        results['Cost Components'][strategy])
+        # The batched model costs every draw, but like add only the ones it
+        # was needed for are kept
+        cutoff = ~records['model_is_necessary']
+        records['costs'][cutoff] = np.nan
+        records['qalys'][cutoff] = np.nan
+        if self.components:
+            records['cost_components'][cutoff] = np.nan
+        self.append(records, context)
+
+    def append(self, records, context):
+        records['set'] = self.set_index
+        for name in INPUTS:
+            if name == 'p_lvo':
+                records[name] = context.p_lvo
+            else:
+                records[name] = getattr(context.times, name)
+        self.buffer.append(records)
+        self.buffered += len(records)
+        if self.buffered >= self.segment_rows:
+            self.flush()
+
+    def flush(self):
+        '''
+        Write whatever is buffered as a new segment. Segments are written
+        under a temporary name and then renamed, so a segment-*.npy file is
+        always complete.
+        '''
+        if not self.buffer:
+            return
+        path = os.path.join(self.directory,
+                            f'segment-{self.token}-{self.written:06d}.npy')
+        for name, array in ((sets_path(path), np.concatenate(self.sets)),
+                            (path, np.concatenate(self.buffer))):
+            with open(name + '.tmp', 'wb') as f:
+                np.save(f, array)
+            os.replace(name + '.tmp', name)
+        self.written += 1
+        self.buffer = []
+        self.buffered = 0
+        # The current set may carry on into the next segment
+        self.sets = self.sets[-1:]
+
+
+def open_writer(directory,
+                horizons,
+                strategies,
+                segment_rows=None,
+                components=0):
+    global WRITER
+    WRITER = SampleWriter(directory, horizons, strategies, segment_rows,
+                          components)
+
+
+def close_writer():
+    global WRITER
+    if WRITER is not None:
+        WRITER.flush()
+    WRITER = None
+
+
+def flush():
+    if WRITER is not None:
+        WRITER.flush()
+
+
+def start_set(index, arguments):
+    if WRITER is not None:
+        WRITER.start_set(index, arguments)
+
+
+def record(analysis, context, horizon_results):
+    if WRITER is not None:
+        WRITER.add(analysis, context, horizon_results)
+
+
+def record_batch(analysis, context, horizon_results):
+    if WRITER is not None:
+        WRITER.add_batch(analysis, context, horizon_results)
+
+
+def write_index(directory, metadata):
+    '''
+    List the segments in directory, with how many draws each holds, in
+    index.json along with metadata (settings etc.) about the run
+    '''
+    segments = []
+    for path in segment_paths(directory):
+        rows = np.load(path, mmap_mode='r').shape[0]
+        segments.append({'file': os.path.basename(path), 'rows': rows})
+    index = dict(metadata)
+    index['segments'] = segments
+    index['rows'] = sum(segment['rows'] for segment in segments)
+    with open(os.path.join(directory, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=2)
+
+
+class SampleStore(object):
+    '''
+    Read only view of a store written by a run. Segments are opened as
+    memory maps when asked for, so only the pages actually touched are
+    ever read.
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'index.json')) as f:
+            self.index = json.load(f)
+        self.strategies = self.index['Strategies']
+        self.horizons = self.index['Horizons']
+        self.analyses = self.index['Analyses']
+        self.files = [
+            os.path.join(directory, segment['file'])
+            for segment in self.index['segments']
+        ]
+        self._sets = None
+
+    def __len__(self):
+        return self.index['rows']
+
+    def segment(self, i):
+        return np.load(self.files[i], mmap_mode='r')
+
+    def segments(self):
+        '''
+        Yields every segment, as a memory mapped record array
+        '''
+        for i in range(len(self.files)):
+            yield self.segment(i)
+
+    @property
+    def sets(self):
+        '''
+        Argument set of every set index in the store, sorted by index
+        '''
+        if self._sets is None:
+            sets = np.concatenate(
+                [np.load(sets_path(path)) for path in self.files]
+                or [np.zeros(0, dtype=SET_DTYPE)])
+            _, first = np.unique(sets['set'], return_index=True)
+            self._sets = sets[first]
+        return self._sets
+
+    def component_prices(self, year=None, prices=None):
+        '''
+        Price of each cost component (see constants.COST_COMPONENTS); the
+        ones the run used, or the published prices inflated to year, with
+        any of prices (a dict of price name, e.g. 'EVT', to price) swapped
+        in (only the single prices, DEATH, IVT, EVT and TRANSFER, can be)
+        '''
+        if year is None:
+            component_prices = np.array(self.index['Component Prices'])
+        else:
+            component_prices = constants.cost_component_prices(
+                constants.Costs.inflated(constants.BASE_PRICES, year))
+        for name, price in (prices or {}).items():
+            matched = [
+                component == name and state is None
+                for component, state in constants.COST_COMPONENTS
+            ]
+            if not any(matched):
+                raise ValueError(f'{name} is not one of the single prices '
+                                 'in constants.Costs')
+            component_prices[matched] = price
+        return component_prices
+
+    def costs(self, segment, horizon=0, prices=None):
+        '''
+        (draws, strategies) costs of every draw in segment, re-priced with
+        prices (see component_prices) if given, which needs a store with
+        cost components
+        '''
+        if prices is None:
+            return np.array(segment['costs'][:, horizon])
+        if 'cost_components' not in segment.dtype.names:
+            raise ValueError(f'the store in {self.directory} has no cost '
+                             'components to re-price, run with SETTINGS'
+                             '[\'Cost Components\'] on')
+        components = cohort.reprice(segment['cost_components'][:, horizon],
+                                    self.index['Component Prices'], prices)
+        return components.sum(axis=-1)
+
+    def net_benefits(self, segment, icer_threshold, horizon=0, prices=None):
+        '''
+        (draws, strategies) net monetary benefit of every draw in segment,
+        NaN where a strategy wasn't an option or the model wasn't needed
+        (the RACE cutoff decided), whether the run was batched or not
+        '''
+        return (icer_threshold * segment['qalys'][:, horizon] -
+                self.costs(segment, horizon, prices))
+
+    def optimal(self, segment, icer_threshold, horizon=0, prices=None):
+        '''
+        Column of the optimal strategy for every draw in segment at
+        icer_threshold, the same as the model would have picked (under
+        prices, see costs)
+        '''
+        costs = self.costs(segment, horizon, prices)
+        qalys = np.array(segment['qalys'][:, horizon])
+        available = np.ones(costs.shape, dtype=bool)
+        available[:, self.strategies.index('Drip and Ship')] = (
+            segment['ship_is_feasible'])
+        necessary = np.asarray(segment['model_is_necessary'])
+        # Draws decided by the RACE cutoff have no costs, so give them
+        # something harmless before overriding them below
+        costs[~necessary] = 0
+        qalys[~necessary] = 0
+        available[~necessary] = True
+        optimal, _ = optimal_strategy.get_optimal_batch(
+            costs, qalys, icer_threshold, available)
+        sets = self.sets
+        race = sets['RACE'][np.searchsorted(sets['set'],
+                                            segment['set'][~necessary])]
+        locations = constants.no_tx_where_to_go(race)
+        cutoff = np.zeros(len(locations), dtype=optimal.dtype)
+        for s, strategy in enumerate(self.strategies):
+            cutoff[locations == strategy] = s
+        optimal[~necessary] = cutoff
+        return optimal
+
+    def percent_optimal(self, icer_threshold, horizon=0, prices=None):
+        '''
+        (sets, analyses, strategies) percent of draws in which each
+        strategy is optimal at icer_threshold (and prices, see costs), with
+        the sets in the order of the sets property. Goes through the store a
+        segment at a time.
+        '''
+        sets = self.sets
+        counts = np.zeros(
+            (len(sets), len(self.analyses), len(self.strategies)))
+        for segment in self.segments():
+            optimal = self.optimal(segment, icer_threshold, horizon, prices)
+            cells = np.ravel_multi_index((np.searchsorted(
+                sets['set'], segment['set']), segment['analysis'], optimal),
+                                         counts.shape)
+            counts += np.bincount(cells,
+                                  minlength=counts.size).reshape(counts.shape)
+        totals = counts.sum(axis=2, keepdims=True)
+        return 100 * counts / np.where(totals == 0, 1, totals)
+
+    def write_percent_optimal(self,
+                              path,
+                              icer_threshold,
+                              horizon=0,
+                              prices=None):
+        '''
+        percent_optimal as a csv file laid out like the probabilistic model
+        output
+        '''
+        percents = self.percent_optimal(icer_threshold, horizon, prices)
+        header = list(SET_VARIABLES)
+        for analysis in self.analyses:
+            prefix = '' if len(self.analyses) == 1 else analysis + ' '
+            header.extend(f'{prefix}Percent {strategy}'
+                          for strategy in self.strategies)
+        with open(path, 'w') as f:
+            f.write(','.join(header + ['Horizon']) + '\n')
+            for record, set_percents in zip(self.sets, percents):
+                row = [
+                    int(record[name]) if name in ('sex',
+                                                  'age') else record[name]
+                    for name in SET_VARIABLES
+                ]
+                row.extend(set_percents.ravel())
+                f.write(','.join(map(str, row + [self.horizons[horizon]])) +
+                        '\n')
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(
+        description='re-analyse a stored probabilistic run')
+    PARSER.add_argument('store', help='directory of the sample store')
+    PARSER.add_argument('--threshold',
+                        type=float,
+                        default=None,
+                        help='ICER threshold, the run\'s by default')
+    PARSER.add_argument('--horizon',
+                        default=None,
+                        help='horizon label, the first of the run\'s by '
+                        'default')
+    PARSER.add_argument('--out',
+                        default=None,
+                        help='csv to write the percent optimal to')
+    PARSER.add_argument('--year',
+                        type=int,
+                        default=None,
+                        help='re-price with the published costs inflated '
+                        'to this year (needs cost components)')
+    PARSER.add_argument('--price',
+                        action='append',
+                        default=[],
+                        metavar='NAME=PRICE',
+                        help='re-price with this price, e.g. EVT=12000 '
+                        '(needs cost components), can be given more than '
+                        'once')
+    ARGS = PARSER.parse_args()
+    STORE = SampleStore(ARGS.store)
+    PRICES = None
+    if ARGS.year is not None or ARGS.price:
+        PRICES = STORE.component_prices(
+            ARGS.year, {
+                name: float(price)
+                for name, price in (item.split('=') for item in ARGS.price)
+            })
+    THRESHOLD = ARGS.threshold
+    if THRESHOLD is None:
+        THRESHOLD = STORE.index['ICER Threshold']
+    HORIZON = 0
+    if ARGS.horizon is not None:
+        HORIZON = STORE.horizons.index(ARGS.horizon)
+    OUT = ARGS.out
+    if OUT is None:
+        OUT = os.path.join(ARGS.store, f'percent_optimal_{THRESHOLD:g}.csv')
+    STORE.write_percent_optimal(OUT, THRESHOLD, HORIZON, PRICES)
+    print(f'{len(STORE)} draws of {len(STORE.sets)} sets re-analysed at '
+          f'{THRESHOLD:g} per QALY, written to {OUT}')
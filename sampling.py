@@ -0,0 +1,209 @@
+'''
+Quasi-random alternatives to plain Monte Carlo draws for the probabilistic
+model and the random scenario generator. Points in the unit hypercube come
+from a scrambled Sobol sequence or a Latin hypercube and are handed to the
+model through Points, which stands in for a numpy RandomState, so the
+sampling functions in constants and ais_outcomes don't need to change.
+
+Both spread the samples out more evenly than independent uniform draws,
+so percent optimal estimates settle down with fewer evaluations.
+'''
+
+import numpy as np
+
+METHODS = ['Monte Carlo', 'Sobol', 'Latin Hypercube']
+
+# Bits in each Sobol coordinate, enough for 2^30 points
+SOBOL_BITS = 30
+
+# Joe and Kuo's (2008) direction numbers for the dimensions after the
+# first: the degree s of the primitive polynomial, its coefficients a and
+# the initial m values. The first dimension is just the van der Corput
+# sequence.
+SOBOL_DIRECTIONS = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]),
+    (5, 2, [1, 1, 5, 5, 17]),
+    (5, 4, [1, 1, 5, 5, 5]),
+    (5, 7, [1, 1, 7, 11, 19]),
+    (5, 11, [1, 1, 5, 1, 1]),
+    (5, 13, [1, 1, 1, 3, 11]),
+    (5, 14, [1, 3, 5, 5, 31]),
+]
+MAX_DIMENSIONS = len(SOBOL_DIRECTIONS) + 1
+
+
+def sobol_direction_numbers(dimensions, bits=SOBOL_BITS):
+    '''
+    (dimensions, bits) array of Sobol direction numbers as integers
+    '''
+    if dimensions > MAX_DIMENSIONS:
+        raise ValueError(f'Sobol sequence limited to {MAX_DIMENSIONS} '
+                         'dimensions')
+    directions = np.zeros((dimensions, bits), dtype=np.int64)
+    directions[0] = [1 << (bits - k) for k in range(1, bits + 1)]
+    for d in range(1, dimensions):
+        s, a, initial = SOBOL_DIRECTIONS[d - 1]
+        m = list(initial)
+        for k in range(s, bits):
+            value = m[k - s] ^ (m[k - s] << s)
+            for j in range(1, s):
+                if (a >> (s - 1 - j)) & 1:
+                    value ^= m[k - j] << j
+            m.append(value)
+        directions[d] = [m[k] << (bits - 1 - k) for k in range(bits)]
+    return directions
+
+
+def scramble_direction_numbers(directions, random_state, bits=SOBOL_BITS):
+    '''
+    Linear matrix scramble: multiply each dimension's direction numbers
+    (as bit vectors, most significant bit first) by a random lower
+    triangular binary matrix with a unit diagonal
+    '''
+    scrambled = np.zeros_like(directions)
+    positions = np.arange(bits - 1, -1, -1, dtype=np.int64)
+    for d in range(directions.shape[0]):
+        matrix = np.tril(random_state.randint(0, 2, size=(bits, bits)), -1)
+        matrix += np.eye(bits, dtype=matrix.dtype)
+        columns = (directions[d][:, None] >> positions[None, :]) & 1
+        rows = (columns @ matrix.T) % 2
+        scrambled[d] = np.sum(rows << positions[None, :], axis=1)
+    return scrambled
+
+
+class Sobol(object):
+    '''
+    Scrambled (linear matrix scramble plus a random digital shift) Sobol
+    sequence. Consecutive calls to points continue the sequence, so a run
+    that is extended in rounds still sees one sequence.
+    '''
+
+    def __init__(self, dimensions, random_state=np.random):
+        self.dimensions = dimensions
+        self.directions = scramble_direction_numbers(
+            sobol_direction_numbers(dimensions), random_state)
+        self.shift = random_state.randint(0, 1 << SOBOL_BITS, size=dimensions)
+        self.index = 0
+
+    def points(self, size=None):
+        number = 1 if size is None else size
+        indices = np.arange(self.index, self.index + number, dtype=np.int64)
+        self.index += number
+        values = np.tile(self.shift.astype(np.int64), (number, 1))
+        for bit in range(int(indices[-1]).bit_length()):
+            chosen = ((indices >> bit) & 1).astype(bool)
+            values[chosen] ^= self.directions[:, bit]
+        # Centre of the cell so no coordinate is exactly 0
+        return Points((values + 0.5) / (1 << SOBOL_BITS), size is None)
+
+
+class LatinHypercube(object):
+    '''
+    Latin hypercubes of design_size points, with every dimension split
+    into design_size equal strata and each stratum sampled exactly once.
+    Points are handed out in the (random) order of the design and a fresh
+    design is drawn once one runs out, so only whole designs are fully
+    stratified.
+    '''
+
+    def __init__(self, dimensions, design_size, random_state=np.random):
+        self.dimensions = dimensions
+        self.design_size = design_size
+        self.random_state = random_state
+        self.design = np.empty((0, dimensions))
+
+    def new_design(self):
+        strata = np.stack([
+            self.random_state.permutation(self.design_size)
+            for _ in range(self.dimensions)
+        ],
+                          axis=1)
+        jitter = self.random_state.uniform(size=(self.design_size,
+                                                 self.dimensions))
+        return (strata + jitter) / self.design_size
+
+    def points(self, size=None):
+        number = 1 if size is None else size
+        while len(self.design) < number:
+            self.design = np.concatenate([self.design, self.new_design()])
+        points, self.design = self.design[:number], self.design[number:]
+        return Points(points, size is None)
+
+
+class MonteCarlo(object):
+    '''
+    Plain independent draws, straight from the random state
+    '''
+
+    def __init__(self, random_state=np.random):
+        self.random_state = random_state
+
+    def points(self, size=None):
+        return self.random_state
+
+
+class Points(object):
+    '''
+    A block of points in the unit hypercube (one row per sample) standing
+    in for a numpy RandomState. Each uniform or randint call takes the next
+    column, i.e. the next dimension, and scales it to the range asked for,
+    so code that draws from a RandomState draws these points instead.
+    When scalar is True there's a single point and draws are plain
+    numbers.
+    '''
+
+    def __init__(self, points, scalar=False):
+        self.points = points
+        self.scalar = scalar
+        self.column = 0
+
+    def next_column(self, size):
+        if self.column == self.points.shape[1]:
+            raise ValueError('more random inputs than sampled dimensions')
+        if not self.scalar and size != len(self.points):
+            raise ValueError(f'asked for {size} samples from a block of '
+                             f'{len(self.points)}')
+        column = self.points[:, self.column]
+        self.column += 1
+        return column[0] if self.scalar else column
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        return low + (np.asarray(high) - low) * self.next_column(size)
+
+    def randint(self, low, high=None, size=None):
+        # Same half open range as RandomState.randint
+        if high is None:
+            low, high = 0, low
+        values = low + np.floor((high - low) * self.next_column(size))
+        return int(values) if self.scalar else values.astype(int)
+
+    def rows(self):
+        '''
+        Every point as its own scalar Points
+        '''
+        return [Points(self.points[i:i + 1], True) for i in range(len(self))]
+
+    def __len__(self):
+        return len(self.points)
+
+
+def create(method, dimensions, random_state=np.random, design_size=None):
+    '''
+    Sampler for one of METHODS over dimensions uncertain inputs. Calling its
+    points(size) gives something to draw size samples of every input from
+    (a RandomState or a Points). design_size is the number of points in
+    each Latin hypercube, the number of samples that will usually be drawn.
+    '''
+    if method == 'Monte Carlo':
+        return MonteCarlo(random_state)
+    if method == 'Sobol':
+        return Sobol(dimensions, random_state)
+    if method == 'Latin Hypercube':
+        return LatinHypercube(dimensions, design_size or 1, random_state)
+    raise ValueError(f'unknown sampling method {method}, '
+                     f'expected one of {METHODS}')
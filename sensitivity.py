@@ -0,0 +1,375 @@
+'''
+Deterministic sensitivity analyses. Any model parameter (see PARAMETERS),
+or pair of them, is swept over a range and a set of scenarios is run
+through the batched model at every point, with the default (non-random)
+times and LVO probability.
+
+    python sensitivity.py list
+    python sensitivity.py one-way --points 7 --workers 4
+    python sensitivity.py two-way --parameters "utility mRS 2" "cost EVT"
+
+One-way sweeps write tornado and threshold data as well as the raw
+results; everything goes to output/sensitivity.
+
+Sweep points run in parallel worker processes, each handed whole sweeps
+at a time. Utilities and the annual and death costs only change the
+prices of cohort.VALUE_VECTORS, which rebuilds its vectors from the
+survival sums it has stored, so sweeping those never traces the life
+tables again; only the mortality hazards do.
+'''
+
+import argparse
+import concurrent.futures
+import itertools
+import os
+import time
+import numpy as np
+import ais_outcomes as ais
+import constants
+import main
+
+DEFAULT_PATH = os.path.join('output', 'sensitivity')
+# Default sweep is the base value +/- this fraction
+SPREAD = 0.25
+
+
+class Parameter(object):
+    '''
+    A model parameter held in owner, which is either a dict (with key) or
+    an object (with key the attribute name), optionally kept within
+    bounds when swept
+    '''
+
+    def __init__(self, owner, key, bounds=(None, None)):
+        self.owner = owner
+        self.key = key
+        self.bounds = bounds
+
+    def get(self):
+        if isinstance(self.owner, dict):
+            return self.owner[self.key]
+        return getattr(self.owner, self.key)
+
+    def set(self, value):
+        if isinstance(self.owner, dict):
+            self.owner[self.key] = value
+        else:
+            setattr(self.owner, self.key, value)
+
+    def values(self, points=5, spread=SPREAD, low=None, high=None):
+        '''
+        points values evenly spaced from low to high, by default spread
+        either side of the current value and kept within the bounds
+        '''
+        base = self.get()
+        low = base - abs(base) * spread if low is None else low
+        high = base + abs(base) * spread if high is None else high
+        lower, upper = self.bounds
+        if lower is not None:
+            low = max(low, lower)
+        if upper is not None:
+            high = min(high, upper)
+        return np.linspace(low, high, points)
+
+
+def get_parameters():
+    '''
+    Every parameter that can be swept, by name
+    '''
+    parameters = {}
+    for state in range(constants.States.MRS_0, constants.States.DEATH):
+        label = f'mRS {state - constants.States.MRS_0}'
+        parameters[f'utility {label}'] = Parameter(constants.UTILITIES, state,
+                                                   (0, 1))
+        parameters[f'hazard {label}'] = Parameter(constants.HAZARDS_MORTALITY,
+                                                  state, (1, None))
+        parameters[f'cost annual {label}'] = Parameter(constants.Costs.ANNUAL,
+                                                       state, (0, None))
+        parameters[f'cost 90 day ischemic {label}'] = Parameter(
+            constants.Costs.DAYS_90_ISCHEMIC, state, (0, None))
+        parameters[f'cost 90 day ICH {label}'] = Parameter(
+            constants.Costs.DAYS_90_ICH, state, (0, None))
+    for name, attribute in (('death', 'DEATH'), ('IVT', 'IVT'), ('EVT', 'EVT'),
+                            ('transfer', 'TRANSFER')):
+        parameters[f'cost {name}'] = Parameter(constants.Costs, attribute,
+                                               (0, None))
+    for name in constants.TIME_LIMITS:
+        parameters[f'time limit {name}'] = Parameter(constants.TIME_LIMITS,
+                                                     name, (0, None))
+    # Only the central curve; the bounds are only read when the LVO
+    # probability is random, which it never is in evaluate
+    for name in ['b0', 'b1']:
+        parameters[f'LVO {name}'] = Parameter(ais.LVO_COEFFICIENTS, name)
+    return parameters
+
+
+PARAMETERS = get_parameters()
+
+
+def scenario_arrays(scenarios):
+    '''
+    A list of argument sets as one argument set of arrays, for
+    main.run_model_batch
+    '''
+    return {
+        name: np.array([scenario[name] for scenario in scenarios])
+        for name in main.INPUT_VARIABLES
+    }
+
+
+def evaluate(arguments, overrides=()):
+    '''
+    Run the scenarios (see scenario_arrays) with the (parameter name,
+    value) overrides in place, putting the parameters back afterwards.
+    Returns the index into main.STRATEGIES of each scenario's optimal
+    location, whether the model was needed and the (scenarios x
+    strategies) costs and QALYs.
+    '''
+    saved = [(PARAMETERS[name], PARAMETERS[name].get())
+             for name, _ in overrides]
+    try:
+        for name, value in overrides:
+            PARAMETERS[name].set(value)
+        results = main.run_model_batch(
+            main.get_context(arguments, False, False))
+    finally:
+        for parameter, value in saved:
+            parameter.set(value)
+    optimal = np.zeros(len(results['Optimal Location']), dtype=int)
+    for i, strategy in enumerate(main.STRATEGIES):
+        optimal[results['Optimal Location'] == strategy] = i
+    return {
+        'optimal': optimal,
+        'necessary': np.array(results['Model Is Necessary']),
+        'costs': np.stack([results['Costs'][s] for s in main.STRATEGIES],
+                          axis=1),
+        'qalys': np.stack([results['QALYs'][s] for s in main.STRATEGIES],
+                          axis=1)
+    }
+
+
+def evaluate_sweep(arguments, sweep):
+    '''
+    evaluate at every point of a sweep, a list of override lists. Worker
+    entry point.
+    '''
+    return [evaluate(arguments, overrides) for overrides in sweep]
+
+
+def run_sweeps(arguments, sweeps, workers=1):
+    '''
+    Results of every point of every sweep, in order. With more than one
+    worker each sweep goes to one worker process whole, so its points
+    share that process's value vector cache.
+    '''
+    if workers <= 1:
+        return [evaluate_sweep(arguments, sweep) for sweep in sweeps]
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=main.initialize_worker,
+            initargs=(main.SETTINGS,
+                      constants.Costs.get_prices())) as executor:
+        return list(
+            executor.map(evaluate_sweep, itertools.repeat(arguments), sweeps))
+
+
+def net_benefit(results):
+    '''
+    Net monetary benefit (at the ICER threshold) of each scenario's optimal
+    strategy, NaN where the RACE cutoff decided
+    '''
+    threshold = main.SETTINGS['ICER Threshold']
+    rows = np.arange(len(results['optimal']))
+    benefit = (threshold * results['qalys'][rows, results['optimal']] -
+               results['costs'][rows, results['optimal']])
+    return np.where(results['necessary'], benefit, np.nan)
+
+
+def one_way(scenarios,
+            names=None,
+            points=5,
+            spread=SPREAD,
+            workers=1,
+            ranges=None):
+    '''
+    Sweep each of the named parameters (all of them by default) on its own
+    over points values (see Parameter.values, or give a (low, high) for a
+    parameter in ranges). Returns the base case results and, for each
+    parameter, its values and the results at each one.
+    '''
+    names = list(PARAMETERS) if names is None else names
+    ranges = ranges if ranges is not None else {}
+    arguments = scenario_arrays(scenarios)
+    values = {
+        name:
+        PARAMETERS[name].values(points, spread,
+                                *ranges.get(name, (None, None)))
+        for name in names
+    }
+    sweeps = [[[(name, value)] for value in values[name]] for name in names]
+    base = evaluate(arguments)
+    results = run_sweeps(arguments, sweeps, workers)
+    return base, {
+        name: (values[name], sweep_results)
+        for name, sweep_results in zip(names, results)
+    }
+
+
+def two_way(scenarios, first, second, points=5, spread=SPREAD, workers=1):
+    '''
+    Sweep two parameters together over a points x points grid. Returns the
+    values of each and, indexed [i][j], the results at each pair.
+    '''
+    arguments = scenario_arrays(scenarios)
+    first_values = PARAMETERS[first].values(points, spread)
+    second_values = PARAMETERS[second].values(points, spread)
+    sweeps = [[[(first, a), (second, b)] for b in second_values]
+              for a in first_values]
+    return first_values, second_values, run_sweeps(arguments, sweeps, workers)
+
+
+def tornado(base, sweeps):
+    '''
+    For each parameter, the mean net benefit of the optimal strategies at
+    the low and high ends of its sweep, the swing between them and the
+    number of scenarios whose optimal location differs from the base case
+    at either end. Sorted by swing, biggest first, the order of the bars
+    in a tornado diagram.
+    '''
+    base_benefit = np.nanmean(net_benefit(base))
+    rows = []
+    for name, (values, results) in sweeps.items():
+        low = np.nanmean(net_benefit(results[0]))
+        high = np.nanmean(net_benefit(results[-1]))
+        rows.append({
+            'Parameter':
+            name,
+            'Low Value':
+            values[0],
+            'High Value':
+            values[-1],
+            'Base Net Benefit':
+            base_benefit,
+            'Low Net Benefit':
+            low,
+            'High Net Benefit':
+            high,
+            'Swing':
+            abs(high - low),
+            'Decisions Changed at Low':
+            int(np.count_nonzero(results[0]['optimal'] != base['optimal'])),
+            'Decisions Changed at High':
+            int(np.count_nonzero(results[-1]['optimal'] != base['optimal']))
+        })
+    rows.sort(key=lambda row: -np.nan_to_num(row['Swing']))
+    return rows
+
+
+def thresholds(sweeps):
+    '''
+    Every place a scenario's optimal location changes between neighbouring
+    points of a parameter's sweep: the parameter, the scenario (by index),
+    the values either side and the locations before and after. More sweep
+    points narrow these down.
+    '''
+    rows = []
+    for name, (values, results) in sweeps.items():
+        for k in range(len(values) - 1):
+            before = results[k]['optimal']
+            after = results[k + 1]['optimal']
+            for scenario in np.flatnonzero(before != after):
+                rows.append({
+                    'Parameter': name,
+                    'Scenario': int(scenario),
+                    'Below': values[k],
+                    'Above': values[k + 1],
+                    'From': main.STRATEGIES[before[scenario]],
+                    'To': main.STRATEGIES[after[scenario]]
+                })
+    return rows
+
+
+def write_csv(path, rows, columns=None):
+    if columns is None:
+        columns = list(rows[0]) if rows else []
+    with open(path, 'w') as f:
+        f.write(','.join(columns) + '\n')
+        for row in rows:
+            f.write(','.join(str(row[column]) for column in columns) + '\n')
+
+
+def result_rows(scenarios, results, labels):
+    '''
+    Output rows of the results of one sweep point, labels holding the
+    parameter values
+    '''
+    rows = []
+    for i, scenario in enumerate(scenarios):
+        row = dict(labels)
+        row.update({name: scenario[name] for name in main.INPUT_VARIABLES})
+        row['Optimal Location'] = main.STRATEGIES[results['optimal'][i]]
+        row['Model Is Necessary'] = bool(results['necessary'][i])
+        for j, strategy in enumerate(main.STRATEGIES):
+            row[f'{strategy} Cost'] = results['costs'][i, j]
+            row[f'{strategy} QALYs'] = results['qalys'][i, j]
+        rows.append(row)
+    return rows
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument('command', choices=['list', 'one-way', 'two-way'])
+    PARSER.add_argument('--parameters',
+                        nargs='+',
+                        help='names from the list command, all of them for '
+                        'one-way by default')
+    PARSER.add_argument('--scenarios', default='input/scenarios.csv')
+    PARSER.add_argument('--points', type=int, default=5)
+    PARSER.add_argument('--spread', type=float, default=SPREAD)
+    PARSER.add_argument('--workers', type=int, default=1)
+    PARSER.add_argument('--path', default=DEFAULT_PATH)
+    ARGS = PARSER.parse_args()
+    constants.Costs.inflate(2016)
+
+    if ARGS.command == 'list':
+        for NAME, PARAMETER in PARAMETERS.items():
+            print(f'{NAME:<36}{PARAMETER.get()}')
+    else:
+        if not os.path.isdir(ARGS.path):
+            os.makedirs(ARGS.path)
+        SCENARIOS = list(main.read_input_file(ARGS.scenarios))
+        START = time.time()
+        if ARGS.command == 'one-way':
+            BASE, SWEEPS = one_way(SCENARIOS, ARGS.parameters, ARGS.points,
+                                   ARGS.spread, ARGS.workers)
+            ROWS = []
+            for NAME, (VALUES, RESULTS) in SWEEPS.items():
+                for VALUE, POINT in zip(VALUES, RESULTS):
+                    ROWS.extend(
+                        result_rows(SCENARIOS, POINT, {
+                            'Parameter': NAME,
+                            'Value': VALUE
+                        }))
+            write_csv(os.path.join(ARGS.path, 'one_way.csv'), ROWS)
+            write_csv(os.path.join(ARGS.path, 'tornado.csv'),
+                      tornado(BASE, SWEEPS))
+            write_csv(
+                os.path.join(ARGS.path, 'thresholds.csv'), thresholds(SWEEPS),
+                ['Parameter', 'Scenario', 'Below', 'Above', 'From', 'To'])
+        else:
+            if not ARGS.parameters or len(ARGS.parameters) != 2:
+                PARSER.error('two-way needs exactly two --parameters')
+            FIRST, SECOND = ARGS.parameters
+            FIRST_VALUES, SECOND_VALUES, RESULTS = two_way(
+                SCENARIOS, FIRST, SECOND, ARGS.points, ARGS.spread,
+                ARGS.workers)
+            ROWS = []
+            for A, ROW in zip(FIRST_VALUES, RESULTS):
+                for B, POINT in zip(SECOND_VALUES, ROW):
+                    ROWS.extend(
+                        result_rows(SCENARIOS, POINT, {
+                            FIRST: A,
+                            SECOND: B
+                        }))
+            write_csv(os.path.join(ARGS.path, 'two_way.csv'), ROWS)
+        print('Sensitivity analysis took', time.time() - START, 'seconds.')
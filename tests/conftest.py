@@ -0,0 +1,20 @@
+import copy
+import os
+import sys
+import pytest
+
+# The modules live at the top of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def settings():
+    '''
+    main.SETTINGS, put back the way it was after the test
+    '''
+    import main
+    saved = copy.deepcopy(main.SETTINGS)
+    yield main.SETTINGS
+    main.SETTINGS.clear()
+    main.SETTINGS.update(saved)
@@ -0,0 +1,95 @@
+import pytest
+import checkpoint
+import constants
+import create_random_sets as random_sets
+import main
+import numpy as np
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'state.pkl')
+    state = {'Completed': 3, 'Values': [1.5, 'N/A']}
+    checkpoint.save(path, state)
+    assert checkpoint.load(path) == state
+    assert not (tmp_path / 'state.pkl.tmp').exists()
+    checkpoint.remove(path)
+    checkpoint.remove(path)
+    assert not (tmp_path / 'state.pkl').exists()
+
+
+def test_record_and_resume(tmp_path, settings):
+    path = str(tmp_path / 'checkpoint.pkl')
+    saved = checkpoint.Checkpoint(path, 300, settings, 7, 'output/out.csv')
+    saved.record(12, 3456)
+    resumed, offset = checkpoint.Checkpoint.resume(path, 60, settings)
+    assert (resumed.seed, resumed.output_path, resumed.completed,
+            offset) == (7, 'output/out.csv', 12, 3456)
+    assert resumed.every_seconds == 60
+
+
+def test_resume_ignores_settings_that_dont_change_output(tmp_path, settings):
+    path = str(tmp_path / 'checkpoint.pkl')
+    checkpoint.Checkpoint(path, 300, settings, 7, 'out.csv').record(1, 10)
+    settings['Instrumentation'] = not settings['Instrumentation']
+    checkpoint.Checkpoint.resume(path, 300, settings)
+    settings['ICER Threshold'] += 1
+    with pytest.raises(ValueError):
+        checkpoint.Checkpoint.resume(path, 300, settings)
+
+
+def test_resume_without_checkpoint(tmp_path, settings):
+    with pytest.raises(FileNotFoundError):
+        checkpoint.Checkpoint.resume(str(tmp_path / 'missing.pkl'), 300,
+                                     settings)
+
+
+def run_sets(path, arguments, start=0):
+    mode = 'w' if start == 0 else 'a'
+    main.run_sets(arguments, open(path, mode), 5, progress=False, start=start)
+    with open(path) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('batched', [False, True])
+def test_resumed_run_is_identical(tmp_path, settings, batched):
+    settings['Probabilistic Model'].update({
+        'on': True,
+        'evals per set': 30,
+        'Batched': batched
+    })
+    options = dict(settings['Random Set Options'])
+    options['Number of Random Sets'] = 6
+    arguments = list(random_sets.random_sets(options,
+                                             np.random.RandomState(2)))
+    whole = run_sets(str(tmp_path / 'whole.csv'), arguments)
+    path = str(tmp_path / 'resumed.csv')
+    run_sets(path, arguments[:4])
+    resumed = run_sets(path, arguments[4:], start=4)
+    assert resumed == whole
+    assert whole.count('\n') == 7
+
+
+def test_resumed_chunked_run_is_identical(tmp_path, settings):
+    settings['Probabilistic Model']['on'] = False
+    options = dict(settings['Random Set Options'])
+    options['Number of Random Sets'] = 50
+    path = str(tmp_path / 'whole.csv')
+    main.run_sets(random_sets.random_set_chunks(options,
+                                                np.random.RandomState(2), 16),
+                  open(path, 'w'),
+                  5,
+                  progress=False,
+                  chunked=True)
+    whole = open(path).read()
+    lines = whole.splitlines(keepends=True)
+    path = str(tmp_path / 'resumed.csv')
+    with open(path, 'w') as f:
+        f.write(''.join(lines[:1 + 21]))
+    main.run_sets(random_sets.random_set_chunks(options,
+                                                np.random.RandomState(2), 16),
+                  open(path, 'a'),
+                  5,
+                  progress=False,
+                  start=21,
+                  chunked=True)
+    assert open(path).read() == whole
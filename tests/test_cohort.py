@@ -0,0 +1,177 @@
+import numpy as np
+import pytest
+import cohort
+import constants
+import model_context
+from life_tables import LifeTables
+
+# (outcomes, NIHSS, age, sex, horizon) and the (QALYs, costs) the original
+# year by year markov trace gave them, at the published prices
+BASELINE = [
+    (({
+        'p_good': 0.45,
+        'p_tpa': 0.2,
+        'p_evt': 0.1,
+        'p_transfer': 0.0
+    }, 12, 65, constants.Sex.FEMALE, None), (12.670129077717169,
+                                             100432.06385837463)),
+    (({
+        'p_good': 0.30,
+        'p_tpa': 0.1,
+        'p_evt': 0.0,
+        'p_transfer': 0.3
+    }, 20, 80, constants.Sex.MALE, None), (5.768854403214751,
+                                           83574.8203232269)),
+    (({
+        'p_good': 0.60,
+        'p_tpa': 0.3,
+        'p_evt': 0.2,
+        'p_transfer': 0.2
+    }, 6, 45, constants.Sex.FEMALE, 5), (3.9923450896440054,
+                                         15974.825838287612)),
+    (({
+        'p_good': 0.25,
+        'p_tpa': 0.0,
+        'p_evt': 0.0,
+        'p_transfer': 0.0
+    }, 25, 92, constants.Sex.MALE, 1), (0.49010782561293653,
+                                        2147.1775586852946)),
+    (({
+        'p_good': 0.50,
+        'p_tpa': 0.15,
+        'p_evt': 0.05,
+        'p_transfer': 0.1
+    }, 15, 30, constants.Sex.MALE, 20), (13.02323258758676,
+                                         40384.176979729826)),
+]
+
+
+def population(outcomes, NIHSS, age, sex, horizon):
+    context = model_context.ModelContext({
+        'age': age,
+        'sex': sex
+    }, NIHSS, horizon, None, None, None)
+    return cohort.Population(outcomes, 'Primary', context)
+
+
+@pytest.mark.parametrize('cohort_inputs, expected', BASELINE)
+def test_population_matches_baseline(cohort_inputs, expected):
+    result = population(*cohort_inputs)
+    assert result.qalys == pytest.approx(expected[0], rel=1e-12)
+    assert result.costs == pytest.approx(expected[1], rel=1e-12)
+
+
+def test_run_markov_batch_matches_baseline():
+    inputs = [cohort_inputs for cohort_inputs, _ in BASELINE]
+    outcomes = {
+        key: np.array([cohort_inputs[0][key] for cohort_inputs in inputs])
+        for key in ('p_good', 'p_tpa', 'p_evt', 'p_transfer')
+    }
+    NIHSS = np.array([cohort_inputs[1] for cohort_inputs in inputs])
+    states, first_year_costs = cohort.initial_states(outcomes, NIHSS)
+    qalys, costs = cohort.run_markov_batch(
+        np.stack(np.broadcast_arrays(*states), axis=-1), first_year_costs,
+        np.array([cohort_inputs[2] for cohort_inputs in inputs]),
+        np.array([int(cohort_inputs[3]) for cohort_inputs in inputs]),
+        cohort.horizon_years([cohort_inputs[4] for cohort_inputs in inputs],
+                             len(inputs)))
+    expected = np.array([values for _, values in BASELINE])
+    np.testing.assert_allclose(qalys, expected[:, 0], rtol=1e-12)
+    np.testing.assert_allclose(costs, expected[:, 1], rtol=1e-12)
+
+
+def test_batch_matches_population():
+    random_state = np.random.RandomState(0)
+    size = 200
+    outcomes = {
+        'p_good': random_state.uniform(0.05, 0.7, size),
+        'p_tpa': random_state.uniform(0, 0.3, size),
+        'p_evt': random_state.uniform(0, 0.2, size),
+        'p_transfer': random_state.uniform(0, 0.5, size)
+    }
+    NIHSS = random_state.randint(1, 40, size)
+    ages = random_state.randint(30, 100, size)
+    sexes = random_state.randint(0, 2, size)
+    horizons = [1, 10, None]
+    qalys, costs = cohort.run_population_horizons(outcomes, NIHSS, ages, sexes,
+                                                  horizons)
+    for i in range(0, size, 7):
+        single = {key: values[i] for key, values in outcomes.items()}
+        for h, horizon in enumerate(horizons):
+            result = population(single, NIHSS[i], ages[i],
+                                constants.Sex(sexes[i]), horizon)
+            assert qalys[h, i] == pytest.approx(result.qalys, rel=1e-12)
+            assert costs[h, i] == pytest.approx(result.costs, rel=1e-12)
+
+
+def test_cost_components_add_up_and_reprice():
+    random_state = np.random.RandomState(1)
+    size = 50
+    outcomes = {
+        'p_good': random_state.uniform(0.05, 0.7, size),
+        'p_tpa': random_state.uniform(0, 0.3, size),
+        'p_evt': random_state.uniform(0, 0.2, size),
+        'p_transfer': random_state.uniform(0, 0.5, size)
+    }
+    NIHSS = random_state.randint(1, 40, size)
+    ages = random_state.randint(30, 95, size)
+    sexes = random_state.randint(0, 2, size)
+    horizons = [5, None]
+    components = cohort.cost_components(outcomes, NIHSS, ages, sexes, horizons)
+    _, costs = cohort.run_population_horizons(outcomes, NIHSS, ages, sexes,
+                                              horizons)
+    for h in range(len(horizons)):
+        np.testing.assert_allclose(components[h].sum(axis=1),
+                                   costs[h],
+                                   rtol=1e-12)
+
+    old = constants.Costs.get_prices()
+    new = constants.Costs.inflated(constants.BASE_PRICES, 2010)
+    new['EVT'] = 12000
+    repriced = [cohort.reprice(values, old, new) for values in components]
+    try:
+        constants.Costs.set_prices(new)
+        _, rerun = cohort.run_population_horizons(outcomes, NIHSS, ages, sexes,
+                                                  horizons)
+    finally:
+        constants.Costs.set_prices(old)
+    for h in range(len(horizons)):
+        np.testing.assert_allclose(repriced[h].sum(axis=1),
+                                   rerun[h],
+                                   rtol=1e-12)
+
+
+def markov_trace(states, start_age, sex):
+    '''
+    The state of the cohort at the start of every cycle up to age 100, one
+    year at a time as the original model did it
+    '''
+    current_state = list(states)
+    trace = []
+    for age in range(start_age, cohort.MAX_AGE):
+        trace.append(list(current_state))
+        for mrs in range(constants.States.DEATH):
+            p_dead = LifeTables.adjusted_mortality(sex, age,
+                                                   constants.hazard_mort(mrs))
+            current_state[
+                constants.States.DEATH] += current_state[mrs] * p_dead
+            current_state[mrs] -= current_state[mrs] * p_dead
+    trace.append(current_state)
+    return trace
+
+
+@pytest.mark.parametrize('cohort_inputs, expected', BASELINE)
+def test_yearly_helpers_give_population_values(cohort_inputs, expected):
+    result = population(*cohort_inputs)
+    _, _, age, sex, horizon = cohort_inputs
+    trace = markov_trace(result.states_in_markov, age, sex)
+    assert len(trace) == cohort.MAX_AGE - age + 1
+    qalys = cohort.simpsons_1_3rd_correction(cohort.get_qalys(trace), horizon)
+    costs_per_year = [result.first_year_costs]
+    cohort.get_costs_per_year(costs_per_year, trace)
+    costs = cohort.simpsons_1_3rd_correction(costs_per_year, horizon)
+    assert qalys == pytest.approx(expected[0], rel=1e-12)
+    assert costs == pytest.approx(expected[1], rel=1e-12)
+    assert costs_per_year[1] == pytest.approx(constants.annual_cost(trace[1]) /
+                                              cohort.discount_factors(1),
+                                              rel=1e-12)
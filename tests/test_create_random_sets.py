@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import create_random_sets as random_sets
+import main
+
+
+def options(settings, number, sampling='Monte Carlo', **fixed):
+    result = dict(settings['Random Set Options'])
+    result.update(fixed)
+    result['Number of Random Sets'] = number
+    result['Sampling'] = sampling
+    return result
+
+
+def joined(chunks):
+    chunks = list(chunks)
+    return {
+        name: np.concatenate([chunk[name] for chunk in chunks])
+        for name in random_sets.RANDOM_PARAMETERS
+    }
+
+
+@pytest.mark.parametrize('sampling', ['Sobol', 'Latin Hypercube'])
+def test_chunk_size_doesnt_change_the_sets(settings, sampling):
+    set_options = options(settings, 100, sampling)
+    whole = joined(
+        random_sets.random_set_chunks(set_options, np.random.RandomState(4),
+                                      1000))
+    for chunk_size in (1, 7, 64):
+        chunked = joined(
+            random_sets.random_set_chunks(set_options,
+                                          np.random.RandomState(4),
+                                          chunk_size))
+        for name in random_sets.RANDOM_PARAMETERS:
+            np.testing.assert_allclose(chunked[name], whole[name])
+
+
+def test_sets_match_their_chunks(settings):
+    set_options = options(settings, 50)
+    chunks = joined(
+        random_sets.random_set_chunks(set_options, np.random.RandomState(4),
+                                      16))
+    sets = list(
+        random_sets.random_sets(set_options, np.random.RandomState(4), 16))
+    assert len(sets) == 50
+    for name in random_sets.RANDOM_PARAMETERS:
+        assert [argument_set[name]
+                for argument_set in sets] == chunks[name].tolist()
+
+
+def test_ranges(settings):
+    sets = joined(
+        random_sets.random_set_chunks(options(settings, 5000),
+                                      np.random.RandomState(4)))
+    assert set(sets['sex'].tolist()) == {0, 1}
+    assert (sets['age'].min(), sets['age'].max()) == (30, 80)
+    assert set(sets['RACE'].tolist()) == set(range(10))
+    assert (sets['time_to_comprehensive'] >= sets['time_to_primary']).all()
+    assert (np.abs(sets['transfer_time'] - sets['time_to_comprehensive'])
+            <= sets['time_to_primary']).all()
+
+
+def test_fixed_options_are_kept(settings):
+    fixed = {'age': 72, 'RACE': 6, 'time_to_primary': 25}
+    sets = list(
+        random_sets.random_sets(options(settings, 20, 'Sobol', **fixed),
+                                np.random.RandomState(4), 8))
+    assert len(sets) == 20
+    for argument_set in sets:
+        for name, value in fixed.items():
+            assert argument_set[name] == value
+        assert set(argument_set) == set(main.INPUT_VARIABLES)
@@ -0,0 +1,80 @@
+import json
+import pytest
+import instrumentation
+import main
+
+ARGUMENTS = {
+    'sex': 1,
+    'age': 65,
+    'RACE': 7,
+    'time_since_symptoms': 45,
+    'time_to_primary': 30,
+    'time_to_comprehensive': 60,
+    'transfer_time': 45
+}
+
+
+@pytest.fixture
+def enabled():
+    instrumentation.enable()
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def test_disabled_records_nothing():
+    assert not instrumentation.ENABLED
+    instrumentation.count('event')
+    with instrumentation.timed('stage'):
+        pass
+    recorded = instrumentation.profile()
+    assert recorded['stages'] == {}
+    assert recorded['counters'] == {}
+
+
+def test_counters_and_stages(enabled):
+    for _ in range(3):
+        instrumentation.count('event')
+        with instrumentation.timed('stage'):
+            pass
+    instrumentation.count('event', 5)
+    recorded = instrumentation.profile()
+    assert recorded['counters'] == {'event': 8}
+    assert recorded['stages']['stage']['calls'] == 3
+    assert recorded['stages']['stage']['seconds'] >= 0
+
+
+def test_timed_records_stages_that_raise(enabled):
+    with pytest.raises(ValueError):
+        with instrumentation.timed('stage'):
+            raise ValueError
+    assert instrumentation.profile()['stages']['stage']['calls'] == 1
+
+
+def test_collect_and_merge(enabled):
+    instrumentation.count('event', 2)
+    with instrumentation.timed('stage'):
+        pass
+    collected = instrumentation.collect()
+    assert instrumentation.profile()['counters'] == {}
+    # As if from two worker processes
+    instrumentation.merge(collected)
+    instrumentation.merge(collected)
+    recorded = instrumentation.profile()
+    assert recorded['counters'] == {'event': 4}
+    assert recorded['stages']['stage']['calls'] == 2
+
+
+def test_model_stages(enabled, tmp_path):
+    main.run_model(ARGUMENTS,
+                   context=main.get_context(ARGUMENTS, False, False))
+    recorded = instrumentation.profile()
+    assert recorded['stages']['setup_model']['calls'] == 1
+    # Once for each strategy
+    for stage in ('get_ais_outcomes', 'Population (markov model)'):
+        assert recorded['stages'][stage]['calls'] == len(main.STRATEGIES)
+    assert 'Population (markov model)' in instrumentation.summary_table()
+    path = tmp_path / 'profile.json'
+    instrumentation.write_profile(str(path), recorded)
+    with open(path) as f:
+        assert json.load(f) == recorded
@@ -0,0 +1,60 @@
+import math
+import numpy as np
+import pytest
+import constants
+from life_tables import LifeTables
+
+
+def formula(sex, age, adjustment):
+    prob_unadjusted = LifeTables.p_death[sex][age]
+    return 1 - math.exp(math.log(1 - prob_unadjusted) * adjustment)
+
+
+@pytest.fixture
+def hazards():
+    '''
+    constants.HAZARDS_MORTALITY, put back the way it was after the test
+    '''
+    saved = dict(constants.HAZARDS_MORTALITY)
+    yield constants.HAZARDS_MORTALITY
+    constants.HAZARDS_MORTALITY.update(saved)
+
+
+def test_adjusted_mortality_matches_formula():
+    for sex in constants.Sex:
+        for age in range(100):
+            for mrs in range(constants.States.DEATH):
+                adjustment = constants.hazard_mort(mrs)
+                expected = formula(sex, age, adjustment)
+                value = LifeTables.adjusted_mortality(sex, age, adjustment)
+                assert value == pytest.approx(expected, rel=1e-12)
+            # Adjustments that aren't a hazard aren't in the table
+            value = LifeTables.adjusted_mortality(sex, age, 1.7)
+            assert value == formula(sex, age, 1.7)
+
+
+def test_tables_follow_the_hazards(hazards):
+    female = constants.Sex.FEMALE
+    before = LifeTables.adjusted_mortality_table()
+    hazards[constants.States.MRS_3] = 5.0
+    after = LifeTables.adjusted_mortality_table()
+    expected = formula(female, 70, 5.0)
+    assert after is not before
+    assert after[female, 70,
+                 constants.States.MRS_3] == pytest.approx(expected, rel=1e-12)
+    value = LifeTables.adjusted_mortality(female, 70, 5.0)
+    assert value == pytest.approx(expected, rel=1e-12)
+
+
+def test_survival_is_the_product_of_yearly_survival():
+    for sex in constants.Sex:
+        for mrs in range(constants.States.DEATH):
+            adjustment = constants.hazard_mort(mrs)
+            expected = np.prod(
+                [1 - formula(sex, age, adjustment) for age in range(60, 75)])
+            value = LifeTables.survival(sex, 60, 75, mrs)
+            assert value == pytest.approx(expected, rel=1e-12)
+    ages = np.array([40, 50, 60])
+    np.testing.assert_allclose(
+        LifeTables.survival(0, ages, ages + 10, 2),
+        [LifeTables.survival(0, age, age + 10, 2) for age in ages])
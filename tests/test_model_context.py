@@ -0,0 +1,26 @@
+import pickle
+import pytest
+import main
+
+
+def test_context_arguments_are_read_only(settings):
+    arguments = dict(settings['Base Case Options'])
+    context = main.get_context(arguments, False, False)
+    with pytest.raises(TypeError):
+        context.arguments['age'] = 30
+    # Later changes to the caller's dict don't reach the context either
+    arguments['age'] = 30
+    assert context.arguments['age'] == settings['Base Case Options']['age']
+    replaced = context._replace(arguments=arguments, horizon=5)
+    with pytest.raises(TypeError):
+        replaced.arguments['age'] = 40
+
+
+def test_context_pickles(settings):
+    context = main.get_context(settings['Base Case Options'], False, False)
+    copy = pickle.loads(pickle.dumps(context))
+    assert dict(copy.arguments) == dict(context.arguments)
+    for field in ('NIHSS', 'horizon', 'p_lvo', 'icer_threshold'):
+        assert getattr(copy, field) == getattr(context, field)
+    with pytest.raises(TypeError):
+        copy.arguments['age'] = 30
@@ -0,0 +1,34 @@
+import pytest
+import main
+import network
+
+
+def test_network_runs_through_the_output_file(tmp_path, settings):
+    settings['Probabilistic Model']['on'] = False
+    settings['Network'] = 'input/network.json'
+    settings['Horizon'] = ['5', 'lifetime']
+    routes = network.Network.load('input/network.json').strategies
+    path = str(tmp_path / 'out.csv')
+    main.run_sets([settings['Base Case Options']],
+                  open(path, 'w'),
+                  5,
+                  progress=False)
+    header, *rows = open(path).read().splitlines()
+    header = header.split(',')
+    assert header[8:-2] == [
+        f'{route} {measure}' for route in routes
+        for measure in ('Cost', 'QALYs')
+    ]
+    assert [row.split(',')[-1] for row in rows] == ['5', 'lifetime']
+    for row in rows:
+        values = row.split(',')
+        assert len(values) == len(header)
+        assert values[7] in routes
+        assert float(values[header.index(f'{values[7]} QALYs')]) > 0
+
+
+def test_network_is_deterministic_only(settings):
+    settings['Probabilistic Model']['on'] = True
+    settings['Network'] = 'input/network.json'
+    with pytest.raises(ValueError):
+        main.run()
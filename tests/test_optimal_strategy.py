@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+import optimal_strategy
+
+STRATEGIES = ['Primary', 'Comprehensive', 'Drip and Ship']
+
+
+def tie_heavy_inputs(size, seed):
+    '''
+    Costs and QALYs from a handful of values, so rows are full of ties and
+    dominated strategies, with Drip and Ship sometimes not an option
+    '''
+    random_state = np.random.RandomState(seed)
+    costs = random_state.choice([100.0, 200.0, 250.0, 300.0],
+                                (size, len(STRATEGIES)))
+    qalys = random_state.choice([1.0, 1.001, 1.002, 1.004],
+                                (size, len(STRATEGIES)))
+    available = np.ones((size, len(STRATEGIES)), dtype=bool)
+    available[:, -1] = random_state.uniform(size=size) < 0.7
+    # get_optimal never finishes when every strategy has the same QALYs
+    # (dominance leaves a single strategy and so no ICERs), so leave those
+    # rows out
+    spread = np.ptp(np.where(available, qalys, qalys[:, :1]), axis=1) > 0
+    return costs[spread], qalys[spread], available[spread]
+
+
+def scalar_optimal(costs, qalys, available, threshold):
+    strategies = [s for s, a in zip(STRATEGIES, available) if a]
+    results = {
+        'Costs': {
+            s: np.float64(c)
+            for s, c in zip(STRATEGIES, costs)
+        },
+        'QALYs': {
+            s: np.float64(q)
+            for s, q in zip(STRATEGIES, qalys)
+        }
+    }
+    # Equal QALYs give infinite or NaN ICERs, as numpy floats
+    with np.errstate(divide='ignore', invalid='ignore'):
+        optimal_strategy.get_optimal(results, strategies, threshold)
+    return STRATEGIES.index(results['Optimal Location'])
+
+
+@pytest.mark.parametrize('threshold', [0, 50000, 100000, 1e9])
+def test_get_optimal_batch_matches_get_optimal(threshold):
+    costs, qalys, available = tie_heavy_inputs(2000, 0)
+    optimal, _ = optimal_strategy.get_optimal_batch(costs, qalys, threshold,
+                                                    available)
+    expected = [
+        scalar_optimal(costs[i], qalys[i], available[i], threshold)
+        for i in range(len(costs))
+    ]
+    np.testing.assert_array_equal(optimal, expected)
+
+
+def test_get_optimal_thresholds_matches_get_optimal_batch():
+    costs, qalys, available = tie_heavy_inputs(2000, 1)
+    thresholds = [0, 25000, 50000, 100000, 200000]
+    columns = optimal_strategy.get_optimal_thresholds(costs, qalys, thresholds,
+                                                      available)
+    assert columns.shape == (len(costs), len(thresholds))
+    for t, threshold in enumerate(thresholds):
+        optimal, _ = optimal_strategy.get_optimal_batch(
+            costs, qalys, threshold, available)
+        np.testing.assert_array_equal(columns[:, t], optimal)
+
+
+def test_unavailable_strategy_is_never_optimal():
+    costs, qalys, available = tie_heavy_inputs(500, 2)
+    optimal, icers = optimal_strategy.get_optimal_batch(
+        costs, qalys, 1e9, available)
+    assert available[np.arange(len(optimal)), optimal].all()
+    assert np.isnan(icers[~available]).all()
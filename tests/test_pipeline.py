@@ -0,0 +1,84 @@
+import io
+import pytest
+import constants
+import pipeline
+
+HEADER = ('sex (type male or female),age,RACE (type NA if not),'
+          'NIHSS (type NA if not),time symptom,time primary,'
+          'time comprehensive,transfer time\n')
+
+
+def scenario_rows(count):
+    for i in range(count):
+        sex = 'male' if i % 2 else 'female'
+        race = 'NA' if i % 3 == 0 else str(i % 10)
+        yield (f'{sex},{40 + i % 50},{race},{4 + i % 20},{30 + i},'
+               f'{10 + i % 40},{20 + i % 60},{15 + i % 70}\n')
+
+
+@pytest.mark.parametrize('background', [False, True])
+def test_round_trip(tmp_path, background):
+    path = tmp_path / 'scenarios.csv'
+    rows = list(scenario_rows(1000))
+    with pipeline.BufferedWriter(open(path, 'w'),
+                                 buffer_rows=64,
+                                 background=background,
+                                 queue_size=2) as writer:
+        writer.write(HEADER)
+        for row in rows:
+            writer.write(row)
+    assert path.read_text() == HEADER + ''.join(rows)
+    assert pipeline.count_scenarios(path) == len(rows)
+
+    expected = [pipeline.parse_scenario(row) for row in rows]
+    assert list(pipeline.read_scenarios(path, chunk_size=7)) == expected
+    chunks = list(pipeline.read_scenario_chunks(path, chunk_size=300))
+    assert [len(chunk) for chunk in chunks] == [300, 300, 300, 100]
+    assert sum(chunks, []) == expected
+
+
+def test_parse_scenario():
+    scenario = pipeline.parse_scenario('male,70,NA,10,30,31,53,62\n')
+    assert scenario == {
+        'sex': constants.Sex.MALE,
+        'age': 70,
+        'RACE': constants.nihss_to_race(10),
+        'time_since_symptoms': 30,
+        'time_to_primary': 31,
+        'time_to_comprehensive': 53,
+        'transfer_time': 62
+    }
+    assert pipeline.parse_scenario('female,70,5,NA,30,31,53,62')['RACE'] == 5
+
+
+def test_last_line_without_newline(tmp_path):
+    path = tmp_path / 'scenarios.csv'
+    path.write_text(HEADER + ''.join(scenario_rows(3)).rstrip('\n'))
+    assert pipeline.count_scenarios(path) == 3
+    assert len(list(pipeline.read_scenarios(path))) == 3
+    path.write_text(HEADER)
+    assert pipeline.count_scenarios(path) == 0
+    assert list(pipeline.read_scenarios(path)) == []
+
+
+class FailingFile(io.StringIO):
+
+    def write(self, text):
+        raise OSError('disk full')
+
+
+@pytest.mark.parametrize('background', [False, True])
+def test_write_errors_are_raised(background):
+    writer = pipeline.BufferedWriter(FailingFile(),
+                                     buffer_rows=1,
+                                     background=background)
+    with pytest.raises(OSError):
+        for _ in range(10):
+            writer.write('row\n')
+    # Without a writer thread the error was raised where it happened
+    if background:
+        with pytest.raises(OSError):
+            writer.close()
+    else:
+        writer.close()
+    assert writer.file.closed
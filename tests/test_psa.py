@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+import psa
+
+STRATEGIES = ['Primary', 'Comprehensive', 'Drip and Ship']
+
+
+def test_running_moments_add_batch_matches_numpy():
+    random_state = np.random.RandomState(0)
+    values = random_state.normal(1e5, 2e4, 1000)
+    moments = psa.RunningMoments()
+    for batch in np.array_split(values, [1, 10, 300, 301, 750]):
+        moments.add_batch(batch)
+    assert moments.count == len(values)
+    assert moments.mean == pytest.approx(np.mean(values), rel=1e-12)
+    assert moments.variance == pytest.approx(np.var(values, ddof=1), rel=1e-10)
+
+
+def test_running_moments_mixes_single_values_and_skips_nan():
+    random_state = np.random.RandomState(1)
+    values = random_state.uniform(0, 20, 101)
+    moments = psa.RunningMoments()
+    for value in values[:40]:
+        moments.add(value)
+    moments.add(np.nan)
+    moments.add_batch(np.append(values[40:], [np.nan, np.nan]))
+    assert moments.count == len(values)
+    assert moments.mean == pytest.approx(np.mean(values), rel=1e-12)
+    assert moments.sd == pytest.approx(np.std(values, ddof=1), rel=1e-10)
+
+
+def test_running_moments_too_few_values():
+    moments = psa.RunningMoments()
+    assert np.isnan(moments.variance)
+    moments.add(3.0)
+    assert np.isnan(moments.variance)
+
+
+def accumulator(counts):
+    '''
+    A PSAAccumulator that has seen counts[strategy] optimal evaluations
+    '''
+    result = psa.PSAAccumulator(STRATEGIES)
+    result.counts = dict(zip(STRATEGIES, counts))
+    result.evals = sum(counts)
+    return result
+
+
+def test_wilson_interval():
+    # 50 of 100 at z = 1.96, from the closed form
+    low, high = accumulator([50, 30, 20]).percent_intervals()['Primary']
+    assert low == pytest.approx(40.382983, abs=1e-5)
+    assert high == pytest.approx(59.617017, abs=1e-5)
+
+
+def test_wilson_interval_doesnt_collapse_at_the_ends():
+    intervals = accumulator([0, 100, 0]).percent_intervals()
+    low, high = intervals['Primary']
+    assert low == 0 and 0 < high < 5
+    low, high = intervals['Comprehensive']
+    assert 95 < low < 100 and high == pytest.approx(100)
+    assert accumulator([0, 0,
+                        0]).percent_intervals()['Primary'] == (0.0, 100.0)
+
+
+@pytest.mark.parametrize('counts', [[50, 30, 20], [1, 98, 1], [0, 0, 40]])
+@pytest.mark.parametrize('width', [2, 5, 10])
+def test_evals_needed_is_the_smallest_that_is_narrow_enough(counts, width):
+    needed = accumulator(counts).evals_needed(width)
+    proportions = np.array(counts) / sum(counts)
+
+    def widest(evals):
+        # Same proportions after evals evaluations
+        scaled = accumulator(proportions * evals)
+        return scaled.interval_width()
+
+    assert widest(needed) <= width + 1e-9
+    assert widest(needed - 1) > width
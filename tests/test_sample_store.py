@@ -0,0 +1,141 @@
+import numpy as np
+import pytest
+import constants
+import main
+import sample_store
+
+ARGUMENT_SETS = [
+    {
+        'sex': constants.Sex.FEMALE,
+        'age': 65,
+        'RACE': 7,
+        'time_since_symptoms': 45,
+        'time_to_primary': 30,
+        'time_to_comprehensive': 60,
+        'transfer_time': 45
+    },
+    {
+        'sex': constants.Sex.MALE,
+        'age': 80,
+        'RACE': 4,
+        'time_since_symptoms': 20,
+        'time_to_primary': 15,
+        'time_to_comprehensive': 50,
+        'transfer_time': 40
+    },
+    # Late enough that the RACE cutoff decides most draws
+    {
+        'sex': constants.Sex.MALE,
+        'age': 55,
+        'RACE': 2,
+        'time_since_symptoms': 220,
+        'time_to_primary': 20,
+        'time_to_comprehensive': 40,
+        'transfer_time': 30
+    },
+]
+
+SEED = 12
+
+
+def run_store(directory, settings, batched, components=False):
+    '''
+    Run ARGUMENT_SETS recording every draw to directory, returning the
+    output rows of each set
+    '''
+    prob_settings = settings['Probabilistic Model']
+    prob_settings.update({
+        'on': True,
+        'evals per set': 40,
+        'Batched': batched,
+        'Batch Size': 16,
+        'Sample Store': str(directory)
+    })
+    settings['Horizon'] = ['5', 'lifetime']
+    settings['Cost Components'] = components
+    sample_store.prepare(str(directory))
+    main.open_sample_store()
+    try:
+        rows = [
+            main.run_argument_set(arguments,
+                                  main.get_random_state(SEED, index), index)
+            for index, arguments in enumerate(ARGUMENT_SETS)
+        ]
+    finally:
+        sample_store.close_writer()
+    sample_store.write_index(str(directory), main.sample_store_metadata(SEED))
+    return rows
+
+
+def output_percents(rows, horizon):
+    '''
+    (sets, strategies) percent optimal columns of the output rows
+    '''
+    percents = []
+    for set_rows in rows:
+        for row in set_rows.splitlines():
+            values = row.split(',')
+            if values[-1] == horizon:
+                percents.append([float(value) for value in values[7:10]])
+    return np.array(percents)
+
+
+@pytest.mark.parametrize('batched', [False, True])
+def test_store_reproduces_percent_optimal(tmp_path, settings, monkeypatch,
+                                          batched):
+    monkeypatch.setattr(sample_store, 'SEGMENT_ROWS', 25)
+    rows = run_store(tmp_path, settings, batched)
+    store = sample_store.SampleStore(str(tmp_path))
+    assert len(store) == 40 * len(ARGUMENT_SETS)
+    assert len(store.files) > 1
+    assert store.sets['set'].tolist() == list(range(len(ARGUMENT_SETS)))
+    for name in sample_store.SET_VARIABLES:
+        np.testing.assert_array_equal(
+            store.sets[name],
+            [float(arguments[name]) for arguments in ARGUMENT_SETS])
+    for h, horizon in enumerate(store.horizons):
+        percents = store.percent_optimal(store.index['ICER Threshold'], h)
+        np.testing.assert_allclose(percents[:, 0],
+                                   output_percents(rows, horizon))
+
+
+@pytest.mark.parametrize('batched', [False, True])
+def test_cutoff_draws_have_no_values(tmp_path, settings, batched):
+    run_store(tmp_path, settings, batched, components=True)
+    store = sample_store.SampleStore(str(tmp_path))
+    records = np.concatenate(list(store.segments()))
+    cutoff = ~records['model_is_necessary']
+    assert cutoff.any()
+    for name in ('costs', 'qalys', 'cost_components'):
+        assert np.isnan(records[name][cutoff]).all()
+        assert not np.isnan(records[name][~cutoff][:, :, :2]).any()
+
+
+def test_components_reprice(tmp_path, settings):
+    run_store(tmp_path, settings, True, components=True)
+    store = sample_store.SampleStore(str(tmp_path))
+    for segment in store.segments():
+        np.testing.assert_allclose(store.costs(segment, 1,
+                                               store.component_prices()),
+                                   segment['costs'][:, 1],
+                                   rtol=1e-12)
+        evt = store.costs(segment, 1,
+                          store.component_prices(prices={'EVT': 0}))
+        # Repricing sums in a different order, so allow for the last bits
+        known = ~np.isnan(evt)
+        assert (evt[known]
+                <= segment['costs'][:, 1][known] * (1 + 1e-12)).all()
+    with pytest.raises(ValueError):
+        store.component_prices(2020)
+    with pytest.raises(ValueError):
+        store.component_prices(prices={'ANNUAL': 1})
+
+
+def test_truncate(tmp_path, settings, monkeypatch):
+    monkeypatch.setattr(sample_store, 'SEGMENT_ROWS', 25)
+    run_store(tmp_path, settings, False)
+    sample_store.truncate(str(tmp_path), 2)
+    sample_store.write_index(str(tmp_path), main.sample_store_metadata(SEED))
+    store = sample_store.SampleStore(str(tmp_path))
+    assert len(store) == 40 * 2
+    assert store.sets['set'].tolist() == [0, 1]
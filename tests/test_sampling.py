@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+import sampling
+
+
+def strata_counts(points, strata):
+    '''
+    Points in each of strata equal intervals along every dimension,
+    (dimensions, strata)
+    '''
+    cells = np.floor(points * strata).astype(int)
+    return np.stack([
+        np.bincount(cells[:, d], minlength=strata)
+        for d in range(points.shape[1])
+    ])
+
+
+def test_sobol_is_stratified():
+    sobol = sampling.Sobol(sampling.MAX_DIMENSIONS, np.random.RandomState(0))
+    points = sobol.points(256).points
+    assert ((points > 0) & (points < 1)).all()
+    # Every power of two prefix has a point in each of as many strata
+    for number in (2, 16, 256):
+        assert (strata_counts(points[:number], number) == 1).all()
+    # and the first two dimensions fill a 16 x 16 grid
+    cells = np.floor(points[:, :2] * 16).astype(int)
+    assert len(set(map(tuple, cells.tolist()))) == 256
+
+
+def test_latin_hypercube_is_stratified():
+    hypercube = sampling.LatinHypercube(7, 50, np.random.RandomState(0))
+    points = hypercube.points(100).points
+    # Each whole design has one point in each stratum
+    assert (strata_counts(points[:50], 50) == 1).all()
+    assert (strata_counts(points[50:], 50) == 1).all()
+
+
+@pytest.mark.parametrize('method', ['Sobol', 'Latin Hypercube'])
+def test_points_dont_depend_on_how_theyre_asked_for(method):
+    whole = sampling.create(method, 5, np.random.RandomState(3),
+                            64).points(200).points
+    sampler = sampling.create(method, 5, np.random.RandomState(3), 64)
+    pieces = [sampler.points(size).points for size in (1, 63, 100, 36)]
+    np.testing.assert_array_equal(np.concatenate(pieces), whole)
+
+
+def test_points_stand_in_for_a_random_state():
+    points = sampling.Points(np.array([[0.25, 0.5, 0.999], [0.0, 0.75, 0.1]]))
+    np.testing.assert_array_equal(points.uniform(10, 20, size=2), [12.5, 10])
+    np.testing.assert_array_equal(points.randint(0, 2, size=2), [1, 1])
+    np.testing.assert_array_equal(points.randint(10, size=2), [9, 1])
+    with pytest.raises(ValueError):
+        points.uniform(size=2)
+    with pytest.raises(ValueError):
+        sampling.Points(np.zeros((2, 1))).uniform(size=3)
+    single = sampling.Points(np.array([[0.5, 0.5]]), True)
+    assert single.uniform(0, 4) == 2
+    assert single.randint(0, 3) == 1
+    assert [row.uniform() for row in points.rows()] == [0.25, 0.0]
+
+
+def test_bad_samplers():
+    with pytest.raises(ValueError):
+        sampling.create('Halton', 3)
+    with pytest.raises(ValueError):
+        sampling.Sobol(sampling.MAX_DIMENSIONS + 1)
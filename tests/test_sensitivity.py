@@ -0,0 +1,155 @@
+import numpy as np
+import pytest
+import main
+import sensitivity
+
+SCENARIOS = [{
+    'sex': 1,
+    'age': 65,
+    'RACE': 7,
+    'time_since_symptoms': 45,
+    'time_to_primary': 30,
+    'time_to_comprehensive': 60,
+    'transfer_time': 45
+}, {
+    'sex': 0,
+    'age': 80,
+    'RACE': 5,
+    'time_since_symptoms': 90,
+    'time_to_primary': 15,
+    'time_to_comprehensive': 70,
+    'transfer_time': 50
+}, {
+    'sex': 0,
+    'age': 50,
+    'RACE': 2,
+    'time_since_symptoms': 30,
+    'time_to_primary': 20,
+    'time_to_comprehensive': 40,
+    'transfer_time': 30
+}]
+
+OVERRIDES = [('utility mRS 2', 0.5), ('hazard mRS 3', 4.0), ('cost EVT', 1),
+             ('time limit tPA', 200), ('LVO b0', -2.0)]
+
+
+def snapshot():
+    return {
+        name: parameter.get()
+        for name, parameter in sensitivity.PARAMETERS.items()
+    }
+
+
+def assert_same_results(results, expected):
+    np.testing.assert_array_equal(results['optimal'], expected['optimal'])
+    np.testing.assert_array_equal(results['necessary'], expected['necessary'])
+    np.testing.assert_allclose(results['costs'], expected['costs'])
+    np.testing.assert_allclose(results['qalys'], expected['qalys'])
+
+
+def test_evaluate_restores_parameters():
+    arguments = sensitivity.scenario_arrays(SCENARIOS)
+    before = snapshot()
+    base = sensitivity.evaluate(arguments)
+    changed = sensitivity.evaluate(arguments, OVERRIDES)
+    assert snapshot() == before
+    assert not np.allclose(changed['qalys'], base['qalys'], equal_nan=True)
+    # Nothing cached under the overrides leaks into later runs
+    assert_same_results(sensitivity.evaluate(arguments), base)
+
+
+def test_evaluate_restores_parameters_after_errors(monkeypatch):
+    arguments = sensitivity.scenario_arrays(SCENARIOS)
+    before = snapshot()
+
+    def fail(context):
+        raise RuntimeError('model failed')
+
+    monkeypatch.setattr(main, 'run_model_batch', fail)
+    with pytest.raises(RuntimeError):
+        sensitivity.evaluate(arguments, OVERRIDES)
+    assert snapshot() == before
+
+
+def test_parameter_values_keep_within_bounds():
+    parameter = sensitivity.PARAMETERS['utility mRS 0']
+    values = parameter.values(5, 0.25)
+    assert values[-1] == 1
+    assert values[0] == pytest.approx(parameter.get() * 0.75)
+    np.testing.assert_allclose(parameter.values(3, low=0.2, high=0.4),
+                               [0.2, 0.3, 0.4])
+
+
+def fake_results(optimal, benefit):
+    '''
+    evaluate results whose optimal strategies have the given net benefits
+    at the ICER threshold
+    '''
+    optimal = np.array(optimal)
+    qalys = np.ones((len(optimal), len(main.STRATEGIES)))
+    costs = main.SETTINGS['ICER Threshold'] - np.array(benefit,
+                                                       dtype=float)[:, None]
+    return {
+        'optimal': optimal,
+        'necessary': np.ones(len(optimal), dtype=bool),
+        'costs': np.repeat(costs, len(main.STRATEGIES), axis=1),
+        'qalys': qalys
+    }
+
+
+def test_tornado_and_thresholds():
+    base = fake_results([0, 1, 1], [100, 200, 300])
+    sweeps = {
+        'small': ([1, 2, 3], [
+            fake_results([0, 1, 1], [90, 200, 300]),
+            fake_results([0, 1, 1], [100, 200, 300]),
+            fake_results([0, 1, 1], [110, 200, 300])
+        ]),
+        'big': ([10, 20, 30], [
+            fake_results([1, 1, 1], [0, 0, 0]),
+            fake_results([0, 1, 1], [100, 200, 300]),
+            fake_results([0, 1, 2], [300, 300, 300])
+        ])
+    }
+    rows = sensitivity.tornado(base, sweeps)
+    assert [row['Parameter'] for row in rows] == ['big', 'small']
+    assert rows[0]['Swing'] == pytest.approx(300)
+    assert rows[0]['Base Net Benefit'] == pytest.approx(200)
+    assert (rows[0]['Low Value'], rows[0]['High Value']) == (10, 30)
+    assert rows[0]['Decisions Changed at Low'] == 1
+    assert rows[0]['Decisions Changed at High'] == 1
+    assert rows[1]['Swing'] == pytest.approx(20 / 3)
+    assert rows[1]['Decisions Changed at Low'] == 0
+
+    changes = sensitivity.thresholds(sweeps)
+    assert changes == [{
+        'Parameter': 'big',
+        'Scenario': 0,
+        'Below': 10,
+        'Above': 20,
+        'From': 'Comprehensive',
+        'To': 'Primary'
+    }, {
+        'Parameter': 'big',
+        'Scenario': 2,
+        'Below': 20,
+        'Above': 30,
+        'From': 'Comprehensive',
+        'To': 'Drip and Ship'
+    }]
+
+
+def test_one_way_matches_evaluate():
+    base, sweeps = sensitivity.one_way(SCENARIOS, ['cost EVT'], points=3)
+    values, results = sweeps['cost EVT']
+    arguments = sensitivity.scenario_arrays(SCENARIOS)
+    assert_same_results(base, sensitivity.evaluate(arguments))
+    for value, result in zip(values, results):
+        assert_same_results(
+            result, sensitivity.evaluate(arguments, [('cost EVT', value)]))
+
+
+def test_write_csv_without_rows(tmp_path):
+    path = tmp_path / 'empty.csv'
+    sensitivity.write_csv(str(path), [])
+    assert path.read_text() == '\n'
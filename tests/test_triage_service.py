@@ -0,0 +1,64 @@
+import asyncio
+import itertools
+import numpy as np
+import pytest
+import main
+import triage_service
+
+STATS = [{'command': 'stats'}]
+
+
+def run_service(scenarios, max_batch=64, max_wait=0.05):
+    '''
+    Pipeline scenarios to a service on a free localhost port over one
+    connection, returning the replies and the service's stats
+    '''
+
+    async def session():
+        service = triage_service.TriageService('127.0.0.1', 0, max_batch,
+                                               max_wait)
+        await service.start()
+        try:
+            replies = await triage_service.query(scenarios, port=service.port)
+            stats = await triage_service.query(STATS, port=service.port)
+        finally:
+            await service.stop()
+        return replies, stats[0]
+
+    return asyncio.run(session())
+
+
+def test_batched_replies_match_the_model():
+    scenarios = triage_service.random_scenarios(40, np.random.RandomState(2))
+    replies, stats = run_service(scenarios, max_batch=16)
+    assert stats['requests'] == 40
+    assert stats['errors'] == 0
+    # Pipelined requests are evaluated together, at most max_batch at once
+    assert 3 <= stats['batches'] < 40
+    assert stats['mean batch size'] > 1
+    for scenario, reply in zip(scenarios, replies):
+        arguments = triage_service.parse_scenario(scenario)
+        expected = main.run_model(arguments,
+                                  context=main.get_context(
+                                      arguments, False, False))
+        assert reply['Optimal Location'] == expected['Optimal Location']
+        for measure, strategy in itertools.product(('Costs', 'QALYs'),
+                                                   main.STRATEGIES):
+            value = reply[measure][strategy]
+            reference = expected[measure][strategy]
+            if isinstance(reference, str):
+                assert value == reference
+            else:
+                assert value == pytest.approx(reference, rel=1e-9)
+
+
+def test_bad_requests_get_errors_in_order():
+    scenarios = triage_service.random_scenarios(3, np.random.RandomState(3))
+    bad = dict(scenarios[0])
+    del bad['age']
+    replies, stats = run_service([scenarios[0], bad, scenarios[1]])
+    assert 'Optimal Location' in replies[0]
+    assert replies[1] == {'error': 'missing age'}
+    assert 'Optimal Location' in replies[2]
+    assert stats['errors'] == 1
+    assert stats['requests'] == 2
@@ -0,0 +1,50 @@
+import itertools
+import numpy as np
+import pytest
+import main
+import triage_table
+
+
+@pytest.fixture(scope='module')
+def table(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('triage_table'))
+    triage_table.build(path)
+    return triage_table.TriageTable(path)
+
+
+def test_interpolated_decisions_agree_with_the_model(table):
+    report = triage_table.validate(table, 1000, np.random.RandomState(0))
+    nearest = report['nearest']
+    interpolated = report['interpolate']
+    # Pinned so a change to the lookups can't quietly make them worse
+    assert nearest['agreement'] >= 0.92
+    assert interpolated['agreement'] >= 0.935
+    assert interpolated['agreement'] > nearest['agreement']
+    assert interpolated['mean relative error'] < 0.015
+    assert (interpolated['mean relative error']
+            < nearest['mean relative error'])
+
+
+def test_grid_points_are_exact(table):
+    random_state = np.random.RandomState(1)
+    for _ in range(20):
+        arguments = {
+            name: values[random_state.randint(len(values))]
+            for name, values in zip(table.variables, table.grid)
+        }
+        arguments['sex'] = int(arguments['sex'])
+        arguments['age'] = int(arguments['age'])
+        expected = main.run_model(arguments,
+                                  context=main.get_context(
+                                      arguments, False, False))
+        for result in (table.nearest(arguments), table.interpolate(arguments)):
+            assert result['Optimal Location'] == expected['Optimal Location']
+            assert table.location(arguments) == expected['Optimal Location']
+            for measure, strategy in itertools.product(('Costs', 'QALYs'),
+                                                       main.STRATEGIES):
+                value = result[measure][strategy]
+                reference = expected[measure][strategy]
+                if isinstance(reference, str):
+                    assert value == reference
+                else:
+                    assert value == pytest.approx(reference, rel=1e-6)
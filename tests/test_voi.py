@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+import voi
+
+
+def test_evpi_bounds_evppi():
+    random_state = np.random.RandomState(3)
+    for _ in range(20):
+        inputs = random_state.uniform(size=(500, 3))
+        net_benefits = random_state.normal(size=(500, 3))
+        net_benefits[:, 1] += 2 * inputs[:, 0] - 1
+        total = voi.evpi(net_benefits)
+        assert total >= 0
+        for i in range(inputs.shape[1]):
+            value = voi.evppi(inputs[:, i], net_benefits)
+            assert 0 <= value <= total
+
+
+def test_evppi_of_the_deciding_input():
+    x = np.linspace(-1, 1, 1001)
+    net_benefits = np.stack([np.zeros_like(x), x], axis=1)
+    # Knowing x picks the better strategy every time
+    assert voi.evpi(net_benefits) == pytest.approx(0.25, rel=1e-3)
+    assert voi.evppi(x, net_benefits) == pytest.approx(voi.evpi(net_benefits),
+                                                       rel=1e-3)
+    # An input the net benefits don't depend on is worth nothing
+    unrelated = np.random.RandomState(0).permutation(x)
+    assert voi.evppi(unrelated, net_benefits) < 0.02
+
+
+def test_evppi_needs_variation():
+    net_benefits = np.random.RandomState(1).normal(size=(10, 2))
+    assert np.isnan(voi.evppi(np.ones(10), net_benefits))
+    assert np.isnan(voi.evpi(np.empty((0, 2))))
+    samples = voi.PSASamples(['Primary', 'Comprehensive'])
+    assert samples.values() == ['N/A'] * (len(voi.PARAMETERS) + 1)
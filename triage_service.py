@@ -0,0 +1,331 @@
+'''
+Local triage service. Dispatch software sends scenarios as JSON over a
+socket (one object per line, with the fields in main.INPUT_VARIABLES) and
+gets back the optimal location along with every strategy's costs and
+QALYs, one JSON object per line, in the same order.
+
+Requests that arrive within a few milliseconds of each other are evaluated
+together by main.run_model_batch. The model is deterministic here, i.e.
+the default times and LVO probability, as in the base case.
+
+    python triage_service.py serve --port 8765
+    python triage_service.py bench --clients 32 --requests 2000
+
+Sending {"command": "stats"} returns the latency percentiles and the
+throughput so far.
+'''
+
+import argparse
+import asyncio
+import collections
+import json
+import time
+import numpy as np
+import constants
+import main
+
+
+class LatencyStats(object):
+    '''
+    Latencies of the most recent requests along with overall counts
+    '''
+
+    def __init__(self, window=10000):
+        self.latencies = collections.deque(maxlen=window)
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.start = time.perf_counter()
+
+    def record_batch(self, latencies):
+        self.batches += 1
+        self.requests += len(latencies)
+        self.latencies.extend(latencies)
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        summary = {
+            'requests': self.requests,
+            'errors': self.errors,
+            'batches': self.batches,
+            'mean batch size':
+            self.requests / self.batches if self.batches else 0,
+            'throughput (requests/s)': self.requests / elapsed
+        }
+        if self.latencies:
+            latencies = np.array(self.latencies) * 1000
+            for percentile in (50, 90, 99):
+                summary[f'p{percentile} latency (ms)'] = float(
+                    np.percentile(latencies, percentile))
+            summary['max latency (ms)'] = float(latencies.max())
+        return summary
+
+
+def parse_scenario(request):
+    '''
+    Argument set from a request, raising ValueError if it isn't one
+    '''
+    missing = [name for name in main.INPUT_VARIABLES if name not in request]
+    if missing:
+        raise ValueError('missing ' + ', '.join(missing))
+    scenario = {}
+    for name in main.INPUT_VARIABLES:
+        value = request[name]
+        if name == 'sex':
+            if value in ('male', 'female'):
+                value = (constants.Sex.MALE
+                         if value == 'male' else constants.Sex.FEMALE)
+            value = constants.Sex(int(value))
+        elif name == 'age':
+            value = int(value)
+        else:
+            value = float(value)
+        scenario[name] = value
+    return scenario
+
+
+def evaluate(scenarios):
+    '''
+    Run a batch of argument sets through the model at once and return the
+    results of each, in the same form as main.run_model
+    '''
+    arguments = {
+        name: np.array([scenario[name] for scenario in scenarios])
+        for name in main.INPUT_VARIABLES
+    }
+    batch = main.run_model_batch(main.get_context(arguments, False, False))
+    replies = []
+    for i in range(len(scenarios)):
+        necessary = batch['Model Is Necessary'][i]
+        reply = {
+            'Optimal Location':
+            batch['Optimal Location'][i],
+            'Location with Maximum Benefit':
+            batch['Location with Maximum Benefit'][i],
+            'Costs': {},
+            'QALYs': {}
+        }
+        for strategy in main.STRATEGIES:
+            for measure in ('Costs', 'QALYs'):
+                value = batch[measure][strategy][i]
+                if not necessary:
+                    # Same as run_model when the RACE cutoff decides
+                    value = 'N/A' if strategy == 'Drip and Ship' else 0
+                elif np.isnan(value):
+                    value = 'N/A'
+                else:
+                    value = float(value)
+                reply[measure][strategy] = value
+        replies.append(reply)
+    return replies
+
+
+class MicroBatcher(object):
+    '''
+    Collects scenarios from concurrent requests and evaluates them together
+    once max_batch have arrived or max_wait seconds have passed since the
+    first one. The model runs on a worker thread so the event loop keeps
+    accepting requests in the meantime.
+    '''
+
+    def __init__(self, max_batch=64, max_wait=0.002, stats=None):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = stats if stats is not None else LatencyStats()
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+    async def submit(self, scenario):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((scenario, future, time.perf_counter()))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(pending) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await
+                                   asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            scenarios = [scenario for scenario, _, _ in pending]
+            try:
+                replies = await loop.run_in_executor(None, evaluate, scenarios)
+            except Exception as error:
+                for _, future, _ in pending:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            end = time.perf_counter()
+            for (_, future, _), reply in zip(pending, replies):
+                if not future.done():
+                    future.set_result(reply)
+            self.stats.record_batch([end - start for _, _, start in pending])
+
+
+class TriageService(object):
+    '''
+    Newline delimited JSON over TCP, see the module docstring
+    '''
+
+    def __init__(self,
+                 host='127.0.0.1',
+                 port=8765,
+                 max_batch=64,
+                 max_wait=0.002):
+        self.host = host
+        self.port = port
+        self.stats = LatencyStats()
+        self.batcher = MicroBatcher(max_batch, max_wait, self.stats)
+        self.server = None
+
+    async def start(self):
+        self.batcher.start()
+        self.server = await asyncio.start_server(self.handle, self.host,
+                                                 self.port)
+        # Port 0 picks a free port
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.batcher.stop()
+
+    async def handle(self, reader, writer):
+        '''
+        Serve one connection. Requests on a connection are answered in
+        order, but are read ahead so a single client can pipeline them.
+        '''
+        replies = asyncio.Queue()
+        sender = asyncio.ensure_future(self.send(replies, writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    replies.put_nowait(asyncio.ensure_future(self.reply(line)))
+        finally:
+            replies.put_nowait(None)
+            await sender
+            writer.close()
+
+    async def send(self, replies, writer):
+        while True:
+            reply = await replies.get()
+            if reply is None:
+                return
+            writer.write(json.dumps(await reply).encode() + b'\n')
+            await writer.drain()
+
+    async def reply(self, line):
+        try:
+            request = json.loads(line)
+            if request.get('command') == 'stats':
+                return self.stats.summary()
+            return await self.batcher.submit(parse_scenario(request))
+        except Exception as error:
+            self.stats.errors += 1
+            return {'error': str(error)}
+
+
+async def query(scenarios, host='127.0.0.1', port=8765):
+    '''
+    Send scenarios over one connection and return the replies
+    '''
+    reader, writer = await asyncio.open_connection(host, port)
+    for scenario in scenarios:
+        writer.write(json.dumps(scenario).encode() + b'\n')
+    await writer.drain()
+    replies = [json.loads(await reader.readline()) for _ in scenarios]
+    writer.close()
+    return replies
+
+
+def random_scenarios(number, random_state=np.random):
+    scenarios = []
+    for _ in range(number):
+        scenarios.append({
+            'sex': int(random_state.randint(0, 2)),
+            'age': int(random_state.randint(30, 90)),
+            'RACE': float(random_state.randint(0, 10)),
+            'time_since_symptoms': random_state.uniform(10, 120),
+            'time_to_primary': random_state.uniform(10, 60),
+            'time_to_comprehensive': random_state.uniform(20, 120),
+            'transfer_time': random_state.uniform(10, 90)
+        })
+    return scenarios
+
+
+async def benchmark(clients=32, requests=2000, max_batch=64, max_wait=0.002):
+    '''
+    Start a service on a free localhost port and have clients concurrent
+    connections send requests scenarios between them, one at a time each.
+    Returns the service's stats.
+    '''
+    service = TriageService('127.0.0.1', 0, max_batch, max_wait)
+    await service.start()
+    scenarios = random_scenarios(requests, np.random.RandomState(0))
+
+    async def client(scenarios):
+        reader, writer = await asyncio.open_connection('127.0.0.1',
+                                                       service.port)
+        for scenario in scenarios:
+            writer.write(json.dumps(scenario).encode() + b'\n')
+            await writer.drain()
+            await reader.readline()
+        writer.close()
+
+    await asyncio.gather(
+        *[client(scenarios[i::clients]) for i in range(clients)])
+    summary = service.stats.summary()
+    await service.stop()
+    return summary
+
+
+async def serve(host, port, max_batch, max_wait):
+    service = TriageService(host, port, max_batch, max_wait)
+    await service.start()
+    print('Serving on', service.host, service.port)
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument('command', choices=['serve', 'bench'])
+    PARSER.add_argument('--host', default='127.0.0.1')
+    PARSER.add_argument('--port', type=int, default=8765)
+    PARSER.add_argument('--max-batch', type=int, default=64)
+    PARSER.add_argument('--max-wait',
+                        type=float,
+                        default=2,
+                        help='milliseconds to collect a batch for')
+    PARSER.add_argument('--clients', type=int, default=32)
+    PARSER.add_argument('--requests', type=int, default=2000)
+    ARGS = PARSER.parse_args()
+    constants.Costs.inflate(2016)
+    if ARGS.command == 'serve':
+        asyncio.run(
+            serve(ARGS.host, ARGS.port, ARGS.max_batch, ARGS.max_wait / 1000))
+    else:
+        print(
+            json.dumps(asyncio.run(
+                benchmark(ARGS.clients, ARGS.requests, ARGS.max_batch,
+                          ARGS.max_wait / 1000)),
+                       indent=2))
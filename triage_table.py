@@ -0,0 +1,371 @@
+'''
+Precomputed triage decisions. The deterministic model is tabulated once
+over a grid of patients and travel times and saved as memory-mapped .npy
+files, so answering a single patient (for the stroketransport website, for
+example) is a lookup instead of a full model run.
+
+    python triage_table.py build
+    python triage_table.py validate --points 1000
+
+The table is built for the first horizon and the ICER threshold in
+main.SETTINGS, with the default (non-random) times and LVO probability.
+'''
+
+import argparse
+import bisect
+import itertools
+import json
+import os
+import time
+import numpy as np
+import constants
+import main
+import tqdm
+
+DEFAULT_PATH = os.path.join('output', 'triage_table')
+
+# Grid values along each input variable, in the order of
+# main.INPUT_VARIABLES. Times are in minutes.
+GRID = {
+    'sex': [constants.Sex.MALE, constants.Sex.FEMALE],
+    'age': list(range(30, 95, 5)),
+    'RACE': list(range(0, 10)),
+    'time_since_symptoms': [10, 30, 60, 90, 120, 150, 180, 240, 300],
+    'time_to_primary': [5, 15, 30, 45, 60, 90, 120],
+    'time_to_comprehensive': [5, 15, 30, 45, 60, 90, 120, 180],
+    'transfer_time': [5, 15, 30, 45, 60, 90, 120, 180]
+}
+
+
+def build(path=DEFAULT_PATH, grid=GRID, chunk_size=20000):
+    '''
+    Run the model at every grid point and save the table to the path
+    directory: the optimal strategy (as an index into main.STRATEGIES),
+    whether the model was needed at all, and each strategy's cost and
+    QALYs (NaN where Drip and Ship isn't an option), along with a
+    table.json describing the grid.
+    '''
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    axes = [np.array(grid[name], dtype=float) for name in main.INPUT_VARIABLES]
+    shape = tuple(len(axis) for axis in axes)
+    strategies = len(main.STRATEGIES)
+
+    optimal = np.lib.format.open_memmap(os.path.join(path, 'optimal.npy'),
+                                        mode='w+',
+                                        dtype=np.uint8,
+                                        shape=shape)
+    necessary = np.lib.format.open_memmap(os.path.join(path, 'necessary.npy'),
+                                          mode='w+',
+                                          dtype=bool,
+                                          shape=shape)
+    costs = np.lib.format.open_memmap(os.path.join(path, 'costs.npy'),
+                                      mode='w+',
+                                      dtype=np.float32,
+                                      shape=shape + (strategies, ))
+    qalys = np.lib.format.open_memmap(os.path.join(path, 'qalys.npy'),
+                                      mode='w+',
+                                      dtype=np.float32,
+                                      shape=shape + (strategies, ))
+    flat = (optimal.reshape(-1), necessary.reshape(-1),
+            costs.reshape(-1, strategies), qalys.reshape(-1, strategies))
+
+    size = optimal.size
+    for start in tqdm.tqdm(range(0, size, chunk_size)):
+        indices = np.unravel_index(
+            np.arange(start, min(start + chunk_size, size)), shape)
+        arguments = {
+            name: axis[index]
+            for name, axis, index in zip(main.INPUT_VARIABLES, axes, indices)
+        }
+        arguments['sex'] = arguments['sex'].astype(int)
+        arguments['age'] = arguments['age'].astype(int)
+        results = main.run_model_batch(
+            main.get_context(arguments, False, False))
+        rows = slice(start, start + len(indices[0]))
+        flat[0][rows] = [
+            main.STRATEGIES.index(location)
+            for location in results['Optimal Location']
+        ]
+        flat[1][rows] = results['Model Is Necessary']
+        for i, strategy in enumerate(main.STRATEGIES):
+            flat[2][rows, i] = results['Costs'][strategy]
+            flat[3][rows, i] = results['QALYs'][strategy]
+    for array in (optimal, necessary, costs, qalys):
+        array.flush()
+
+    label, _ = main.get_horizons()[0]
+    description = {
+        'variables': main.INPUT_VARIABLES,
+        'grid': [axis.tolist() for axis in axes],
+        'strategies': main.STRATEGIES,
+        'horizon': label,
+        'ICER Threshold': main.SETTINGS['ICER Threshold']
+    }
+    with open(os.path.join(path, 'table.json'), 'w') as f:
+        json.dump(description, f, indent=2)
+
+
+class TriageTable(object):
+    '''
+    A table written by build, memory mapped so loading it is instant and
+    only the pages that are queried are ever read.
+    '''
+
+    def __init__(self, path=DEFAULT_PATH):
+        with open(os.path.join(path, 'table.json'), 'r') as f:
+            description = json.load(f)
+        self.variables = description['variables']
+        self.grid = description['grid']
+        self.strategies = description['strategies']
+        self.horizon = description['horizon']
+        self.icer_threshold = description['ICER Threshold']
+        # Plain array views of the memory maps index much faster
+        self.optimal = np.asarray(
+            np.load(os.path.join(path, 'optimal.npy'), mmap_mode='r'))
+        self.necessary = np.asarray(
+            np.load(os.path.join(path, 'necessary.npy'), mmap_mode='r'))
+        self.costs = np.asarray(
+            np.load(os.path.join(path, 'costs.npy'), mmap_mode='r'))
+        self.qalys = np.asarray(
+            np.load(os.path.join(path, 'qalys.npy'), mmap_mode='r'))
+        # Variables that get interpolated, and every corner of a grid cell
+        # along them
+        self.interpolated = [
+            i for i, name in enumerate(self.variables)
+            if name != 'sex' and len(self.grid[i]) > 1
+        ]
+        self.corners = np.array(
+            list(itertools.product([0, 1], repeat=len(self.interpolated)))).T
+        # Where each corner's factor of its weight is in the concatenation
+        # of 1 - fractions and fractions
+        self.corner_factors = (np.arange(len(self.interpolated))[:, None] +
+                               len(self.interpolated) * self.corners)
+        # Offset of every corner from the lower corner of its cell, in the
+        # flattened tables
+        self.strides = np.cumprod([1] + [len(values)
+                                         for values in self.grid][:0:-1])[::-1]
+        self.offsets = np.dot(self.strides[self.interpolated], self.corners)
+        self.flat_optimal = self.optimal.reshape(-1)
+        self.flat_necessary = self.necessary.reshape(-1)
+        self.flat_costs = self.costs.reshape(-1, len(self.strategies))
+        self.flat_qalys = self.qalys.reshape(-1, len(self.strategies))
+
+    def nearest_index(self, arguments):
+        '''
+        Grid index closest to the arguments along every variable
+        '''
+        index = []
+        for name, values in zip(self.variables, self.grid):
+            value = float(arguments[name])
+            i = bisect.bisect_left(values, value)
+            if i == len(values) or (i > 0 and value - values[i - 1]
+                                    <= values[i] - value):
+                i -= 1
+            index.append(i)
+        return tuple(index)
+
+    def location(self, arguments):
+        '''
+        Just the optimal location at the nearest grid point, the fastest
+        query there is
+        '''
+        return self.strategies[self.optimal[self.nearest_index(arguments)]]
+
+    def nearest(self, arguments):
+        '''
+        Results (in the same form as main.run_model) at the grid point
+        nearest to the arguments
+        '''
+        index = self.nearest_index(arguments)
+        return self.format_results(self.strategies[self.optimal[index]],
+                                   self.necessary[index], self.costs[index],
+                                   self.qalys[index])
+
+    def interpolate(self, arguments):
+        '''
+        Results with the costs and QALYs linearly interpolated between the
+        surrounding grid points (sex is always matched exactly). The
+        optimal location is the one the grid points vote for, each with its
+        interpolation weight, which agrees with run_model more often than
+        either the nearest grid point or recalculating it from the
+        interpolated values (0.94 against 0.93 over validate's random
+        points). It's several times slower than a nearest lookup though, as
+        it's a handful of small numpy operations over the 64 corners of a
+        cell, so use location or nearest where speed matters more.
+        Arguments outside the grid are clamped to its edges. When the
+        nearest grid point didn't need the model the RACE cutoff decides, as
+        it does in run_model, and only the grid points it decided vote.
+        '''
+        nearest = self.nearest_index(arguments)
+        lower = list(nearest)
+        fractions = []
+        for i in self.interpolated:
+            values = self.grid[i]
+            value = min(max(float(arguments[self.variables[i]]), values[0]),
+                        values[-1])
+            j = min(max(bisect.bisect_right(values, value) - 1, 0),
+                    len(values) - 2)
+            lower[i] = j
+            fractions.append((value - values[j]) / (values[j + 1] - values[j]))
+
+        # Weight of every corner of the surrounding cell, dropping the ones
+        # with none
+        fractions = np.array(fractions)
+        weights = np.concatenate(
+            (1 - fractions, fractions))[self.corner_factors].prod(axis=0)
+        used = weights > 0
+        index = np.dot(self.strides, lower) + self.offsets[used]
+        weights = weights[used]
+        optimal = self.flat_optimal[index]
+        if not self.necessary[nearest]:
+            cutoff = ~self.flat_necessary[index]
+            votes = np.bincount(optimal[cutoff],
+                                weights=weights[cutoff],
+                                minlength=len(self.strategies))
+            return self.format_results(self.strategies[int(np.argmax(votes))],
+                                       False, self.costs[nearest],
+                                       self.qalys[nearest])
+
+        votes = np.bincount(optimal,
+                            weights=weights,
+                            minlength=len(self.strategies))
+        location = self.strategies[int(np.argmax(votes))]
+        corner_costs = self.flat_costs[index]
+        corner_qalys = self.flat_qalys[index]
+        costs = np.dot(weights, corner_costs)
+        qalys = np.dot(weights, corner_qalys)
+        # A strategy that isn't an option everywhere in the cell (Drip and
+        # Ship) is interpolated over just the corners where it is, so
+        # whichever one wins the vote has values
+        for i in np.flatnonzero(np.isnan(costs)):
+            available = ~np.isnan(corner_costs[:, i])
+            if available.any():
+                total = weights[available].sum()
+                costs[i] = np.dot(weights[available], corner_costs[available,
+                                                                   i]) / total
+                qalys[i] = np.dot(weights[available], corner_qalys[available,
+                                                                   i]) / total
+        return self.format_results(location, True, costs, qalys)
+
+    def format_results(self, location, necessary, costs, qalys):
+        '''
+        Table values in the form of main.run_model's results
+        '''
+        results = {
+            'Optimal Location': location,
+            'Location with Maximum Benefit': 'Based on cutoff',
+            'Costs': {},
+            'QALYs': {}
+        }
+        # Plain floats are much quicker to work with one at a time
+        costs = np.asarray(costs, dtype=float).tolist()
+        qalys = np.asarray(qalys, dtype=float).tolist()
+        for strategy, cost, qaly in zip(self.strategies, costs, qalys):
+            if not necessary:
+                # Same as run_model when the RACE cutoff decides
+                missing = 'N/A' if strategy == 'Drip and Ship' else 0
+                results['Costs'][strategy] = missing
+                results['QALYs'][strategy] = missing
+            elif cost != cost:
+                results['Costs'][strategy] = 'N/A'
+                results['QALYs'][strategy] = 'N/A'
+            else:
+                results['Costs'][strategy] = cost
+                results['QALYs'][strategy] = qaly
+        if necessary:
+            available = [i for i, qaly in enumerate(qalys) if qaly == qaly]
+            best = max(available, key=lambda i: qalys[i])
+            results['Location with Maximum Benefit'] = self.strategies[best]
+        return results
+
+
+def random_points(grid, points, random_state=np.random):
+    '''
+    Argument sets drawn uniformly within the bounds of the grid
+    '''
+    sets = []
+    for _ in range(points):
+        arguments = {}
+        for name in main.INPUT_VARIABLES:
+            values = grid[name]
+            if name == 'sex':
+                arguments[name] = constants.Sex(random_state.randint(0, 2))
+            elif name == 'age':
+                arguments[name] = random_state.randint(values[0],
+                                                       values[-1] + 1)
+            else:
+                arguments[name] = random_state.uniform(values[0], values[-1])
+        sets.append(arguments)
+    return sets
+
+
+def validate(table, points=1000, random_state=np.random):
+    '''
+    Error of the table against main.run_model at random points between the
+    grid points. Returns, for nearest and interpolated lookups, how often
+    they agree on the optimal location and the mean and max relative error
+    of the costs and QALYs (where both the table and the model ran the
+    markov model for the strategy), along with the time per query in
+    microseconds.
+    '''
+    arguments = random_points(
+        {
+            name: values
+            for name, values in zip(table.variables, table.grid)
+        }, points, random_state)
+    truth = [
+        main.run_model(argument_set,
+                       context=main.get_context(argument_set, False, False))
+        for argument_set in arguments
+    ]
+    report = {'points': points}
+    for method in ('nearest', 'interpolate'):
+        lookup = getattr(table, method)
+        start = time.perf_counter()
+        answers = [lookup(argument_set) for argument_set in arguments]
+        elapsed = time.perf_counter() - start
+        agree = 0
+        errors = []
+        for answer, expected in zip(answers, truth):
+            agree += answer['Optimal Location'] == expected['Optimal Location']
+            if 'Based on cutoff' in (
+                    answer['Location with Maximum Benefit'],
+                    expected['Location with Maximum Benefit']):
+                continue
+            for measure in ('Costs', 'QALYs'):
+                for strategy in table.strategies:
+                    value = answer[measure][strategy]
+                    reference = expected[measure][strategy]
+                    if isinstance(value, str) or isinstance(reference, str):
+                        continue
+                    if reference != 0:
+                        errors.append(abs(value - reference) / abs(reference))
+        report[method] = {
+            'agreement': agree / points,
+            'mean relative error': float(np.mean(errors)) if errors else 0,
+            'max relative error': float(np.max(errors)) if errors else 0,
+            'microseconds per query': elapsed / points * 1e6
+        }
+    return report
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument('command', choices=['build', 'validate'])
+    PARSER.add_argument('--path', default=DEFAULT_PATH)
+    PARSER.add_argument('--points',
+                        type=int,
+                        default=1000,
+                        help='held out points to validate against')
+    PARSER.add_argument('--seed', type=int, default=None)
+    ARGS = PARSER.parse_args()
+    constants.Costs.inflate(2016)
+    if ARGS.command == 'build':
+        START = time.time()
+        build(ARGS.path)
+        print('Built table in', time.time() - START, 'seconds.')
+    else:
+        REPORT = validate(TriageTable(ARGS.path), ARGS.points,
+                          np.random.RandomState(ARGS.seed))
+        print(json.dumps(REPORT, indent=2))
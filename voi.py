@@ -0,0 +1,198 @@
+'''
+Expected value of perfect information (EVPI), and of partial perfect
+information (EVPPI) for each uncertain input, from the samples of a single
+probabilistic run. Instead of nested Monte Carlo, the EVPPI of an input
+comes from a regression metamodel: the incremental net benefit of each
+strategy is regressed on that input alone (a natural cubic spline), and
+the fitted values stand in for the conditional expectations
+(Strong, Oakley and Brennan 2014).
+
+Everything is in net monetary benefit per patient at the ICER threshold.
+'''
+
+import numpy as np
+
+# The sampled inputs, as (output label, where to find it in a model
+# context)
+PARAMETERS = [
+    ('Door to Needle Primary', 'door_needle_primary'),
+    ('Door to Needle Comprehensive', 'door_needle_comprehensive'),
+    ('Door to Groin', 'door_to_intra_arterial'),
+    ('LVO Probability', 'p_lvo'),
+]
+
+# Where a strategy isn't an option in a sample (shipping would miss the
+# EVT window) the patient stays where they are
+FALLBACK = {'Drip and Ship': 'Primary'}
+
+# Knots of the spline, fewer if the input has few distinct values
+SPLINE_KNOTS = 5
+
+
+def context_inputs(context, size=None):
+    '''
+    Values of each of PARAMETERS in a model context, as arrays of length
+    size (1 for an unbatched context)
+    '''
+    shape = (1 if size is None else size, )
+    inputs = []
+    for _, name in PARAMETERS:
+        if name == 'p_lvo':
+            value = context.p_lvo
+        else:
+            value = getattr(context.times, name)
+        inputs.append(np.broadcast_to(np.asarray(value, dtype=float), shape))
+    return np.stack(inputs, axis=1)
+
+
+class PSASamples(object):
+    '''
+    Keeps the sampled inputs and the net benefit of every strategy for each
+    evaluation of a probabilistic run, to fit the EVPPI metamodels to at the
+    end. Evaluations decided by the RACE cutoff (no treatment option) give
+    every strategy the same net benefit, zero, since the model doesn't tell
+    them apart there.
+    '''
+
+    def __init__(self, strategies):
+        self.strategies = strategies
+        self.inputs = []
+        self.net_benefits = []
+
+    def add(self, results, context):
+        '''
+        Store a single run_model evaluation and the context it was run with
+        '''
+        net_benefit = np.zeros((1, len(self.strategies)))
+        if results['Location with Maximum Benefit'] != 'Based on cutoff':
+            values = {}
+            for strategy in self.strategies:
+                cost = results['Costs'][strategy]
+                if isinstance(cost, str):
+                    values[strategy] = values[FALLBACK[strategy]]
+                    continue
+                values[strategy] = (
+                    context.icer_threshold * results['QALYs'][strategy] - cost)
+            net_benefit[0] = [values[s] for s in self.strategies]
+        self.inputs.append(context_inputs(context))
+        self.net_benefits.append(net_benefit)
+
+    def add_batch(self, results, context):
+        '''
+        Store a run_model_batch evaluation and the context it was run with
+        '''
+        size = np.asarray(results['Optimal Location']).size
+        values = {}
+        for strategy in self.strategies:
+            net_benefit = (context.icer_threshold *
+                           np.asarray(results['QALYs'][strategy]) -
+                           np.asarray(results['Costs'][strategy]))
+            if strategy in FALLBACK:
+                net_benefit = np.where(np.isnan(net_benefit),
+                                       values[FALLBACK[strategy]], net_benefit)
+            values[strategy] = net_benefit
+        net_benefit = np.stack([values[s] for s in self.strategies], axis=1)
+        modelled = np.broadcast_to(results['Model Is Necessary'], (size, ))
+        net_benefit[~modelled] = 0
+        self.inputs.append(context_inputs(context, size))
+        self.net_benefits.append(net_benefit)
+
+    def arrays(self):
+        '''
+        (evaluations, parameters) inputs and (evaluations, strategies) net
+        benefits
+        '''
+        if not self.inputs:
+            return (np.empty(
+                (0, len(PARAMETERS))), np.empty((0, len(self.strategies))))
+        return (np.concatenate(self.inputs), np.concatenate(self.net_benefits))
+
+    def evpi(self):
+        return evpi(self.arrays()[1])
+
+    def evppi(self):
+        '''
+        EVPPI of each of PARAMETERS, NaN for any that didn't vary
+        '''
+        inputs, net_benefits = self.arrays()
+        return [
+            evppi(inputs[:, i], net_benefits) for i in range(len(PARAMETERS))
+        ]
+
+    def values(self):
+        '''
+        EVPI and then the EVPPI of each parameter, in the order of
+        value_names, with 'N/A' where they couldn't be estimated
+        '''
+        values = [self.evpi()] + self.evppi()
+        return ['N/A' if np.isnan(value) else value for value in values]
+
+    @staticmethod
+    def value_names(prefix=''):
+        return [f'{prefix}EVPI'
+                ] + [f'{prefix}EVPPI {label}' for label, _ in PARAMETERS]
+
+
+def evpi(net_benefits):
+    '''
+    Expected value of perfect information from (evaluations, strategies)
+    net benefits: the mean of the best net benefit in each evaluation less
+    the best mean net benefit
+    '''
+    if len(net_benefits) == 0:
+        return np.nan
+    return max(
+        np.mean(np.max(net_benefits, axis=1)) -
+        np.max(np.mean(net_benefits, axis=0)), 0.0)
+
+
+def spline_basis(x, knots):
+    '''
+    Natural cubic spline basis (linear beyond the outer knots) in x, with
+    an intercept column; see Hastie, Tibshirani and Friedman eq. 5.4
+    '''
+
+    def d(k):
+        return ((np.maximum(x - knots[k], 0)**3 -
+                 np.maximum(x - knots[-1], 0)**3) / (knots[-1] - knots[k]))
+
+    columns = [np.ones_like(x), x]
+    for k in range(len(knots) - 2):
+        columns.append(d(k) - d(len(knots) - 2))
+    return np.stack(columns, axis=1)
+
+
+def fitted_net_benefits(x, net_benefits, knots=SPLINE_KNOTS):
+    '''
+    Regression estimate of the expected net benefit of each strategy given
+    x, at every sample. The net benefits relative to the first strategy are
+    what gets regressed, which removes most of the noise they share.
+    '''
+    unique = np.unique(x)
+    quantiles = np.linspace(0, 1, min(knots, len(unique)))
+    knots = np.unique(np.quantile(x, quantiles))
+    # Standardise so the cubic terms don't swamp the fit
+    centre, scale = x.mean(), x.std()
+    x = (x - centre) / scale
+    knots = (knots - centre) / scale
+    if len(knots) < 3:
+        basis = np.stack([np.ones_like(x), x], axis=1)
+    else:
+        basis = spline_basis(x, knots)
+    incremental = net_benefits - net_benefits[:, :1]
+    coefficients = np.linalg.lstsq(basis, incremental, rcond=None)[0]
+    return basis @ coefficients
+
+
+def evppi(x, net_benefits):
+    '''
+    Expected value of partial perfect information about x (one value per
+    evaluation) from (evaluations, strategies) net benefits, NaN if x never
+    varied. Capped at the EVPI, which it can only exceed through noise in
+    the metamodel.
+    '''
+    if len(x) < 2 or np.all(x == x[0]):
+        return np.nan
+    fitted = fitted_net_benefits(x, net_benefits)
+    value = (np.mean(np.max(fitted, axis=1)) - np.max(np.mean(fitted, axis=0)))
+    return min(max(value, 0.0), evpi(net_benefits))